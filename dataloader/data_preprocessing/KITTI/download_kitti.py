@@ -12,6 +12,7 @@ sys.path.append("../../../")
 import dataloader.file_io.get_path as gp
 import dataloader.file_io.dir_lister as dl
 from dataloader.data_preprocessing.KITTI.kitti_utils import pcl_to_depth_map
+from dataloader.file_io.calibration_cache import CalibrationCache
 
 
 def download_kitti_all(kitti_folder='kitti_download'):
@@ -243,6 +244,8 @@ def generate_depth_from_velo(kitti_folder='kitti_download'):
     assert os.path.isdir(gt_path), 'Path to data does not exist'
     folders = dl.DirLister.get_directories(gt_path)
     folders = dl.DirLister.include_dirs_by_name(folders, 'velodyne_points')
+    # all drives of one day share the calibration files, so they are parsed only once
+    calibration_cache = CalibrationCache()
     for f in folders:
         base_dir = os.path.split(f)[0]
         base_dir = os.path.split(base_dir)[0]
@@ -263,8 +266,8 @@ def generate_depth_from_velo(kitti_folder='kitti_download'):
             filename_img = filename[:-3] + 'png'
             im_size_2 = cv2.imread(os.path.join(image_dir_2, filename_img)).shape[:2]
             im_size_3 = cv2.imread(os.path.join(image_dir_3, filename_img)).shape[:2]
-            depth_2 = pcl_to_depth_map(calib_dir, file, im_size_2, 2)
-            depth_3 = pcl_to_depth_map(calib_dir, file, im_size_3, 3)
+            depth_2 = pcl_to_depth_map(calib_dir, file, im_size_2, 2, calibration_cache=calibration_cache)
+            depth_3 = pcl_to_depth_map(calib_dir, file, im_size_3, 3, calibration_cache=calibration_cache)
             depth_2 = (depth_2 * 256).astype(np.uint16)
             depth_3 = (depth_3 * 256).astype(np.uint16)
 
@@ -1,24 +1,20 @@
-import os
 import numpy as np
 import cv2
 from collections import Counter
 
+from dataloader.file_io.calibration_cache import CalibrationCache, read_calib_file
+
+# read_calib_file has moved to dataloader/file_io/calibration_cache.py and is re-exported for existing imports
+__all__ = ['read_calib_file', 'pcl_to_depth_map', 'load_velodyne_points', 'sub2ind', 'read_depth']
 
 """adapted from https://github.com/nianticlabs/monodepth2 """
 
-def pcl_to_depth_map(calib_dir, velo_file_name, im_shape, cam=2, vel_depth=False):
+def pcl_to_depth_map(calib_dir, velo_file_name, im_shape, cam=2, vel_depth=False, calibration_cache=None):
     #vel_depth should be False as Eigen computed the results relative to velo
-    # load calibration files
-    cam2cam = read_calib_file(os.path.join(calib_dir, 'calib_cam_to_cam.txt'))
-    velo2cam = read_calib_file(os.path.join(calib_dir, 'calib_velo_to_cam.txt'))
-    velo2cam = np.hstack((velo2cam['R'].reshape(3, 3), velo2cam['T'][..., np.newaxis]))
-    velo2cam = np.vstack((velo2cam, np.array([0, 0, 0, 1.0])))
-
-    # compute projection matrix velodyne->image plane
-    R_cam2rect = np.eye(4)
-    R_cam2rect[:3, :3] = cam2cam['R_rect_00'].reshape(3, 3)
-    P_rect = cam2cam['P_rect_0' + str(cam)].reshape(3, 4)
-    P_velo2im = np.dot(np.dot(P_rect, R_cam2rect), velo2cam)
+    # load calibration files, a calibration_cache that is shared between calls parses them only once per drive
+    if calibration_cache is None:
+        calibration_cache = CalibrationCache()
+    P_velo2im = calibration_cache.velo_to_image(calib_dir, cam)
 
     # load velodyne points and remove all behind image plane (approximation)
     # each row of the velodyne data is forward, left, up, reflectance
@@ -42,7 +38,7 @@ def pcl_to_depth_map(calib_dir, velo_file_name, im_shape, cam=2, vel_depth=False
 
     # project to image
     depth = np.zeros((im_shape))
-    depth[velo_pts_im[:, 1].astype(np.int), velo_pts_im[:, 0].astype(np.int)] = velo_pts_im[:, 2]
+    depth[velo_pts_im[:, 1].astype(np.int64), velo_pts_im[:, 0].astype(np.int64)] = velo_pts_im[:, 2]
 
     #find the duplicate points and choose the closest depth
     inds = sub2ind(depth.shape, velo_pts_im[:, 1], velo_pts_im[:, 0])
@@ -57,27 +53,6 @@ def pcl_to_depth_map(calib_dir, velo_file_name, im_shape, cam=2, vel_depth=False
     return depth
 
 
-"""adapted from https://github.com/hunse/kitti"""
-
-def read_calib_file(path):
-    float_chars = set("0123456789.e+- ")
-    data = {}
-    with open(path, 'r') as f:
-        for line in f.readlines():
-            key, value = line.split(':', 1)
-            value = value.strip()
-            data[key] = value
-            if float_chars.issuperset(value):
-                # try to cast to float array
-                try:
-                    data[key] = np.array(list(map(float, value.split(' '))))
-                except ValueError:
-                    # casting error: data[key] already eq. value, so pass
-                    pass
-
-    return data
-
-
 """adapted from https://github.com/hunse/kitti"""
 
 def load_velodyne_points(file_name):
@@ -96,10 +71,10 @@ def sub2ind(matrixSize, rowSub, colSub):
 """self written"""
 
 def read_depth(filename, factor=256.):
-    depth_png = np.array(cv2.imread(filename, -1)).astype(np.float)
+    depth_png = np.array(cv2.imread(filename, -1)).astype(np.float64)
     # make sure we have a proper 16bit depth map here.. not 8bit!
     assert(np.max(depth_png) > 255)
 
-    depth = depth_png.astype(np.float) / factor
+    depth = depth_png.astype(np.float64) / factor
     depth[depth_png == 0] = 0
     return depth
@@ -5,10 +5,13 @@ import sys
 
 sys.path.append('../../../')
 import dataloader.file_io.get_path as gp
+from dataloader.file_io.calibration_cache import CalibrationCache
 
 disp_names = ['disp_noc_0', 'disp_noc_1', 'disp_occ_0', 'disp_occ_1']
 depth_names = ['depth_noc_0', 'depth_noc_1', 'depth_occ_0', 'depth_occ_1']
 line_numbers = [20, 28, 20, 28]
+# the calibration files are shared by all disparity types, so every file is parsed only once
+calibration_cache = CalibrationCache()
 for disp_name, depth_name, line_number in zip(disp_names, depth_names, line_numbers):
     path_getter = gp.GetPath()
     data_path = path_getter.get_data_path()
@@ -23,9 +26,9 @@ for disp_name, depth_name, line_number in zip(disp_names, depth_names, line_numb
     for image_file, cam_file in zip(file_list_im, file_list_cam):
         im_file = os.path.join(disp_path, image_file)
         cam_file = os.path.join(calib_path, cam_file)
-        disp = cv2.imread(im_file, -1).astype(np.float)/256.
-        cam_matrix = open(cam_file).readlines()[:line_number][-1][6:].split()
-        foc_length = (float(cam_matrix[0]) + float(cam_matrix[4]))/2.0
+        disp = cv2.imread(im_file, -1).astype(np.float64)/256.
+        cam_matrix = calibration_cache.camera_intrinsics(cam_file, line_number)
+        foc_length = (cam_matrix[0, 0] + cam_matrix[1, 1])/2.0
         depth = 0.54*foc_length/(disp + 0.00000000001)
         depth[disp == 0] = 0
         depth = (depth*256).astype(np.uint16)
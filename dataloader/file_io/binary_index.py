@@ -0,0 +1,253 @@
+import os
+import argparse
+import json
+import hashlib
+
+import numpy as np
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
+
+BINARY_SUFFIX = '.idx'
+FORMAT_VERSION = 1
+# Entries of the index files that contain one list per name. All other entries are stored as json.
+COLUMN_KEYS = ('folders', 'files', 'positions', 'numerical_values')
+SEPARATOR = '\0'
+# Numerical columns are stored as unique rows plus row ids if they have at most this fraction of unique rows, e.g. the
+# camera intrinsics, which are the same for all frames of a drive
+MAX_UNIQUE_FRACTION = 0.25
+
+
+def get_binary_path(json_path):
+    """
+    Returns the path of the binary index that belongs to a json index, e.g. basic_files.json -> basic_files.idx
+
+    :param json_path: path of the json file
+    """
+    return os.path.splitext(json_path)[0] + BINARY_SUFFIX
+
+
+def _split_path(path):
+    """Splits a path after its last separator into the directory prefix (including the separator) and the suffix"""
+    position = max(path.rfind('/'), path.rfind('\\')) + 1
+    return path[:position], path[position:]
+
+
+def _encode_texts(texts):
+    """Encodes a list of strings as a uint8 array"""
+    return np.frombuffer(SEPARATOR.join(texts).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_texts(array):
+    """Decodes a uint8 array that has been created by _encode_texts"""
+    if array.size == 0:
+        return ['']
+    return array.tobytes().decode('utf-8').split(SEPARATOR)
+
+
+def _get_id(dictionary, text):
+    """Returns the id of a text in a dictionary {text: id} and adds the text if necessary"""
+    text_id = dictionary.get(text)
+    if text_id is None:
+        text_id = len(dictionary)
+        dictionary[text] = text_id
+    return text_id
+
+
+def _to_typed_array(column):
+    """
+    Converts a list of numbers or of equally shaped nested lists of numbers into an integer or float array. Returns
+    None if the list is ragged or if it mixes integers and floats, since the types would not survive a round trip.
+    """
+    try:
+        items = np.asarray(column, dtype=object)
+        array = np.asarray(column)
+    except ValueError:
+        return None
+    if items.shape != array.shape:
+        return None
+    if array.dtype.kind == 'f' and all(isinstance(item, float) for item in items.ravel()):
+        return array.astype(np.float64)
+    if array.dtype.kind in 'iu' and all(not isinstance(item, bool) for item in items.ravel()):
+        if array.size > 0 and np.iinfo(np.int32).min <= array.min() and array.max() <= np.iinfo(np.int32).max:
+            return array.astype(np.int32)
+        return array.astype(np.int64)
+    return None
+
+
+def _add_array(arrays, digests, references, name, array):
+    """Adds an array to the arrays that are written, or a reference if an identical array has already been added"""
+    digest = (array.dtype.str, array.shape, hashlib.sha1(np.ascontiguousarray(array).tobytes()).hexdigest())
+    if digest in digests:
+        references[name] = digests[digest]
+    else:
+        digests[digest] = name
+        arrays[name] = array
+
+
+def dump_index(path, json_dict):
+    """
+    Writes a dictionary in the format of the basic_files.json or a split file as binary index. Every path is stored as
+    a pair of ids into a dictionary of directory prefixes and a dictionary of file name suffixes. Positions and
+    rectangular numerical values are stored as typed arrays, numerical values with few distinct rows as unique rows
+    plus row ids. Identical columns, e.g. the positions of the camera intrinsics and of the color images, are stored
+    only once. All other entries are stored as json.
+
+    :param path: path of the binary index
+    :param json_dict: dictionary in the format of the json index files
+    """
+    prefixes = {}
+    suffixes = {}
+    arrays = {}
+    digests = {}
+    references = {}
+    header = {'version': FORMAT_VERSION, 'keys': list(json_dict.keys()), 'plain': {}, 'columns': {},
+              'references': references}
+    for key, value in json_dict.items():
+        if key not in COLUMN_KEYS:
+            header['plain'][key] = value
+            continue
+        kinds = []
+        for i, column in enumerate(value):
+            name = '{}_{}'.format(key, i)
+            if column is None:
+                kinds.append('none')
+            elif all(isinstance(item, str) or item is None for item in column):
+                ids = np.full((len(column), 2), -1, dtype=np.int32)
+                for j, item in enumerate(column):
+                    if item is not None:
+                        prefix, suffix = _split_path(item)
+                        ids[j] = _get_id(prefixes, prefix), _get_id(suffixes, suffix)
+                _add_array(arrays, digests, references, name, ids)
+                kinds.append('strings')
+            else:
+                array = _to_typed_array(column)
+                if array is not None and array.ndim > 1 and len(array) > 0:
+                    values, inverse = np.unique(array, axis=0, return_inverse=True)
+                    if len(values) <= MAX_UNIQUE_FRACTION * len(array):
+                        _add_array(arrays, digests, references, name, inverse.reshape(-1).astype(np.int32))
+                        _add_array(arrays, digests, references, name + '_values', values)
+                        kinds.append('indexed')
+                        continue
+                if array is not None:
+                    _add_array(arrays, digests, references, name, array)
+                    kinds.append('array')
+                else:
+                    arrays[name] = _encode_texts([json.dumps(column)])
+                    kinds.append('json')
+        header['columns'][key] = kinds
+
+    arrays['header'] = _encode_texts([json.dumps(header)])
+    arrays['prefixes'] = _encode_texts(list(prefixes.keys()))
+    arrays['suffixes'] = _encode_texts(list(suffixes.keys()))
+    pm.write_atomic(path, lambda fp: np.savez(fp, **arrays), binary=True)
+
+
+def load_binary_index(path):
+    """
+    Reads a binary index that has been written by dump_index
+
+    :param path: path of the binary index
+    :return: dictionary in the format of the json index files. Identical columns and identical rows of numerical
+        values share their list objects, so the returned lists must not be modified in place.
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        header = json.loads(_decode_texts(arrays['header'])[0])
+        if header['version'] != FORMAT_VERSION:
+            raise Exception('The binary index {} has the unsupported version {}'.format(path, header['version']))
+        prefixes = _decode_texts(arrays['prefixes']) + [None]
+        suffixes = _decode_texts(arrays['suffixes']) + [None]
+        references = header['references']
+        # columns that are stored only once are decoded only once, identical columns share one list
+        decoded = {}
+
+        def decode(name, kind):
+            stored_name = references.get(name, name)
+            if (stored_name, kind) not in decoded:
+                if kind == 'strings':
+                    column = [prefixes[prefix] + suffixes[suffix] if prefix >= 0 else None
+                              for prefix, suffix in arrays[stored_name].tolist()]
+                elif kind == 'rows':
+                    column = arrays[stored_name].tolist()
+                else:
+                    values = decode(name + '_values', 'rows')
+                    column = [values[row] for row in arrays[stored_name].tolist()]
+                decoded[(stored_name, kind)] = column
+            return decoded[(stored_name, kind)]
+
+        json_dict = {}
+        for key in header['keys']:
+            if key not in header['columns']:
+                json_dict[key] = header['plain'][key]
+                continue
+            columns = []
+            for i, kind in enumerate(header['columns'][key]):
+                name = '{}_{}'.format(key, i)
+                if kind == 'none':
+                    columns.append(None)
+                elif kind == 'array':
+                    columns.append(decode(name, 'rows'))
+                elif kind == 'json':
+                    columns.append(json.loads(_decode_texts(arrays[name])[0]))
+                else:
+                    columns.append(decode(name, kind))
+            json_dict[key] = columns
+    return json_dict
+
+
+def index_exists(json_path):
+    """
+    Returns True if the json index or its binary counterpart exists
+
+    :param json_path: path of the json file, e.g. <dataset>/basic_files.json
+    """
+    return os.path.isfile(json_path) or os.path.isfile(get_binary_path(json_path))
+
+
+def load_index(json_path):
+    """
+    Reads an index file. If there is a binary index that is at least as recent as the json file, the binary index is
+    read instead of the json file.
+
+    :param json_path: path of the json file, e.g. <dataset>/basic_files.json or <dataset>_<split>/train.json
+    :return: dictionary in the format of the json index files
+    """
+    binary_path = get_binary_path(json_path)
+    if os.path.isfile(binary_path) and \
+            (not os.path.isfile(json_path) or os.path.getmtime(binary_path) >= os.path.getmtime(json_path)):
+        return load_binary_index(binary_path)
+    with open(json_path) as fp:
+        return json.load(fp)
+
+
+def convert_folder(folder):
+    """
+    Writes a binary index for every json index file in a folder, i.e. for the basic_files.json and the split files
+
+    :param folder: dataset folder or split folder
+    :return: list of the paths of the binary index files
+    """
+    binary_paths = []
+    for filename in sorted(os.listdir(folder)):
+        json_path = os.path.join(folder, filename)
+        if not filename.endswith('.json') or not os.path.isfile(json_path):
+            continue
+        with open(json_path) as fp:
+            json_dict = json.load(fp)
+        if not isinstance(json_dict, dict) or 'names' not in json_dict or 'files' not in json_dict:
+            continue
+        dump_index(get_binary_path(json_path), json_dict)
+        binary_paths.append(get_binary_path(json_path))
+    return binary_paths
+
+
+if __name__ == '__main__':
+    # Creates binary index files for the index files of a dataset or a split folder, e.g.
+    #   python binary_index.py kitti
+    #   python binary_index.py kitti_eigen_split
+    parser = argparse.ArgumentParser(description='Creates binary index files for the index files of a folder')
+    parser.add_argument('folder', help='name of the dataset or split folder in the data path')
+    options = parser.parse_args()
+    folder = os.path.join(gp.GetPath().get_data_path(), options.folder)
+    for binary_path in convert_folder(folder):
+        print('{}: {:.1f} MB'.format(binary_path, os.path.getsize(binary_path) / 1e6))
@@ -0,0 +1,96 @@
+import os
+import numpy as np
+
+CAM_TO_CAM_FILENAME = 'calib_cam_to_cam.txt'
+VELO_TO_CAM_FILENAME = 'calib_velo_to_cam.txt'
+# Lines of a calib_cam_to_cam.txt that contain the intrinsic matrices K_02 and K_03 of the left and the right color
+# camera. The KITTI index reads the matrices by their line number.
+INTRINSICS_LINES = {2: 20, 3: 28}
+
+
+def read_calib_file(path):
+    """Reads a KITTI calibration file into a dictionary. Values that consist of numbers are converted to float arrays.
+
+    adapted from https://github.com/hunse/kitti
+
+    :param path: path of the calibration file
+    """
+    float_chars = set("0123456789.e+- ")
+    data = {}
+    with open(path, 'r') as f:
+        for line in f.readlines():
+            key, value = line.split(':', 1)
+            value = value.strip()
+            data[key] = value
+            if float_chars.issuperset(value):
+                # try to cast to float array
+                try:
+                    data[key] = np.array(list(map(float, value.split(' '))))
+                except ValueError:
+                    # casting error: data[key] already eq. value, so pass
+                    pass
+
+    return data
+
+
+class CalibrationCache(object):
+    """Parses every calibration file only once and keeps the resulting matrices. All frames of a KITTI drive share the
+    calibration files of their date folder, so a cache that is used for a whole dataset only parses a few dozen files
+    instead of one file per frame. The returned arrays are shared between all callers and must not be modified.
+    """
+    def __init__(self):
+        self.lines = {}
+        self.calibrations = {}
+        self.intrinsics = {}
+        self.projections = {}
+
+    def read_lines(self, path):
+        """Returns the lines of a calibration file
+
+        :param path: path of the calibration file
+        """
+        if path not in self.lines:
+            with open(path) as f:
+                self.lines[path] = f.readlines()
+        return self.lines[path]
+
+    def read(self, path):
+        """Returns the content of a calibration file as parsed by read_calib_file
+
+        :param path: path of the calibration file
+        """
+        if path not in self.calibrations:
+            self.calibrations[path] = read_calib_file(path)
+        return self.calibrations[path]
+
+    def camera_intrinsics(self, path, line_number):
+        """Returns the 4x4 intrinsic matrix whose 3x3 entries are stored in a line of the form 'K_02: k11 k12 ... k33'
+
+        :param path: path of the calibration file
+        :param line_number: number of the line, starting with 1
+        """
+        if (path, line_number) not in self.intrinsics:
+            values = self.read_lines(path)[:line_number][-1][6:].split()
+            matrix = np.eye(4)
+            matrix[:3, :3] = np.array([float(v) for v in values]).reshape((3, 3))
+            self.intrinsics[(path, line_number)] = matrix
+        return self.intrinsics[(path, line_number)]
+
+    def velo_to_image(self, calib_dir, cam=2):
+        """Returns the 3x4 matrix that projects homogeneous velodyne points onto the image plane of a camera
+
+        :param calib_dir: folder that contains the calib_cam_to_cam.txt and the calib_velo_to_cam.txt of a drive
+        :param cam: number of the camera, 2 for the left and 3 for the right color camera
+        """
+        if (calib_dir, cam) not in self.projections:
+            cam2cam = self.read(os.path.join(calib_dir, CAM_TO_CAM_FILENAME))
+            velo2cam = self.read(os.path.join(calib_dir, VELO_TO_CAM_FILENAME))
+            velo2cam = np.hstack((velo2cam['R'].reshape(3, 3), velo2cam['T'][..., np.newaxis]))
+            velo2cam = np.vstack((velo2cam, np.array([0, 0, 0, 1.0])))
+
+            # compute projection matrix velodyne->image plane
+            R_cam2rect = np.eye(4)
+            R_cam2rect[:3, :3] = cam2cam['R_rect_00'].reshape(3, 3)
+            P_rect = cam2cam['P_rect_0' + str(cam)].reshape(3, 4)
+            self.projections[(calib_dir, cam)] = np.dot(np.dot(P_rect, R_cam2rect), velo2cam)
+        return self.projections[(calib_dir, cam)]
@@ -0,0 +1,276 @@
+import os
+import argparse
+import json
+from multiprocessing import Pool
+
+import cv2
+import torchvision.transforms as transforms
+import numpy as np
+
+cv2.setNumThreads(0)
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
+import dataloader.pt_data_loader.mytransforms as mytransforms
+import dataloader.pt_data_loader.dataset_parameterset as dps
+
+NUM_WORKERS = 4
+GRID_SIZE = (8, 16)
+INDEX_SUFFIX = '_classes.npz'
+IGNORE_ID = 255
+
+
+def index_mask(args):
+    """
+    Computes the class statistics of one segmentation mask.
+
+    :param args: tuple (filepath, labels, labels_mode, num_classes, grid_size)
+    :return: - pixel count of every class as an array of shape (num_classes,)
+             - bit-packed occupancy grid of every class as an array of shape (num_classes, ceil(grid cells / 8)). A bit
+               is set if the class occurs in the respective cell of a grid_size grid that is laid over the image
+    """
+    filepath, labels, labels_mode, num_classes, grid_size = args
+    image = cv2.imread(filepath, -1)
+    assert image is not None, 'Segmentation mask {} could not be read'.format(filepath)
+
+    load_transforms = transforms.Compose([
+        mytransforms.LoadSegmentation(),
+        mytransforms.ConvertSegmentation(labels=labels, labels_mode=labels_mode)
+    ])
+    sample = load_transforms({('segmentation', 0, 0): image})
+    mask = np.array(sample[('segmentation', 0, 0)], dtype=np.int64)
+    if mask.ndim == 3:
+        mask = mask[..., 0]
+    # Masks that are not converted (e.g. labels_mode 'fromtrainid' with 16 bit images) may contain any value, every
+    # value that is no class is ignored
+    mask = np.where((mask >= 0) & (mask < num_classes), mask, IGNORE_ID)
+
+    counts = np.bincount(mask.ravel(), minlength=IGNORE_ID + 1)[:num_classes]
+
+    # Assign every pixel to its grid cell and count the (class, cell) combinations in one pass
+    grid_h, grid_w = grid_size
+    height, width = mask.shape
+    cell_y = np.arange(height) * grid_h // height
+    cell_x = np.arange(width) * grid_w // width
+    cells = cell_y[:, None] * grid_w + cell_x[None, :]
+    combined = mask * (grid_h * grid_w) + cells
+    presence = np.bincount(combined.ravel(), minlength=(IGNORE_ID + 1) * grid_h * grid_w)
+    presence = presence.reshape(IGNORE_ID + 1, grid_h * grid_w)[:num_classes] > 0
+
+    return counts.astype(np.uint32), np.packbits(presence, axis=1)
+
+
+def get_index_path(dataset, split=None, trainvaltest_split='train'):
+    """
+    Returns the path of the class index that belongs to a split file, e.g. <dataset>_<split>/train_classes.npz
+
+    :param dataset: name of the dataset
+    :param split: name of the split. If None, the split files in the dataset folder itself are used
+    :param trainvaltest_split: can be train, validation or test
+    """
+    path_getter = gp.GetPath()
+    dataset_folder = path_getter.get_data_path()
+    if split is None:
+        split_path = os.path.join(dataset_folder, dataset)
+    else:
+        split_path = os.path.join(dataset_folder, dataset + '_' + split)
+    return os.path.join(split_path, trainvaltest_split + INDEX_SUFFIX)
+
+
+def load_split_files(dataset, split=None, trainvaltest_split='train', segmentation_key='segmentation'):
+    """
+    Returns the list of segmentation files of a split in the order of the json file
+
+    :param dataset: name of the dataset
+    :param split: name of the split. If None, the split files in the dataset folder itself are used
+    :param trainvaltest_split: can be train, validation or test
+    :param segmentation_key: name of the segmentation entry in the json file
+    """
+    json_path = get_index_path(dataset, split, trainvaltest_split)[:-len(INDEX_SUFFIX)] + '.json'
+    assert os.path.isfile(json_path), 'There is no split file {}'.format(json_path)
+    with open(json_path) as fd:
+        json_data = json.load(fd)
+    assert segmentation_key in json_data['names'], \
+        'There is no entry {} in the split file {}'.format(segmentation_key, json_path)
+    return json_data['files'][json_data['names'].index(segmentation_key)]
+
+
+class ClassIndexer(object):
+    """
+    Creates a class index for a split file. For every segmentation mask in the split, the pixel count of every class
+    and a coarse occupancy grid that tells in which regions of the image the class occurs are stored. The index is
+    saved as a compact binary file next to the json file of the split, e.g. train.json -> train_classes.npz.
+    """
+    def __init__(self, dataset, split=None, labels=None, labels_mode=None, segmentation_key='segmentation',
+                 grid_size=GRID_SIZE, num_workers=NUM_WORKERS):
+        """
+        :param dataset: name of the dataset
+        :param split: name of the split. If None, the split files in the dataset folder itself are indexed
+        :param labels: labels from the definitions file. Default: the labels from the parameters.json of the dataset
+        :param labels_mode: mode by which to read the labels file. Default: the one from the parameters.json
+        :param segmentation_key: name of the segmentation entry in the json file
+        :param grid_size: (height, width) of the grid for which the class occurrence is stored
+        :param num_workers: number of processes that decode the masks
+        """
+        if labels is None or labels_mode is None:
+            parameters = dps.DatasetParameterset(dataset)
+            if labels is None:
+                labels = parameters.labels
+            if labels_mode is None:
+                labels_mode = parameters.labels_mode
+        assert labels is not None, 'There are no labels defined for the dataset {}'.format(dataset)
+        self.dataset = dataset
+        self.split = split
+        self.labels = labels
+        self.labels_mode = labels_mode
+        self.segmentation_key = segmentation_key
+        self.grid_size = tuple(grid_size)
+        self.num_workers = num_workers
+        self.num_classes = max(l.trainId for l in labels if 0 <= l.trainId < IGNORE_ID) + 1
+
+        path_getter = gp.GetPath()
+        self.dataset_path = os.path.join(path_getter.get_data_path(), dataset)
+
+    def process(self, trainvaltest_splits=('train',)):
+        """
+        Creates the class index for every given split file
+
+        :param trainvaltest_splits: tuple containing 'train', 'validation' and/or 'test'
+        :return: list of the paths of the created index files
+        """
+        index_paths = []
+        for trainvaltest_split in trainvaltest_splits:
+            files = load_split_files(self.dataset, self.split, trainvaltest_split, self.segmentation_key)
+            args = [(os.path.join(self.dataset_path, filename.replace('/', os.sep).replace('\\', os.sep)),
+                     self.labels, self.labels_mode, self.num_classes, self.grid_size) for filename in files]
+            print('Indexing {} masks of the {} split'.format(len(files), trainvaltest_split))
+
+            counts = np.zeros((len(files), self.num_classes), dtype=np.uint32)
+            regions = np.zeros((len(files), self.num_classes, (self.grid_size[0] * self.grid_size[1] + 7) // 8),
+                               dtype=np.uint8)
+            with Pool(self.num_workers) as pool:
+                results = pool.imap(index_mask, args, chunksize=16)
+                for i, (file_counts, file_regions) in enumerate(pm.print_progress(results)):
+                    counts[i] = file_counts
+                    regions[i] = file_regions
+            print('')
+
+            index_path = get_index_path(self.dataset, self.split, trainvaltest_split)
+            pm.write_atomic(index_path, lambda fd: np.savez(fd, counts=counts, regions=regions,
+                                                            grid_size=np.array(self.grid_size, dtype=np.int32)),
+                            binary=True)
+            index_paths.append(index_path)
+        return index_paths
+
+
+class ClassIndex(object):
+    """
+    Read access to a class index that has been created by the ClassIndexer. No segmentation mask is decoded, all
+    information is read from the index file.
+    """
+    def __init__(self, dataset, split=None, trainvaltest_split='train', segmentation_key='segmentation'):
+        """
+        :param dataset: name of the dataset
+        :param split: name of the split. If None, the index in the dataset folder itself is used
+        :param trainvaltest_split: can be train, validation or test
+        :param segmentation_key: name of the segmentation entry in the json file that has been indexed
+        """
+        index_path = get_index_path(dataset, split, trainvaltest_split)
+        assert os.path.isfile(index_path), 'There is no class index {}. Please create it using the ClassIndexer in ' \
+                                           'dataloader/file_io/class_indexer.py'.format(index_path)
+        with np.load(index_path) as index:
+            self.counts = index['counts']
+            self.regions = index['regions']
+            self.grid_size = tuple(int(size) for size in index['grid_size'])
+        self.num_classes = self.counts.shape[1]
+
+        files = load_split_files(dataset, split, trainvaltest_split, segmentation_key)
+        if len(files) != self.counts.shape[0]:
+            raise Exception('The class index {} does not match the split file anymore. Please create it again'
+                            .format(index_path))
+        self.rows = {filename: row for row, filename in enumerate(files)}
+
+    def rows_for_files(self, files):
+        """
+        Returns the rows of the index that belong to the given segmentation files
+
+        :param files: list of segmentation file paths as stored in the json file
+        """
+        missing = [filename for filename in files if filename not in self.rows]
+        if missing:
+            raise Exception('{} files, e.g. {}, are not part of the class index'.format(len(missing), missing[0]))
+        return np.array([self.rows[filename] for filename in files], dtype=np.int64)
+
+    def presence(self, min_pixels=1):
+        """
+        Returns a boolean array of shape (number of images, number of classes) that tells which class is present in
+        which image
+
+        :param min_pixels: minimum number of pixels of a class in an image to count as present
+        """
+        return self.counts >= min_pixels
+
+    def class_repeat_factors(self, threshold=0.1, min_pixels=1):
+        """
+        Returns a repeat factor max(1, sqrt(threshold / f)) for every class, where f is the fraction of the images that
+        contain the class. Classes that occur in more than threshold of all images are not oversampled.
+
+        :param threshold: image frequency below which a class is oversampled
+        :param min_pixels: minimum number of pixels of a class in an image to count as present
+        """
+        frequency = self.presence(min_pixels).mean(axis=0)
+        with np.errstate(divide='ignore'):
+            factors = np.sqrt(threshold / frequency)
+        factors[frequency == 0] = 1.0
+        return np.maximum(1.0, factors)
+
+    def image_repeat_factors(self, threshold=0.1, min_pixels=1):
+        """
+        Returns a repeat factor for every image, which is the maximum repeat factor of the classes in the image
+
+        :param threshold: image frequency below which a class is oversampled
+        :param min_pixels: minimum number of pixels of a class in an image to count as present
+        """
+        presence = self.presence(min_pixels)
+        factors = np.where(presence, self.class_repeat_factors(threshold, min_pixels)[None, :], 1.0)
+        return factors.max(axis=1)
+
+    def cells(self, row, class_id):
+        """
+        Returns the grid cells of an image in which a class occurs as an array of (cell_y, cell_x) pairs
+
+        :param row: row of the image in the index
+        :param class_id: train id of the class
+        """
+        grid_h, grid_w = self.grid_size
+        presence = np.unpackbits(self.regions[row, class_id])[:grid_h * grid_w]
+        cells = np.flatnonzero(presence)
+        return np.stack((cells // grid_w, cells % grid_w), axis=1)
+
+    def bounding_region(self, row, class_id):
+        """
+        Returns the coarse bounding box (top, left, bottom, right) of a class in an image, given in relative image
+        coordinates between 0 and 1. If the class does not occur in the image, None is returned.
+
+        :param row: row of the image in the index
+        :param class_id: train id of the class
+        """
+        cells = self.cells(row, class_id)
+        if len(cells) == 0:
+            return None
+        grid_h, grid_w = self.grid_size
+        return (float(cells[:, 0].min() / grid_h), float(cells[:, 1].min() / grid_w),
+                float((cells[:, 0].max() + 1) / grid_h), float((cells[:, 1].max() + 1) / grid_w))
+
+
+if __name__ == '__main__':
+    # Creates the class index of the train split of a dataset, e.g.
+    #   python class_indexer.py cityscapes
+    parser = argparse.ArgumentParser(description='Creates the class index of the train split of a dataset')
+    parser.add_argument('dataset', help='name of the dataset')
+    parser.add_argument('split', nargs='?', default=None, help='name of the split, default: the split files in the '
+                                                               'dataset folder')
+    options = parser.parse_args()
+    indexer = ClassIndexer(options.dataset, options.split)
+    for path in indexer.process(('train',)):
+        print('Class index written to {}'.format(path))
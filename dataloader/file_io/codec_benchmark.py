@@ -0,0 +1,148 @@
+import os
+import argparse
+import json
+import time
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.image_codecs as ic
+
+NUM_SAMPLES = 20
+REPEATS = 3
+CODECS = ('png:9', 'png:1', 'webp', 'npy', 'zstd:1', 'zstd:3', 'jpeg:95', 'jpeg:85')
+# Size of the synthetic images, which have the resolution of Cityscapes
+SYNTHETIC_SIZE = (1024, 2048)
+
+
+def create_synthetic_images(num_samples, size=SYNTHETIC_SIZE):
+    """
+    Creates images that roughly behave like camera images and depth maps when they are compressed: smooth gradients
+    with noise for color and sparse 16 bit values for depth
+
+    :param num_samples: number of images per name
+    :param size: (height, width) of the images
+    :return: dictionary {'color': list of images, 'depth': list of images}
+    """
+    rnd = np.random.RandomState(0)
+    height, width = size
+    y, x = np.mgrid[0:height, 0:width]
+    images = {'color': [], 'depth': []}
+    for i in range(num_samples):
+        gradient = np.stack((x * 255 // width, y * 255 // height, (x + y + 40 * i) % 256), 2)
+        color = np.clip(gradient + rnd.normal(0, 4, gradient.shape), 0, 255).astype(np.uint8)
+        images['color'].append(cv2.GaussianBlur(color, (3, 3), 0))
+        depth = ((y + 1) * 60 + rnd.randint(0, 256, (height, width))).astype(np.uint16)
+        depth[rnd.random_sample((height, width)) > 0.05] = 0
+        images['depth'].append(depth)
+    return images
+
+
+def load_dataset_images(dataset, name, num_samples):
+    """
+    Loads images of a dataset that are evenly distributed over the basic_files.json
+
+    :param dataset: name of the dataset
+    :param name: name of the entry, e.g. 'color'
+    :param num_samples: number of images
+    :return: list of images as returned by cv2.imread(path, -1)
+    """
+    dataset_path = os.path.join(gp.GetPath().get_data_path(), dataset)
+    with open(os.path.join(dataset_path, 'basic_files.json')) as fd:
+        json_data = json.load(fd)
+    files = json_data['files'][json_data['names'].index(name)]
+    step = max(1, len(files) // num_samples)
+    return [ic.read_image(os.path.join(dataset_path, file.replace('/', os.sep).replace('\\', os.sep)))
+            for file in files[::step][:num_samples]]
+
+
+def benchmark_codec(images, spec, path, repeats=REPEATS):
+    """
+    Writes images with a codec and measures how fast they are read again
+
+    :param images: list of images as returned by cv2.imread(path, -1)
+    :param spec: codec with an optional parameter, see image_codecs.parse_codec
+    :param path: empty folder for the encoded files
+    :param repeats: the decoding time is the best of this number of runs
+    :return: dictionary with the mean file size in bytes, the mean encoding and decoding time per image in seconds
+        and whether the decoded images are exactly the original ones. If the images cannot be stored with the codec,
+        the dictionary only contains the 'error'.
+    """
+    codec, parameter = ic.parse_codec(spec)
+    paths = [os.path.join(path, '{}{}'.format(i, ic.CODEC_ENDINGS[codec])) for i in range(len(images))]
+    try:
+        start = time.perf_counter()
+        encoded = [ic.encode_image(image, codec, parameter) for image in images]
+        encode_time = time.perf_counter() - start
+    except Exception as e:
+        return {'error': str(e)}
+    for file_path, data in zip(paths, encoded):
+        with open(file_path, 'wb') as fp:
+            fp.write(data)
+
+    decode_time = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        decoded = [ic.read_image(file_path) for file_path in paths]
+        duration = time.perf_counter() - start
+        decode_time = duration if decode_time is None else min(decode_time, duration)
+    exact = all(image.dtype == result.dtype and np.array_equal(image, result) for image, result in zip(images, decoded))
+    return {'size': sum(len(data) for data in encoded) / len(images), 'encode_time': encode_time / len(images),
+            'decode_time': decode_time / len(images), 'exact': exact}
+
+
+def benchmark(images, codecs=CODECS, repeats=REPEATS):
+    """
+    Measures every codec on the same images
+
+    :param images: list of images as returned by cv2.imread(path, -1)
+    :param codecs: list of codecs, see image_codecs.parse_codec
+    :param repeats: the decoding time is the best of this number of runs
+    :return: dictionary {codec: result of benchmark_codec}
+    """
+    results = {}
+    for spec in codecs:
+        path = tempfile.mkdtemp()
+        try:
+            results[spec] = benchmark_codec(images, spec, path, repeats)
+        finally:
+            shutil.rmtree(path)
+    return results
+
+
+def print_results(name, images, results):
+    print('')
+    print('{}: {} images of shape {} and dtype {}'.format(name, len(images), images[0].shape, images[0].dtype))
+    print('{:>10} {:>12} {:>14} {:>14} {:>10} {:>8}'.format('codec', 'size [KB]', 'encode [ms]', 'decode [ms]',
+                                                            'images/s', 'exact'))
+    for spec, result in results.items():
+        if 'error' in result:
+            print('{:>10}   unsupported: {}'.format(spec, result['error']))
+            continue
+        print('{:>10} {:>12.1f} {:>14.2f} {:>14.2f} {:>10.1f} {:>8}'.format(
+            spec, result['size'] / 1024, result['encode_time'] * 1e3, result['decode_time'] * 1e3,
+            1 / result['decode_time'], str(result['exact'])))
+
+
+if __name__ == '__main__':
+    # Measures the file size and the decoding speed of every codec on images of a dataset, e.g.
+    #   python codec_benchmark.py cityscapes color segmentation --samples=20
+    # Without a dataset, synthetic color images and depth maps of the size of Cityscapes are used. The images are read
+    # from files in a temporary folder, i.e. from the page cache, so the time of a slow disk or network file system
+    # has to be estimated from the file size.
+    parser = argparse.ArgumentParser(description='Compares the file size and the decoding speed of image codecs')
+    parser.add_argument('dataset', nargs='?', default=None, help='name of the dataset, default: synthetic images')
+    parser.add_argument('names', nargs='*', help='names of the images that are measured, e.g. color')
+    parser.add_argument('--samples', type=int, default=NUM_SAMPLES, help='number of images per name')
+    parser.add_argument('--codecs', type=lambda codecs: codecs.split(','), default=CODECS,
+                        help='comma separated codecs that are compared, e.g. png:1,webp,zstd:3')
+    options = parser.parse_args()
+    if options.dataset is not None:
+        images = {name: load_dataset_images(options.dataset, name, options.samples) for name in options.names}
+    else:
+        images = create_synthetic_images(options.samples)
+    for name, name_images in images.items():
+        print_results(name, name_images, benchmark(name_images, options.codecs))
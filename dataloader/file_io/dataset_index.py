@@ -1,9 +1,9 @@
 import os
 import sys
 import numpy as np
-import json
 
 import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
 
 """
 The following paramters have to be present in every dataset definition:
@@ -225,8 +225,7 @@ def create_parameter_files(datasets=None):
         dataset_path = os.path.join(data_path, dataset)
         if os.path.isdir(dataset_path):
             dump_location = os.path.join(dataset_path, 'parameters.json')
-            with open(dump_location, 'w') as fp:
-                json.dump(param, fp)
+            pm.write_json_atomic(dump_location, param)
             print("{}: OK".format(dataset))
         else:
             print("{}: not found".format(dataset))
@@ -12,10 +12,13 @@ import numpy as np
 cv2.setNumThreads(0)
 
 import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
+import dataloader.file_io.position_index as pi
 import dataloader.pt_data_loader.mytransforms as mytransforms
 import dataloader.pt_data_loader.dataset_parameterset as dps
 
-NUM_WORKERS = 4
+# Every worker decodes, scales and writes whole samples, so the work is bound by the CPUs and the disk
+NUM_WORKERS = os.cpu_count() or 1
 IMAGE_KEYS = ('color', 'depth', 'segmentation')
 SPLIT_NAMES = ('train', 'validation', 'test')
 CAMERA_KEYS = ('camera_intrinsics', 'camera_intrinsics_right')
@@ -58,7 +61,7 @@ def load_sample(si):
         mytransforms.LoadRGB(),
         mytransforms.LoadSegmentation(),
         mytransforms.LoadDepth(),
-        mytransforms.LoadNumerics()
+        mytransforms.LoadNumerics(dtype='float64')   # keeps the camera intrinsics in the json files exact
     ])
 
     new_sample = load_transforms(new_sample)
@@ -95,6 +98,62 @@ def save_image_file(image, img_type, dataset, path):
     cv2.imwrite(path, image)
 
 
+def scale_sample(args):
+    """
+    Loads one sample and saves it in one or several sizes. All image work is done in the worker process, only the
+    scaled camera intrinsics are returned.
+
+    :param args: tuple (si, levels, proof, pyramid) with
+        - si: tuple (global_index, sample) as passed to load_sample
+        - levels: list of tuples (new_path, output_size, scale_factor), one for every scaled dataset. output_size is
+          the target size (h, w) or None if the dimensions are divided by scale_factor instead
+        - proof: 'size' or 'hash', the kind of proof that is returned for the written files
+        - pyramid: if True, every level is scaled from the next larger level instead of from the original sample
+    :return: - the global index of the sample in the dataset
+             - list with one tuple per level, in the order of levels, containing
+                - dictionary {camera_key: scaled camera matrix as a nested list}
+                - dictionary {path relative to new_path: proof} of the written files, see progress_manifest.get_proof
+    """
+    si, levels, proof, pyramid = args
+    dataset = si[1]['dataset']
+    set_idx, sample, paths = load_sample(si)
+    width, height = sample[('color', 0, 0)].size
+
+    output_sizes = []
+    for _, output_size, scale_factor in levels:
+        if output_size is None:
+            output_size = (
+                int(height / scale_factor),
+                int(width / scale_factor)
+            )
+        output_sizes.append(output_size)
+    order = list(range(len(levels)))
+    if pyramid:
+        # from the largest to the smallest size, which is only known once the size of the sample is known
+        order.sort(key=lambda i: -output_sizes[i][0] * output_sizes[i][1])
+
+    results = [None] * len(levels)
+    source = sample
+    for i in order:
+        new_path = levels[i][0]
+        resizer = mytransforms.Resize(output_size=output_sizes[i])
+        # Resize replaces the entries of the sample, so a shallow copy keeps the source intact
+        scaled_sample = resizer(dict(source))
+
+        camera_intrinsics = {}
+        for key in scaled_sample:
+            if key in paths:
+                new_filepath = os.path.join(new_path, paths[key])
+                os.makedirs(os.path.split(new_filepath)[0], exist_ok=True)
+                save_image_file(scaled_sample[key], key[0], dataset, new_filepath)
+            elif key[0] in CAMERA_KEYS:
+                camera_intrinsics[key[0]] = scaled_sample[key].tolist()
+        results[i] = (camera_intrinsics, pm.get_proofs(new_path, paths.values(), proof))
+        if pyramid:
+            source = scaled_sample
+    return set_idx, results
+
+
 def get_index_from_position(position_array, pos_0):
     """
     Returns the index of the position tuple with first entry pos_0 in the pos_array
@@ -110,8 +169,14 @@ def get_index_from_position(position_array, pos_0):
 
 
 class DatasetScaler(object):
-    def __init__(self, dataset, split=None):
+    def __init__(self, dataset, split=None, num_workers=NUM_WORKERS):
+        """
+        :param dataset: name of the dataset that is scaled
+        :param split: name of the split whose json files are adapted, None for the split files in the dataset folder
+        :param num_workers: number of processes that load, scale and save the samples. Default: one per CPU
+        """
         self.dataset = dataset
+        self.num_workers = num_workers
         self.dataset_path = self._gen_dataset_path(dataset)
         if split is not None:
             self.split_path = self.dataset_path + '_' + split
@@ -169,20 +234,11 @@ class DatasetScaler(object):
 
         return samples
 
-    def _get_samples(self, pool, keys_to_convert):
+    def _get_samples(self, keys_to_convert):
         json_path = os.path.join(self.dataset_path, 'basic_files.json')
         samples = self._parse_json_file(json_path, keys_to_convert)
 
-        return pool.imap_unordered(load_sample, samples.items())
-
-    def _print_progress(self, iterator):
-        for i, elem in enumerate(iterator):
-            if i % 100 == 0:
-                print('', flush=True)
-
-            print('.', end='')
-
-            yield elem
+        return samples.items()
 
     def _load_split_data(self, split_path=None):
         """
@@ -205,19 +261,6 @@ class DatasetScaler(object):
                 print('No {} data accessible'.format(split))
         return split_data
 
-    def _get_index_from_position(self, position_array, pos_0):
-        """
-        Returns the index of the position tuple with first entry pos_0 in the pos_array
-
-        :param position_array: An array built out of 4-tuples in the standard positions format.
-        :param pos_0: Global position index (first entry of the 4-tuple) to search for
-        :return: index of the tuple in pos_array that begins with pos_0. If none is found, None is returned.
-        """
-        for i, position in zip(range(len(position_array)), position_array):
-            if position[0] == pos_0:
-                return i
-        return None
-
     def _adapt_camera_intrinsics_in_split_file(self, split_data_dict, camera_intrinsics):
         """
         Writes the given camera intrinsics into the given split data dictionary. Automatically searches for the right
@@ -228,16 +271,8 @@ class DatasetScaler(object):
         :return: split_data_dict with modified camera_intrinsics
         """
         for split, split_data in split_data_dict.items():
-            names = split_data['names']
-            positions = split_data['positions']
-
-            for set_idx in camera_intrinsics:
-                for camera_key in camera_intrinsics[set_idx]:
-                    camera_index = names.index(camera_key)
-                    split_index = self._get_index_from_position(positions[camera_index], set_idx)
-                    if split_index is None:
-                        continue
-                    split_data['files'][camera_index][split_index] = camera_intrinsics[set_idx][camera_key]
+            position_index = pi.PositionIndex(split_data)
+            split_data_dict[split] = position_index.update_values(split_data, 'files', camera_intrinsics)
 
         return split_data_dict
 
@@ -264,109 +299,127 @@ class DatasetScaler(object):
 
             split_data_dict = self._adapt_camera_intrinsics_in_split_file(split_data_dict, camera_intrinsics)
             for split, split_data in split_data_dict.items():
-                with open(os.path.join(scaled_split_path, split + '.json'), 'w') as fd:
-                    json.dump(split_data, fd)
+                pm.write_json_atomic(os.path.join(scaled_split_path, split + '.json'), split_data)
 
-    def process(self, new_dataset_name, output_size=None, scale_factor=None, keys_to_convert=(), splits_to_adapt=None):
+    def _write_json_files(self, new_path, camera_intrinsics, splits_to_adapt):
         """
-        Scales every image in the dataset and saves them in the specified output folder. Also creates new json files
-        with adapted camera intrinsics. One can define either a scale factor or a desired output size.
+        Writes the basic_files.json, the split files and the parameters.json of a scaled dataset
 
-        :param new_dataset_name: name of the desired output folder. It is forbidden to use an existing folder
-        :param output_size: target output size as a 2-tuple (h, w)
-        :param scale_factor: Both dimensions gets scaled by this factor
-        :param keys_to_convert: A tuple of keys, only the images behind these keys will be converted (optional)
-        :param splits_to_adapt: Splits in seperate folders that will also be copied into a new folder and have their
-            camera parameters adapted (optional)
+        :param new_path: path of the scaled dataset
+        :param camera_intrinsics: dict of camera intrinsics of the scaled dataset, see _adapt_splits
+        :param splits_to_adapt: Splits in seperate folders that will also be copied into a new folder
         """
-
-        assert self.dataset != new_dataset_name
-
-        new_path = self._gen_dataset_path(new_dataset_name)
-        assert not os.path.isdir(new_path), 'You are not allowed to write into an existing dataset folder!'
-        if scale_factor is not None:
-            assert output_size is None
-            assert isinstance(scale_factor, int)
-
-            scale_mode = 'relative'
-
-        elif output_size is not None:
-            assert scale_factor is None
-            assert isinstance(output_size, tuple)
-
-            scale_mode = 'absolute'
-
-            resizer = mytransforms.Resize(output_size=output_size)
-        if type(splits_to_adapt) == str:
-            splits_to_adapt = (splits_to_adapt,)
-
-        camera_intrinsics = {}
-        pending_writes = []
-
-        # Scale and save the images
-        with Pool(processes=NUM_WORKERS) as pool_rd, Pool(processes=NUM_WORKERS) as pool_wr:
-            for set_idx, sample, paths in self._print_progress(self._get_samples(pool_rd, keys_to_convert)):
-                if scale_mode == 'relative':
-                    width, height = sample[('color', 0, 0)].size
-                    new_size = (
-                        int(height / scale_factor),
-                        int(width / scale_factor)
-                    )
-                    resizer = mytransforms.Resize(output_size=new_size)
-                sample = resizer(sample)
-
-                for key in sample:
-                    if key in paths:
-                        image = sample[key]
-                        new_filepath = os.path.join(new_path, paths[key])
-                        os.makedirs(os.path.split(new_filepath)[0], exist_ok=True)
-                        args = (image, key[0], self.dataset, new_filepath)
-                        job = pool_wr.apply_async(save_image_file, args)
-                        pending_writes.append(job)
-                    elif key[0] in CAMERA_KEYS:
-                        if set_idx not in camera_intrinsics:
-                            camera_intrinsics[set_idx] = {}
-                        camera_intrinsics[set_idx][key[0]] = sample[key].tolist()
-                # Limit the number of pending write operations
-                # by waiting for old ones to complete
-                while len(pending_writes) > NUM_WORKERS:
-                    pending_writes.pop(0).get()
-
-            while pending_writes:
-                pending_writes.pop(0).get()
-
         # Modify the json data and safe the new json files
         with open(os.path.join(self.dataset_path, 'basic_files.json')) as fd:
             basic_json_data = json.load(fd)
-        names = basic_json_data['names']
-        positions = basic_json_data['positions']
-        for set_idx in camera_intrinsics:
-            for camera_key in camera_intrinsics[set_idx]:
-                camera_index = names.index(camera_key)
-                basic_index = self._get_index_from_position(positions[camera_index], set_idx)
-                basic_json_data['numerical_values'][camera_index][basic_index] = camera_intrinsics[set_idx][camera_key]
+        position_index = pi.PositionIndex(basic_json_data)
+        basic_json_data = position_index.update_values(basic_json_data, 'numerical_values', camera_intrinsics)
 
-        with open(os.path.join(new_path, 'basic_files.json'), 'w') as fd:
-            json.dump(basic_json_data, fd)
+        pm.write_json_atomic(os.path.join(new_path, 'basic_files.json'), basic_json_data)
 
         # Modify the train, val, test.json, if present
         split_data_dict = self._load_split_data()
         split_data_dict = self._adapt_camera_intrinsics_in_split_file(split_data_dict, camera_intrinsics)
         for split, split_data in split_data_dict.items():
-            with open(os.path.join(new_path, split + '.json'), 'w') as fd:
-                json.dump(split_data, fd)
+            pm.write_json_atomic(os.path.join(new_path, split + '.json'), split_data)
 
         # Copy the parameters.json into the new path, adapt the split list
         with open(os.path.join(self.dataset_path, 'parameters.json')) as fd:
             parameters = json.load(fd)
         parameters['splits'] = splits_to_adapt
-        with open(os.path.join(new_path, 'parameters.json'), 'w') as fd:
-            json.dump(parameters, fd)
+        pm.write_json_atomic(os.path.join(new_path, 'parameters.json'), parameters)
 
         # If there are any separate split folders given, adapt them too.
         if splits_to_adapt is not None:
             self._adapt_splits(splits_to_adapt, new_path, camera_intrinsics)
 
+    def process(self, new_dataset_name, output_size=None, scale_factor=None, keys_to_convert=(), splits_to_adapt=None,
+                proof='size', pyramid=False):
+        """
+        Scales every image in the dataset and saves them in the specified output folder. Also creates new json files
+        with adapted camera intrinsics. One can define either a scale factor or a desired output size.
+
+        Several scaled versions of the dataset can be created in one run by passing a tuple of names together with a
+        tuple of output sizes or scale factors, e.g. process(('kitti_scaled_2', 'kitti_scaled_4'), scale_factor=(2, 4)).
+        Every image is then loaded only once and saved in all sizes.
+
+        Every scaled sample is recorded in a progress manifest in the output folder. If a run is interrupted, calling
+        process again with the same parameters only scales the samples that have not been completed. The json files
+        are written once all samples are done, then the manifest is removed.
+
+        :param new_dataset_name: name of the desired output folder or tuple of names. It is forbidden to use an
+            existing folder, unless it contains the progress manifest of an interrupted run
+        :param output_size: target output size as a 2-tuple (h, w), or a tuple of those if several names are given
+        :param scale_factor: Both dimensions gets scaled by this factor, or a tuple of factors if several names are
+            given
+        :param keys_to_convert: A tuple of keys, only the images behind these keys will be converted (optional)
+        :param splits_to_adapt: Splits in seperate folders that will also be copied into a new folder and have their
+            camera parameters adapted (optional)
+        :param proof: 'size' or 'hash'. A sample of an interrupted run counts as completed if its files still have the
+            recorded size or sha1 hash.
+        :param pyramid: if True, every size is scaled from the next larger size instead of from the original image,
+            which is faster for several sizes. The images then differ slightly from the ones of separate runs.
+        """
+        if isinstance(new_dataset_name, str):
+            new_dataset_names = (new_dataset_name,)
+            output_sizes = (output_size,)
+            scale_factors = (scale_factor,)
+        else:
+            new_dataset_names = tuple(new_dataset_name)
+            output_sizes = (None,) * len(new_dataset_names) if output_size is None else tuple(output_size)
+            scale_factors = (None,) * len(new_dataset_names) if scale_factor is None else tuple(scale_factor)
+            assert len(output_sizes) == len(new_dataset_names) and len(scale_factors) == len(new_dataset_names), \
+                'One output size or scale factor has to be given for every new dataset name'
+        if type(splits_to_adapt) == str:
+            splits_to_adapt = (splits_to_adapt,)
+
+        levels = []
+        for name, size, factor in zip(new_dataset_names, output_sizes, scale_factors):
+            assert self.dataset != name
+
+            new_path = self._gen_dataset_path(name)
+            assert not os.path.isdir(new_path) or os.path.isfile(os.path.join(new_path, pm.MANIFEST_FILENAME)), \
+                'You are not allowed to write into an existing dataset folder!'
+            if factor is not None:
+                assert size is None
+                assert isinstance(factor, int)
+
+            elif size is not None:
+                assert factor is None
+                assert isinstance(size, tuple)
+            levels.append((new_path, size, factor))
+
+        manifests = []
+        camera_intrinsics = []
+        completed = None
+        for new_path, size, factor in levels:
+            task = {'tool': 'DatasetScaler', 'dataset': self.dataset, 'output_size': size, 'scale_factor': factor,
+                    'keys_to_convert': keys_to_convert, 'pyramid': pyramid}
+            manifest = pm.ProgressManifest(os.path.join(new_path, pm.MANIFEST_FILENAME), task, proof)
+            level_completed = manifest.completed_items(new_path)
+            if level_completed:
+                print('Resuming: {} samples have already been scaled for {}'.format(len(level_completed), new_path))
+            manifests.append(manifest)
+            camera_intrinsics.append({set_idx: data for set_idx, data in level_completed.items() if data})
+            completed = set(level_completed) if completed is None else completed.intersection(level_completed)
+
+        # Scale and save the images. Every worker loads, scales and saves whole samples, so no image is sent between
+        # the processes. Samples that are missing in any size are scaled again for all sizes.
+        args = [(si, levels, proof, pyramid) for si in self._get_samples(keys_to_convert) if si[0] not in completed]
+        with Pool(processes=max(1, self.num_workers)) as pool:
+            results = pool.imap_unordered(scale_sample, args, chunksize=4)
+            for set_idx, level_results in pm.print_progress(results):
+                for manifest, level_intrinsics, (sample_intrinsics, files) in \
+                        zip(manifests, camera_intrinsics, level_results):
+                    if sample_intrinsics:
+                        level_intrinsics[set_idx] = sample_intrinsics
+                    manifest.add(set_idx, files, sample_intrinsics)
+
+        for (new_path, _, _), manifest, level_intrinsics in zip(levels, manifests, camera_intrinsics):
+            self._write_json_files(new_path, level_intrinsics, splits_to_adapt)
+            # The scaled dataset is complete
+            manifest.remove()
+
     def adapt_splits(self, scaled_dataset_name, split_names):
         """
         Adapts the json files from the given splits to an already scaled dataset. This means that a new split folder
@@ -397,8 +450,7 @@ class DatasetScaler(object):
         if parameters['splits'] is None:
             parameters['splits'] = []
         parameters['splits'].extend(split_names)
-        with open(os.path.join(scaled_path, 'parameters.json'), 'w') as fd:
-            json.dump(parameters, fd)
+        pm.write_json_atomic(os.path.join(scaled_path, 'parameters.json'), parameters)
 
         self._adapt_splits(split_names, scaled_path, camera_intrinsics)
 
@@ -407,6 +459,8 @@ if __name__ == '__main__':
     # To create a scaled, version of an existing dataset, execute something like
     #   scaler = DatasetScaler('unscaled_dataset')
     #   scaler.process('scaled_dataset', scale_factor=2)
+    # Several sizes are created in one run with e.g.
+    #   scaler.process(('scaled_dataset_2', 'scaled_dataset_4'), scale_factor=(2, 4))
     # To adapt split folders to this dataset, use the paramter splits_to adapt. If splits shall be adapted to an
     # existing scaled dataset, execute something like
     #   scaler = DatasetScaler('unscaled_dataset')
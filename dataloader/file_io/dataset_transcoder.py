@@ -0,0 +1,225 @@
+import os
+import argparse
+import json
+import shutil
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+cv2.setNumThreads(0)
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
+import dataloader.file_io.image_codecs as ic
+
+# Every worker reads, encodes and writes whole files, so the work is bound by the CPUs and the disk
+NUM_WORKERS = os.cpu_count() or 1
+SPLIT_NAMES = ('train', 'validation', 'test')
+# Lossy codecs change the pixel values, so they may only be used for the images of these names
+LOSSY_NAMES = ('color',)
+
+
+def link_file(source_path, target_path):
+    """Creates a hard link of a file, or a copy if the file system does not support hard links"""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+
+def transcode_file(args):
+    """
+    Reads one file and writes it with another codec in a worker process
+
+    :param args: tuple (dataset_path, new_path, file, new_file, codec, parameter, check, proof) with
+        - dataset_path: path of the original dataset
+        - new_path: path of the transcoded dataset
+        - file: path of the original file relative to dataset_path
+        - new_file: path of the new file relative to new_path
+        - codec: name of the codec, see image_codecs.CODEC_ENDINGS. If None, the file is linked into the new dataset.
+        - parameter: parameter of the codec, see image_codecs.encode_image
+        - check: if True, the encoded image is decoded again and compared with the original one for lossless codecs
+        - proof: 'size' or 'hash', the kind of proof that is returned for the written file
+    :return: new_file and the proof of the written file, see progress_manifest.get_proof
+    """
+    dataset_path, new_path, file, new_file, codec, parameter, check, proof = args
+    source_path = os.path.join(dataset_path, file.replace('/', os.sep).replace('\\', os.sep))
+    target_path = os.path.join(new_path, new_file.replace('/', os.sep).replace('\\', os.sep))
+    os.makedirs(os.path.split(target_path)[0], exist_ok=True)
+    if codec is None:
+        link_file(source_path, target_path)
+        return new_file, pm.get_proof(target_path, proof)
+
+    image = ic.read_image(source_path)
+    if image is None:
+        raise Exception('The image {} cannot be read'.format(source_path))
+    data = ic.encode_image(image, codec, parameter)
+    if check and codec in ic.LOSSLESS_CODECS:
+        decoded = ic.decode_image(data, ic.CODEC_ENDINGS[codec])
+        if decoded is None or decoded.dtype != image.dtype or not np.array_equal(decoded, image):
+            raise Exception('The image {} is changed by the codec {}'.format(source_path, codec))
+    with open(target_path, 'wb') as fp:
+        fp.write(data)
+    return new_file, pm.get_proof(target_path, proof)
+
+
+class DatasetTranscoder(object):
+    """
+    Creates a copy of a dataset in which the images of selected names are stored with a codec that is faster to decode,
+    e.g. lossless webp or npy instead of png. The files of all other names are hard linked into the new dataset, so it
+    does not need any additional space for them. The json files are copied with the new file paths and types, so the
+    new dataset is loaded exactly like the original one.
+
+    The decoding speed and the size of every codec can be compared with codec_benchmark.py before a dataset is
+    transcoded.
+    """
+    def __init__(self, dataset, num_workers=NUM_WORKERS):
+        """
+        :param dataset: name of the dataset that is transcoded
+        :param num_workers: number of processes that transcode the files. Default: one per CPU
+        """
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.dataset_path = self._gen_dataset_path(dataset)
+
+    def _gen_dataset_path(self, dataset):
+        path_getter = gp.GetPath()
+        dataset_folder = path_getter.get_data_path()
+
+        return os.path.join(dataset_folder, dataset)
+
+    def _load_split_data(self, split_path):
+        """
+        :param split_path: Path where the split is stored
+        :return: A dictionary containing all split dictionaries that exist in the folder
+        """
+        split_data = {}
+        for split in SPLIT_NAMES:
+            path = os.path.join(split_path, split + '.json')
+            if os.path.isfile(path):
+                with open(path) as fd:
+                    split_data[split] = json.load(fd)
+        return split_data
+
+    def _adapt_json_data(self, json_data, codecs, new_files):
+        """
+        Replaces the file paths and the types of the transcoded names. Numerical entries whose files refer to a
+        transcoded image (e.g. the camera intrinsics of the color images) get the new paths as well.
+
+        :param json_data: basic_files.json or split file data
+        :param codecs: dictionary {name: (codec, parameter)}
+        :param new_files: dictionary {original file: new file} of all transcoded files
+        :return: json_data with the new file paths
+        """
+        for i, name in enumerate(json_data['names']):
+            json_data['files'][i] = [new_files.get(file, file) if isinstance(file, str) else file
+                                     for file in json_data['files'][i]]
+            if name in codecs:
+                json_data['types'][i] = ic.CODEC_ENDINGS[codecs[name][0]]
+        return json_data
+
+    def process(self, new_dataset_name, codecs, splits_to_adapt=None, check=True, proof='size'):
+        """
+        Transcodes the images of the given names and writes the json files and the parameters.json of the new dataset.
+        Every written file is recorded in a progress manifest, so an interrupted run is resumed by calling process
+        again with the same parameters.
+
+        :param new_dataset_name: name of the new dataset folder. It is forbidden to use an existing folder, unless it
+            contains the progress manifest of an interrupted run
+        :param codecs: dictionary {name: codec} with the codec of every name that is transcoded, e.g.
+            {'color': 'webp', 'depth': 'zstd:3', 'segmentation': 'png:1'}. A codec can have a parameter after a colon,
+            see image_codecs.parse_codec. jpeg may only be used for color images.
+        :param splits_to_adapt: Splits in seperate folders that will also be copied into a new folder with adapted
+            file paths (optional)
+        :param check: if True, every image of a lossless codec is decoded again and compared with the original image
+        :param proof: 'size' or 'hash'. A file of an interrupted run counts as completed if it still has the recorded
+            size or sha1 hash.
+        """
+        assert self.dataset != new_dataset_name
+        new_path = self._gen_dataset_path(new_dataset_name)
+        assert not os.path.isdir(new_path) or os.path.isfile(os.path.join(new_path, pm.MANIFEST_FILENAME)), \
+            'You are not allowed to write into an existing dataset folder!'
+        if type(splits_to_adapt) == str:
+            splits_to_adapt = (splits_to_adapt,)
+
+        with open(os.path.join(self.dataset_path, 'basic_files.json')) as fd:
+            basic_json_data = json.load(fd)
+        names = basic_json_data['names']
+        codecs = {name: ic.parse_codec(spec) for name, spec in codecs.items()}
+        for name, (codec, _) in codecs.items():
+            assert name in names, 'There is no entry {} in the basic_files.json'.format(name)
+            assert basic_json_data['numerical_values'][names.index(name)] is None, \
+                'The entry {} contains numerical values and no images'.format(name)
+            assert codec in ic.LOSSLESS_CODECS or name.startswith(LOSSY_NAMES), \
+                'The lossy codec {} may only be used for the names {}'.format(codec, LOSSY_NAMES)
+
+        # Transcode the files of the given names, link all other files
+        jobs = {}
+        for name, files, numerics in zip(names, basic_json_data['files'], basic_json_data['numerical_values']):
+            if numerics is not None:
+                continue
+            codec, parameter = codecs.get(name, (None, None))
+            for file in files:
+                new_file = file if codec is None else ic.replace_ending(file, codec)
+                jobs[new_file] = (file, codec, parameter)
+
+        task = {'tool': 'DatasetTranscoder', 'dataset': self.dataset, 'codecs': codecs, 'check': check}
+        manifest = pm.ProgressManifest(os.path.join(new_path, pm.MANIFEST_FILENAME), task, proof)
+        completed = manifest.completed_items(new_path)
+        if completed:
+            print('Resuming: {} files have already been written'.format(len(completed)))
+
+        args = [(self.dataset_path, new_path, file, new_file, codec, parameter, check, proof)
+                for new_file, (file, codec, parameter) in jobs.items() if new_file not in completed]
+        with Pool(processes=max(1, self.num_workers)) as pool:
+            results = pool.imap_unordered(transcode_file, args, chunksize=16)
+            for new_file, file_proof in pm.print_progress(results):
+                manifest.add(new_file, {new_file: file_proof})
+        print('')
+
+        # Write the json files with the new file paths
+        new_files = {file: new_file for new_file, (file, codec, _) in jobs.items() if codec is not None}
+        pm.write_json_atomic(os.path.join(new_path, 'basic_files.json'),
+                         self._adapt_json_data(basic_json_data, codecs, new_files))
+        for split, split_data in self._load_split_data(self.dataset_path).items():
+            pm.write_json_atomic(os.path.join(new_path, split + '.json'),
+                             self._adapt_json_data(split_data, codecs, new_files))
+        for split_name in splits_to_adapt or ():
+            new_split_path = new_path + '_' + split_name
+            os.makedirs(new_split_path, exist_ok=True)
+            for split, split_data in self._load_split_data(self.dataset_path + '_' + split_name).items():
+                pm.write_json_atomic(os.path.join(new_split_path, split + '.json'),
+                                 self._adapt_json_data(split_data, codecs, new_files))
+
+        # Copy the parameters.json into the new path, adapt the split list and record the codecs
+        with open(os.path.join(self.dataset_path, 'parameters.json')) as fd:
+            parameters = json.load(fd)
+        parameters['splits'] = splits_to_adapt
+        parameters['codecs'] = {name: [codec, parameter] for name, (codec, parameter) in codecs.items()}
+        pm.write_json_atomic(os.path.join(new_path, 'parameters.json'), parameters)
+
+        # The transcoded dataset is complete
+        manifest.remove()
+
+
+if __name__ == '__main__':
+    # Transcodes the images of a dataset, e.g.
+    #   python dataset_transcoder.py cityscapes cityscapes_webp color=webp segmentation=png:1 --splits=some_split
+    # Every name is followed by its codec (png, webp, npy, zstd or jpeg) and an optional parameter after a colon: the
+    # zlib level of png, the compression level of zstd or the quality of jpeg.
+    parser = argparse.ArgumentParser(description='Creates a copy of a dataset with transcoded images')
+    parser.add_argument('dataset', help='name of the dataset')
+    parser.add_argument('new_dataset', help='name of the transcoded dataset')
+    parser.add_argument('codecs', nargs='+', metavar='name=codec', help='codec of a name, e.g. color=webp')
+    parser.add_argument('--splits', type=lambda splits: splits.split(','), default=None,
+                        help='comma separated split folders that are copied with adapted file paths')
+    parser.add_argument('--no-check', action='store_true',
+                        help='the encoded lossless images are not compared with the original images')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help='number of processes')
+    options = parser.parse_args()
+    transcoder = DatasetTranscoder(options.dataset, num_workers=options.workers)
+    transcoder.process(options.new_dataset, dict(codec.split('=', 1) for codec in options.codecs),
+                       splits_to_adapt=options.splits, check=not options.no_check)
@@ -0,0 +1,230 @@
+import os
+import argparse
+import sys
+from multiprocessing import Pool
+
+from PIL import Image
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.image_metadata as im
+import dataloader.file_io.binary_index as bi
+import dataloader.file_io.image_codecs as ic
+import dataloader.file_io.progress_manifest as pm
+
+NUM_WORKERS = 4
+REPORT_SUFFIX = '_report.json'
+CLEAN_SUFFIX = '_clean'
+# Files of these types are checked by their header, all other files only have to exist
+IMAGE_TYPES = ('.png', '.jpg', '.jpeg', '.ppm', '.bmp', '.tif', '.tiff', '.webp', '.npy', '.npy.zst')
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_UNREADABLE = 'unreadable'
+STATUS_CORRUPT = 'corrupt'
+STATUS_MISMATCH = 'mismatch'
+
+
+def verify_file(args):
+    """
+    Checks one file of a dataset
+
+    :param args: tuple (path, expected, decode) with
+        - path: absolute path of the file
+        - expected: list [width, height, channels, dtype] whose entries may be None if they are not checked, or None
+        - decode: if True, the whole image is decoded, otherwise only its header is read
+    :return: tuple (status, message). status is one of the STATUS_* constants, message describes the problem.
+    """
+    path, expected, decode = args
+    if not os.path.isfile(path):
+        return STATUS_MISSING, 'file does not exist'
+    if not path.lower().endswith(IMAGE_TYPES):
+        return STATUS_OK, ''
+    header = im.read_header(path)
+    if header is None:
+        return STATUS_UNREADABLE, 'header cannot be read'
+    if decode:
+        try:
+            if path.lower().endswith(('.npy', ic.ZSTD_ENDING)):
+                ic.read_image(path)
+            else:
+                with Image.open(path) as image:
+                    image.load()
+        except (OSError, ValueError, SyntaxError) as e:
+            return STATUS_CORRUPT, str(e)
+    if expected is not None:
+        for key, expected_value, value in zip(im.METADATA_KEYS, expected, header):
+            if expected_value is not None and expected_value != value:
+                return STATUS_MISMATCH, '{} is {} instead of {}'.format(key, value, expected_value)
+    return STATUS_OK, ''
+
+
+def get_json_path(dataset, split=None, trainvaltest_split='train'):
+    """
+    Returns the path of the json file that is verified
+
+    :param dataset: name of the dataset
+    :param split: name of the split. If None, the split files in the dataset folder itself are used
+    :param trainvaltest_split: can be train, validation or test. If None, the basic_files.json is used.
+    """
+    data_path = gp.GetPath().get_data_path()
+    if trainvaltest_split is None:
+        return os.path.join(data_path, dataset, im.BASIC_FILES_FILENAME)
+    if split is None:
+        return os.path.join(data_path, dataset, trainvaltest_split + '.json')
+    return os.path.join(data_path, dataset + '_' + split, trainvaltest_split + '.json')
+
+
+class DatasetVerifier(object):
+    """
+    Verifies that all files of a split file or of the basic_files.json exist and can be read before a dataset is used
+    for training. By default, only the image headers are read, which is fast enough to be done before every job. With
+    decode=True, every image is decoded completely, which also finds truncated files.
+
+    The size, the number of channels and the dtype of every image are compared with the basic_files_metadata.json if
+    the metadata has been collected, and with the values that are passed as expected.
+    """
+    def __init__(self, dataset, split=None, expected=None, decode=False, num_workers=NUM_WORKERS):
+        """
+        :param dataset: name of the dataset
+        :param split: name of the split. If None, the split files in the dataset folder itself are verified
+        :param expected: dictionary {name: [width, height, channels, dtype]} with the values that all files of an
+            entry (e.g. 'segmentation') must have. Values that are None are not checked.
+        :param decode: if True, every image is decoded completely instead of reading only its header
+        :param num_workers: number of processes that check the files
+        """
+        self.dataset = dataset
+        self.split = split
+        self.expected = {} if expected is None else expected
+        self.decode = decode
+        self.num_workers = num_workers
+
+        path_getter = gp.GetPath()
+        self.dataset_path = os.path.join(path_getter.get_data_path(), dataset)
+        self.metadata = None
+        if im.ImageMetadata.exists(self.dataset_path):
+            self.metadata = im.ImageMetadata(self.dataset_path)
+
+    def _get_expected(self, name, file):
+        """Returns the expected [width, height, channels, dtype] of a file, entries that are not checked are None"""
+        expected = [None] * len(im.METADATA_KEYS)
+        # only stored metadata is compared, the header of a file without metadata would be compared with itself
+        if self.metadata is not None and file in self.metadata:
+            header = self.metadata.get(file)
+            if header is not None:
+                expected = [header[key] for key in im.METADATA_KEYS]
+        for i, value in enumerate(self.expected.get(name, expected)):
+            if value is not None:
+                expected[i] = value
+        return expected
+
+    def verify(self, trainvaltest_split='train'):
+        """
+        Checks all files of a json file and writes a report next to it, e.g. train.json -> train_report.json
+
+        :param trainvaltest_split: can be train, validation or test. If None, the basic_files.json is verified.
+        :return: report as a dictionary with the keys
+            - 'json_file': path of the verified json file
+            - 'mode': 'decode' or 'header'
+            - 'num_files': number of checked files
+            - 'counts': number of files per status
+            - 'errors': list of {'name', 'file', 'position', 'status', 'message'} for every file that is not OK
+        """
+        json_path = get_json_path(self.dataset, self.split, trainvaltest_split)
+        assert bi.index_exists(json_path), 'There is no json file {}'.format(json_path)
+        json_data = bi.load_index(json_path)
+        numerics = json_data.get('numerical_values', [None] * len(json_data['names']))
+
+        # Numerical entries are not checked since their files are the ones of the color images
+        entries = []
+        for name, files, positions, numeric in zip(json_data['names'], json_data['files'], json_data['positions'],
+                                                   numerics):
+            if numeric is not None:
+                continue
+            for file, position in zip(files, positions):
+                if isinstance(file, str):
+                    entries.append((name, file, position))
+        args = [(os.path.join(self.dataset_path, file.replace('/', os.sep).replace('\\', os.sep)),
+                 self._get_expected(name, file) if file.lower().endswith(IMAGE_TYPES) else None, self.decode)
+                for name, file, _ in entries]
+        print('Verifying {} files of {}'.format(len(args), json_path))
+
+        if self.num_workers <= 1:
+            results = [verify_file(arg) for arg in pm.print_progress(args)]
+        else:
+            with Pool(self.num_workers) as pool:
+                results = list(pm.print_progress(pool.imap(verify_file, args, chunksize=64)))
+        print('')
+
+        counts = {}
+        errors = []
+        for (name, file, position), (status, message) in zip(entries, results):
+            counts[status] = counts.get(status, 0) + 1
+            if status != STATUS_OK:
+                errors.append({'name': name, 'file': file, 'position': position, 'status': status,
+                               'message': message})
+        report = {'json_file': json_path, 'mode': 'decode' if self.decode else 'header', 'num_files': len(entries),
+                  'counts': counts, 'errors': errors}
+
+        report_path = os.path.splitext(json_path)[0] + REPORT_SUFFIX
+        pm.write_json_atomic(report_path, report, indent=1)
+        return report
+
+    @staticmethod
+    def write_clean_split(report, output_path=None):
+        """
+        Writes a copy of the verified json file without the frames that contain a file with an error. A frame is
+        identified by the global position, i.e. the first entry of its position, so all entries of a frame (e.g. the
+        color image and the camera intrinsics) are removed together.
+
+        :param report: report that has been returned by verify
+        :param output_path: path of the new json file. Default: train.json -> train_clean.json
+        :return: path of the new json file
+        """
+        json_path = report['json_file']
+        if output_path is None:
+            output_path = os.path.splitext(json_path)[0] + CLEAN_SUFFIX + '.json'
+        json_data = bi.load_index(json_path)
+        broken_positions = set(error['position'][0] for error in report['errors'])
+        for i, positions in enumerate(json_data['positions']):
+            keep = [j for j, position in enumerate(positions) if position[0] not in broken_positions]
+            for key in ('files', 'positions', 'numerical_values'):
+                if key in json_data and json_data[key][i] is not None:
+                    json_data[key][i] = [json_data[key][i][j] for j in keep]
+        pm.write_json_atomic(output_path, json_data)
+        return output_path
+
+
+if __name__ == '__main__':
+    # Verifies the split files of a dataset, e.g.
+    #   python dataset_verifier.py kitti eigen_split --decode
+    # Exits with an error code if any file is broken.
+    parser = argparse.ArgumentParser(description='Verifies the files of a dataset')
+    parser.add_argument('dataset', help='name of the dataset')
+    parser.add_argument('split', nargs='?', default=None, help='name of the split, default: the split files in the '
+                                                               'dataset folder')
+    parser.add_argument('--decode', action='store_true',
+                        help='every image is decoded completely instead of reading only its header')
+    parser.add_argument('--clean', action='store_true',
+                        help='a copy of every split file without the broken frames is written, e.g. train_clean.json')
+    parser.add_argument('--basic-files', action='store_true',
+                        help='the basic_files.json is verified instead of the split files')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help='number of processes')
+    options = parser.parse_args()
+    verifier = DatasetVerifier(options.dataset, options.split, decode=options.decode, num_workers=options.workers)
+    if options.basic_files:
+        trainvaltest_splits = (None,)
+    else:
+        trainvaltest_splits = [trainvaltest_split for trainvaltest_split in ('train', 'validation', 'test')
+                               if bi.index_exists(get_json_path(options.dataset, options.split, trainvaltest_split))]
+    num_errors = 0
+    for trainvaltest_split in trainvaltest_splits:
+        report = verifier.verify(trainvaltest_split)
+        num_errors += len(report['errors'])
+        print('{}: {} files, {}'.format(report['json_file'], report['num_files'],
+                                        ', '.join('{} {}'.format(count, status)
+                                                  for status, count in sorted(report['counts'].items()))))
+        for error in report['errors'][:10]:
+            print('    {} {}: {}'.format(error['status'], error['file'], error['message']))
+        if options.clean and report['errors']:
+            print('Clean split written to {}'.format(DatasetVerifier.write_clean_split(report)))
+    if num_errors > 0:
+        sys.exit(1)
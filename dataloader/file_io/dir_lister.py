@@ -1,7 +1,19 @@
 import os
 import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 import dataloader.file_io.get_path as gp
+import dataloader.file_io.progress_manifest as pm
+
+# Number of threads that scan directories in parallel. Listing a directory mostly waits for the file system, so more
+# threads than CPU cores pay off, especially on network file systems with a high latency.
+NUM_THREADS = 16
+# File in the dataset folder that stores the directory tree of the last scan for incremental scans
+TREE_FILENAME = 'basic_files_tree.json'
+# Directories that have been modified shortly before a scan are listed again in the next incremental scan, since a
+# change within the timestamp resolution of the file system would not alter their modification time
+MTIME_TOLERANCE_NS = 2 * 10 ** 9
 
 
 class DirLister:
@@ -28,16 +40,32 @@ class DirLister:
                 check = False
         return check
 
+    @staticmethod
+    def scan_directory(top_dir):
+        """ method that lists all subdirectories and all files of a given directory in one pass. The type of the
+        entries is taken from os.scandir, so no additional stat call is needed for most file systems.
+
+        :param top_dir: directory in which the subdirectories and files are searched in
+        :return: list of all subdirectories and list of all files inside top_dir
+        """
+        top_dir = os.path.abspath(top_dir)
+        sub_dirs = []
+        files = []
+        with os.scandir(top_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    sub_dirs.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry.path)
+        return sub_dirs, files
+
     @staticmethod
     def list_subdirectories(top_dir):
         """ method that lists all subdirectories of a given directory
 
         :param top_dir: directory in which the subdirectories are searched in
         """
-        top_dir = os.path.abspath(top_dir)
-        sub_dirs = [os.path.join(top_dir, x) for x in os.listdir(top_dir)
-                    if os.path.isdir(os.path.join(top_dir, x))]
-        return sub_dirs
+        return DirLister.scan_directory(top_dir)[0]
 
     @staticmethod
     def list_files_in_directory(top_dir):
@@ -45,32 +73,108 @@ class DirLister:
 
         :param top_dir: directory in which the files are searched in
         """
+        return DirLister.scan_directory(top_dir)[1]
+
+    @staticmethod
+    def scan_directory_cached(top_dir, cached=None, scan_time_ns=0):
+        """ method that lists a directory unless its modification time shows that the listing of a previous scan is
+        still valid. Adding, removing or renaming an entry changes the modification time of a directory.
+
+        :param top_dir: directory in which the subdirectories and files are searched in
+        :param cached: tuple (list of subdirectories, list of files, modification time) from a previous scan or None
+        :param scan_time_ns: time at which the previous scan started, in nanoseconds since the epoch
+        :return: tuple (list of subdirectories, list of files, modification time in nanoseconds)
+        """
         top_dir = os.path.abspath(top_dir)
-        files = [os.path.join(top_dir, x) for x in os.listdir(top_dir)
-                 if os.path.isfile(os.path.join(top_dir, x))]
-        return files
+        # the modification time is read before listing, so a change during the listing will be noticed next time
+        mtime_ns = os.stat(top_dir).st_mtime_ns
+        if cached is not None and cached[2] == mtime_ns and mtime_ns < scan_time_ns - MTIME_TOLERANCE_NS:
+            return cached
+        sub_dirs, files = DirLister.scan_directory(top_dir)
+        return sub_dirs, files, mtime_ns
 
     @staticmethod
-    def get_directories(parent_dir):
-        """ method that lists all directories of a given directory recursively
+    def walk(parent_dir, num_threads=NUM_THREADS, cache=None):
+        """ method that scans a directory tree level by level. All directories of one level are scanned in parallel
+        by a pool of threads.
 
         :param parent_dir: directory in which the subdirectories are searched in
+        :param num_threads: number of threads that scan directories in parallel
+        :param cache: tuple (tree, scan time in nanoseconds) of a previous scan as returned by DirLister.load_tree.
+            Directories that have not been modified since then are not listed again, only their modification time
+            is read.
+        :return: dictionary {directory: (list of subdirectories, list of files, modification time in nanoseconds)}
+            containing parent_dir and all of its subdirectories in breadth-first order
         """
         if DirLister.check_formats(cur_dir=parent_dir) is False:
             sys.exit("Inputparameter überprüfen")
+        cached_tree, scan_time_ns = cache if cache is not None else ({}, 0)
+        tree = {}
+        still_to_search = [os.path.abspath(parent_dir)]
+        with ThreadPoolExecutor(max(1, num_threads)) as executor:
+            while len(still_to_search) > 0:
+                next_level = []
+                entries = executor.map(lambda directory: DirLister.scan_directory_cached(
+                    directory, cached_tree.get(directory), scan_time_ns), still_to_search)
+                for directory, entry in zip(still_to_search, entries):
+                    tree[directory] = entry
+                    next_level.extend(entry[0])
+                still_to_search = next_level
+        return tree
+
+    @staticmethod
+    def dump_tree(parent_dir, tree, scan_time_ns, filename=TREE_FILENAME):
+        """ method that stores a directory tree inside parent_dir for later incremental scans. The paths are stored
+        relative to parent_dir.
+
+        :param parent_dir: directory that has been scanned
+        :param tree: dictionary as returned by DirLister.walk
+        :param scan_time_ns: time at which the scan started, in nanoseconds since the epoch
+        :param filename: name of the file inside parent_dir
+        """
         parent_dir = os.path.abspath(parent_dir)
-        sub_dirs = []
-        still_to_search = DirLister.list_subdirectories(parent_dir)
+        root_stringlength = len(parent_dir) + 1
+        directories = {}
+        for directory, (sub_dirs, files, mtime_ns) in tree.items():
+            directories[directory[root_stringlength:]] = [mtime_ns, [os.path.split(x)[1] for x in sub_dirs],
+                                                          [os.path.split(x)[1] for x in files]]
+        path = os.path.join(parent_dir, filename)
+        pm.write_json_atomic(path, {'scan_time_ns': scan_time_ns, 'directories': directories})
 
-        while len(still_to_search) > 0:
-            curr_sub_dirs = DirLister.list_subdirectories(still_to_search[0])
-            if len(curr_sub_dirs) == 0:
-                sub_dirs.append(still_to_search[0])
-            else:
-                still_to_search.extend(curr_sub_dirs)
-            still_to_search.remove(still_to_search[0])
+    @staticmethod
+    def load_tree(parent_dir, filename=TREE_FILENAME):
+        """ method that loads a directory tree that has been stored by DirLister.dump_tree
 
-        return sub_dirs
+        :param parent_dir: directory that has been scanned
+        :param filename: name of the file inside parent_dir
+        :return: tuple (tree, scan time in nanoseconds) that can be passed to DirLister.walk, or None if there is no
+            stored tree
+        """
+        parent_dir = os.path.abspath(parent_dir)
+        path = os.path.join(parent_dir, filename)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as fp:
+            stored = json.load(fp)
+        tree = {}
+        for directory, (mtime_ns, sub_dirs, files) in stored['directories'].items():
+            directory = os.path.join(parent_dir, directory) if directory else parent_dir
+            tree[directory] = ([os.path.join(directory, x) for x in sub_dirs],
+                               [os.path.join(directory, x) for x in files], mtime_ns)
+        return tree, stored['scan_time_ns']
+
+    @staticmethod
+    def get_directories(parent_dir, tree=None):
+        """ method that lists all directories of a given directory recursively
+
+        :param parent_dir: directory in which the subdirectories are searched in
+        :param tree: result of DirLister.walk(parent_dir). If None, the directory tree is scanned
+        :return: all directories below parent_dir that do not contain further directories, in breadth-first order
+        """
+        if tree is None:
+            tree = DirLister.walk(parent_dir)
+        parent_dir = os.path.abspath(parent_dir)
+        return [directory for directory, entry in tree.items() if len(entry[0]) == 0 and directory != parent_dir]
 
     @staticmethod
     def include_files_by_name(file_list, names, positions):
@@ -173,25 +277,26 @@ class DirLister:
         return dir_list
 
     @staticmethod
-    def get_files_by_ending(cur_dir, file_ending, ignore = []):
+    def get_files_by_ending(cur_dir, file_ending, ignore=[], files=None):
         """ returns all files inside a directory which have a certain ending
 
         :param cur_dir: list of directories
         :param file_ending: all files with the specified file_ending are returned
         :param ignore: list of strings. Filenames containing one of these strings will be ignored.
+        :param files: files inside cur_dir, e.g. from DirLister.walk. If None, cur_dir is listed
         :return: all files inside cur_dir which have the ending file_ending
         """
-        if DirLister.check_formats(cur_dir=cur_dir,
+        if DirLister.check_formats(cur_dir=None if files is not None else cur_dir,
                                    file_ending=file_ending) is False:
             sys.exit("Inputparameter überprüfen")
-        files = DirLister.list_files_in_directory(cur_dir)
+        if files is None:
+            files = DirLister.list_files_in_directory(cur_dir)
         len_ending = len(file_ending)
         files = [x for x in files if x[-len_ending:] == file_ending]
         for ignore_string in ignore:
             files = [x for x in files if ignore_string not in x]
         return files
 
-
 if __name__ == '__main__':
     """can be used for testing purposes"""
     path_getter = gp.GetPath()
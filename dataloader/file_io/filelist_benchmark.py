@@ -0,0 +1,99 @@
+import os
+import argparse
+import time
+import shutil
+import tempfile
+
+import dataloader.file_io.filelist_creator as fc
+
+NUM_FILES = (10000, 100000, 1000000)
+SEQUENCE_LENGTH = 500
+SEQUENCES_PER_DATE = 20
+# Depth maps are missing for the first and the last frames of every drive, as in the KITTI depth benchmark
+DEPTH_OFFSET = 5
+CALIBRATION_LINE = 'K_0{}: 9.597910e+02 0.000000e+00 6.960217e+02 0.000000e+00 9.569251e+02 2.241806e+02 ' \
+                   '0.000000e+00 0.000000e+00 1.000000e+00\n'
+
+
+class SyntheticKITTIFilelistCreator(fc.KITTIFilelistCreator):
+    """
+    KITTIFilelistCreator that works on a synthetic KITTI-like file tree that is only held in memory. Only the
+    calibration files are written to the disk since they are read by create_json_from_list. This way, the time that is
+    spent on computing the positions and on matching the files can be measured for any number of files without
+    listing a real dataset.
+    """
+    def __init__(self, path, num_files, sequence_length=SEQUENCE_LENGTH):
+        """
+        :param path: absolute path of an empty folder in which the calibration files are created
+        :param num_files: number of color images of the left camera
+        :param sequence_length: number of frames of every drive
+        """
+        super().__init__(path)
+        self.drives = []
+        for drive in range((num_files + sequence_length - 1) // sequence_length):
+            date = '2011_09_{:02d}'.format(drive // SEQUENCES_PER_DATE + 1)
+            drive_name = '{}_drive_{:04d}_sync'.format(date, drive % SEQUENCES_PER_DATE)
+            self.drives.append((date, drive_name, min(sequence_length, num_files - drive * sequence_length)))
+
+        for date in sorted(set(date for date, _, _ in self.drives)):
+            os.makedirs(os.path.join(self.dataset_path, 'Raw_data', date), exist_ok=True)
+            lines = ['calib_time: 09-Jan-2012 13:57:47\n'] * 19 + [CALIBRATION_LINE.format(2)] + \
+                    ['calib_time: 09-Jan-2012 13:57:47\n'] * 7 + [CALIBRATION_LINE.format(3)]
+            with open(os.path.join(self.dataset_path, 'Raw_data', date, 'calib_cam_to_cam.txt'), 'w') as f:
+                f.writelines(lines)
+
+    def create_filelist(self, filters, ending, ignore=(), ambiguous_names_to_ignore=()):
+        """Returns the synthetic folders and files that belong to the filters, see FilelistCreator.create_filelist"""
+        camera = 'image_03' if 'image_03' in filters else 'image_02'
+        if 'Raw_data' in filters and 'data' in filters:
+            root, offset = 'Raw_data', 0
+        elif 'Depth' + os.sep in filters:
+            root, offset = 'Depth', DEPTH_OFFSET
+        else:
+            return [], []
+        folders = []
+        files = []
+        for date, drive_name, length in self.drives:
+            folder = os.path.join(self.dataset_path, root, date, drive_name, camera, 'data')
+            folders.append(folder)
+            files.extend(os.path.join(folder, '{:010d}{}'.format(frame, ending))
+                         for frame in range(offset, length - offset))
+        return folders, files
+
+
+def benchmark(num_files, sequence_length=SEQUENCE_LENGTH):
+    """
+    Creates the json dictionary of a synthetic KITTI dataset with color and depth images of both cameras
+
+    :param num_files: number of color images of the left camera
+    :param sequence_length: number of frames of every drive
+    :return: time in seconds that create_json_from_list takes
+    """
+    path = tempfile.mkdtemp()
+    try:
+        creator = SyntheticKITTIFilelistCreator(path, num_files, sequence_length)
+        json_list = {'names': ['color', 'color_right', 'depth', 'depth_right'],
+                     'types': ['.png', '.png', '.png', '.png'],
+                     'filters': [['Raw_data', 'image_02', 'data'],
+                                 ['Raw_data', 'image_03', 'data'],
+                                 ['Depth' + os.sep, 'image_02', 'data'],
+                                 ['Depth' + os.sep, 'image_03', 'data']]}
+        start = time.perf_counter()
+        creator.create_json_from_list(json_list, stereo_replace={'image_02': 'image_03'})
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    # Measures how the creation of the basic_files.json scales with the number of files, e.g.
+    #   python filelist_benchmark.py 10000 100000 1000000
+    # The time per file should stay roughly constant.
+    parser = argparse.ArgumentParser(description='Measures the creation of the basic_files.json')
+    parser.add_argument('sizes', nargs='*', type=int, default=NUM_FILES, help='numbers of files')
+    options = parser.parse_args()
+    results = [(size, benchmark(size)) for size in options.sizes]
+    print('')
+    print('{:>12} {:>12} {:>16}'.format('files', 'time [s]', 'time/file [us]'))
+    for size, duration in results:
+        print('{:>12} {:>12.2f} {:>16.2f}'.format(size, duration, duration / size * 1e6))
@@ -1,11 +1,16 @@
 import os
 import sys
 import json
+import time
 import numpy as np
 import pandas as pd
 
 import dataloader.file_io.dir_lister as dl
 import dataloader.file_io.get_path as gp
+import dataloader.file_io.image_metadata as im
+import dataloader.file_io.calibration_cache as cc
+import dataloader.file_io.binary_index as bi
+import dataloader.file_io.progress_manifest as pm
 
 SUPPORTED_DATASETS = ('cityscapes', 'cityscapes_video', 'cityscapes_sequence', 'cityscapes_extra', 'cityscapes_part',
                       'kitti', 'kitti_2012', 'kitti_2015', 'virtual_kitti', 'mapillary', 'mapillary_by_ID', 'gta5',
@@ -13,19 +18,40 @@ SUPPORTED_DATASETS = ('cityscapes', 'cityscapes_video', 'cityscapes_sequence', '
 # If a directory path contains one one the following strings, it will be ignored
 FOLDERS_TO_IGNORE = ('segmentation_trainid')
 
+
+def get_sequence_limits(frame_numbers):
+    """Returns the indices of the first and the last frame of every sequence in a list of frame numbers. A new sequence
+    starts wherever a frame number is not the successor of the previous one.
+
+    :param frame_numbers: list of frame numbers in the order of the files
+    :return: list of the first indices (lower_limit) and list of the last indices (upper_limit) of all sequences
+    """
+    frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+    starts = np.flatnonzero(np.diff(frame_numbers) != 1) + 1
+    lower_limit = [0] + starts.tolist()
+    upper_limit = (starts - 1).tolist() + [len(frame_numbers) - 1]
+    return lower_limit, upper_limit
+
+
 class FilelistCreator:
     """This class provides helper functions to create a list of all files inside a dataset."""
 
-    def __init__(self, path):
+    def __init__(self, path, incremental=False):
         """Initializes the dataset path and gets a list of all folders in the dataset
 
         :param path: absolute path to the dataset
+        :param incremental: if True, only the folders that have changed since the directory tree has been stored
+            by the last call of dump_to_json are listed. The other folders are taken from the stored tree.
         """
         if os.path.isdir(os.path.abspath(path)):
             self.dataset_path = os.path.abspath(path)
         else:
             sys.exit("Der angegebene Dateipfad existiert nicht")
-        self.folders = dl.DirLister.get_directories(self.dataset_path)
+        cache = dl.DirLister.load_tree(self.dataset_path) if incremental else None
+        self.scan_time_ns = time.time_ns()
+        # the files of all folders are listed while walking the dataset, so the folders are not listed a second time
+        self.tree = dl.DirLister.walk(self.dataset_path, cache=cache)
+        self.folders = dl.DirLister.get_directories(self.dataset_path, self.tree)
         self.json_dict = {}
 
     def preprocess_directories_list(self, filter_names):
@@ -67,17 +93,24 @@ class FilelistCreator:
         folders = sorted(folders, key=str.lower)
         filelist = []
         for fold in folders:
-            files = dl.DirLister.get_files_by_ending(fold, ending, ignore)
+            files = dl.DirLister.get_files_by_ending(fold, ending, ignore, files=self.tree[fold][1])
             filelist.extend(files)
         filelist = sorted(filelist, key=str.lower)
         return folders, filelist
 
-    def dump_to_json(self, filename, remove_root=True):
+    def dump_to_json(self, filename, remove_root=True, metadata=False, binary=False):
         """Dumps the json list to a json file
 
         :param filename: name of the json file
         :param remove_root: if True, the root directory up to the dataset path is removed to store the images
             relative to the dataset path
+        :param metadata: if True, width, height, number of channels and dtype of every image are read from the file
+            headers and stored in the basic_files_metadata.json. Otherwise, an existing metadata file is removed since
+            it would not match the new file list anymore.
+        :param binary: if True, a binary index (e.g. basic_files.idx) is written next to the json file
+
+        The directory tree of the dataset is stored in the basic_files_tree.json, so that the next incremental run
+        only has to list the folders that have changed.
         """
         dump_location = os.path.join(self.dataset_path, filename)
         if remove_root:
@@ -90,8 +123,17 @@ class FilelistCreator:
                 for j in range(len(self.json_dict['files'][i])):
                     image_file = self.json_dict['files'][i][j]
                     self.json_dict['files'][i][j] = image_file[root_stringlength:]
-        with open(dump_location, 'w') as fp:
-            json.dump(self.json_dict, fp)
+        pm.write_json_atomic(dump_location, self.json_dict)
+        if binary:
+            bi.dump_index(bi.get_binary_path(dump_location), self.json_dict)
+        elif os.path.isfile(bi.get_binary_path(dump_location)):
+            os.remove(bi.get_binary_path(dump_location))
+        if metadata:
+            dataset_path = self.dataset_path if remove_root else ''
+            im.dump_metadata(self.dataset_path, im.collect_metadata(dataset_path, self.json_dict))
+        elif os.path.isfile(os.path.join(self.dataset_path, im.METADATA_FILENAME)):
+            os.remove(os.path.join(self.dataset_path, im.METADATA_FILENAME))
+        dl.DirLister.dump_tree(self.dataset_path, self.tree, self.scan_time_ns)
 
     def create_json_from_list(self, json_list, stereo_replace):
         """Creates a dictionary in the format of the basic_files.json.
@@ -134,6 +176,7 @@ class KITTIFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -147,18 +190,9 @@ class KITTIFilelistCreator(FilelistCreator):
             # then the first entry will contain the mapping from depth to color and the fourth entry will contain
             # numbers from 0 to 20000
             positions = []
-            lower_limit = [0]
-            upper_limit = []
-            old_frame_number = None
-            new_frame_number = None
             # get the sequence limits (upper and lower)
-            for file in files:
-                old_frame_number = new_frame_number
-                new_frame_number = int(os.path.splitext(os.path.split(file)[1])[0])
-                if old_frame_number != new_frame_number - 1 and old_frame_number is not None:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
-            upper_limit.append(len(files) - 1)
+            frame_numbers = [int(os.path.splitext(os.path.split(file)[1])[0]) for file in files]
+            lower_limit, upper_limit = get_sequence_limits(frame_numbers)
             index = 0
             # get the position entries and the file names of all image files, numerical values are handled
             # differently
@@ -170,11 +204,12 @@ class KITTIFilelistCreator(FilelistCreator):
                 if i == 0:
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append(file)
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:
                     if 'right' in name:
                         for key in stereo_replace.keys():
                             file = file.replace(stereo_replace[key], key)
-                    positions.append((main_files.index(file), j - lower_limit[index], upper_limit[index] - j, j))
+                    positions.append((main_indices[file], j - lower_limit[index], upper_limit[index] - j, j))
             position_list.append(positions)
             numerical_list.append(None)
             print('name: ', name, 'num_items: ', len(files))
@@ -185,22 +220,20 @@ class KITTIFilelistCreator(FilelistCreator):
         json_list['names'].extend(['camera_intrinsics', 'camera_intrinsics_right'])
         json_list['types'].extend(['.txt', '.txt'])
         json_list['filters'].extend([['Raw_data'], ['Raw_data']])
+        # all frames of a day share one calibration file, which is parsed only once
+        calibration_cache = cc.CalibrationCache()
         for file in main_files:
             base = file.split(os.sep)[0]
             # get the corresponding calibration files, every color frame has a calibration file
             if 'test' in file:
                 param_file_name = os.path.split(file)[1].replace('png', 'txt')
                 calib_file = os.path.join(self.dataset_path, 'Raw_data', base, 'intrinsics', param_file_name)
-                left = open(calib_file).readlines()[0][6:].split()
-                right = open(calib_file).readlines()[0][6:].split()
+                left_matrix = calibration_cache.camera_intrinsics(calib_file, 1)
+                right_matrix = calibration_cache.camera_intrinsics(calib_file, 1)
             else:
-                calib_file = os.path.join(self.dataset_path, 'Raw_data', base, 'calib_cam_to_cam.txt')
-                left = open(calib_file).readlines()[:20][-1][6:].split()
-                right = open(calib_file).readlines()[:28][-1][6:].split()
-            left_matrix = np.eye(4)
-            right_matrix = np.eye(4)
-            left_matrix[:3, :3] = np.array([float(l) for l in left]).reshape((3, 3))
-            right_matrix[:3, :3] = np.array([float(r) for r in right]).reshape((3, 3))
+                calib_file = os.path.join(self.dataset_path, 'Raw_data', base, cc.CAM_TO_CAM_FILENAME)
+                left_matrix = calibration_cache.camera_intrinsics(calib_file, cc.INTRINSICS_LINES[2])
+                right_matrix = calibration_cache.camera_intrinsics(calib_file, cc.INTRINSICS_LINES[3])
             left_matrix = list(left_matrix)
             right_matrix = list(right_matrix)
             left_matrix = [list(l) for l in left_matrix]
@@ -279,27 +312,17 @@ class KITTIFilelistCreator(FilelistCreator):
             positions = []
             files = []
             # get the corresponding filenames and positions from the poses
-            lower_limit = [0]
-            upper_limit = []
-            old_frame_number = None
-            new_frame_number = None
-            for i, number in zip(range(len(frame_numbers)), frame_numbers):
-                old_frame_number = new_frame_number
-                new_frame_number = number
-                if old_frame_number != new_frame_number - 1 and old_frame_number is not None:
-                    upper_limit.append(i - 1)
-                    lower_limit.append(i)
-            upper_limit.append(len(frame_numbers) - 1)
+            lower_limit, upper_limit = get_sequence_limits(frame_numbers)
             index = 0
             # append the values of positions and files to the data dict
             for i, file in zip(range(len(main_files)), main_files):
                 main_drive = file.split(os.sep)[-4]
                 main_frame_number = int(os.path.splitext(os.path.split(file)[1])[0])
                 if main_drive == drives[counter] and main_frame_number == frame_numbers[counter]:
-                    temp_position = (main_files.index(file), counter - lower_limit[index],
+                    temp_position = (main_indices[file], counter - lower_limit[index],
                                      upper_limit[index] - counter, counter)
                     positions.append(temp_position)
-                    files.append(file_list[0][main_files.index(file)])
+                    files.append(file_list[0][main_indices[file]])
                     counter += 1
                     if index < len(lower_limit) - 1 and counter == lower_limit[index + 1]:
                         index += 1
@@ -340,23 +363,15 @@ class KITTI2015FilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
             folders_list.append(folders)
             file_list.append(files)
             positions = []
-            lower_limit = [0]
-            upper_limit = []
-            old_frame_number = None
-            new_frame_number = None
-            for file in files:
-                old_frame_number = new_frame_number
-                new_frame_number = int(os.path.splitext(os.path.split(file)[1])[0].split('_')[1])
-                if old_frame_number != new_frame_number - 1 and old_frame_number is not None:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
-            upper_limit.append(len(files) - 1)
+            frame_numbers = [int(os.path.splitext(os.path.split(file)[1])[0].split('_')[1]) for file in files]
+            lower_limit, upper_limit = get_sequence_limits(frame_numbers)
             index = 0
             for j, file in zip(range(len(files)), files):
                 folder = os.path.split(os.path.split(os.path.split(file)[0])[0])[1]
@@ -367,11 +382,12 @@ class KITTI2015FilelistCreator(FilelistCreator):
                 if i == 0:
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append(file)
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:
                     if 'right' in name:
                         for key in stereo_replace.keys():
                             file = file.replace(stereo_replace[key], key)
-                    positions.append((main_files.index(file), j - lower_limit[index], upper_limit[index] - j, j))
+                    positions.append((main_indices[file], j - lower_limit[index], upper_limit[index] - j, j))
             position_list.append(positions)
             numerical_list.append(None)
             print('name: ', name, 'num_items: ', len(files))
@@ -382,17 +398,15 @@ class KITTI2015FilelistCreator(FilelistCreator):
         json_list['names'].extend(['camera_intrinsics', 'camera_intrinsics_right'])
         json_list['types'].extend(['.txt', '.txt'])
         json_list['filters'].extend(['calib_cam_to_cam', 'calib_cam_to_cam'])
+        # the frames of one scene share a calibration file, which is parsed only once
+        calibration_cache = cc.CalibrationCache()
         for file in main_files:
             base = file.split(os.sep)[1].split('_')[0]
             folder = file.split(os.sep)[0]
             param_file_name = base + '.txt'
             calib_file = os.path.join(self.dataset_path, folder, 'calib_cam_to_cam', param_file_name)
-            left = open(calib_file).readlines()[:20][-1][6:].split()
-            right = open(calib_file).readlines()[:28][-1][6:].split()
-            left_matrix = np.eye(4)
-            right_matrix = np.eye(4)
-            left_matrix[:3, :3] = np.array([float(l) for l in left]).reshape((3, 3))
-            right_matrix[:3, :3] = np.array([float(r) for r in right]).reshape((3, 3))
+            left_matrix = calibration_cache.camera_intrinsics(calib_file, cc.INTRINSICS_LINES[2])
+            right_matrix = calibration_cache.camera_intrinsics(calib_file, cc.INTRINSICS_LINES[3])
             left_matrix = list(left_matrix)
             right_matrix = list(right_matrix)
             left_matrix = [list(l) for l in left_matrix]
@@ -433,6 +447,7 @@ class VirtualKITTIFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -446,19 +461,9 @@ class VirtualKITTIFilelistCreator(FilelistCreator):
             # then the first entry will contain the mapping from depth to color and the fourth entry will contain
             # numbers from 0 to 20000
             positions = []
-            lower_limit = [0] # Array containing the index of the starting frames for each video
-            upper_limit = []  # Array containing the index of the end frame for each video
-            old_frame_number = None
-            new_frame_number = None
             # get the sequence limits (upper and lower)
-            for file in files:
-                old_frame_number = new_frame_number
-                new_frame_number = int(os.path.splitext(os.path.split(file)[1])[0])
-                # detect start of a new video
-                if old_frame_number != new_frame_number - 1 and old_frame_number is not None:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
-            upper_limit.append(len(files) - 1)
+            frame_numbers = [int(os.path.splitext(os.path.split(file)[1])[0]) for file in files]
+            lower_limit, upper_limit = get_sequence_limits(frame_numbers)
             index = 0
             # get the position entries and the file names of all image files, numerical values are handled
             # differently
@@ -471,8 +476,9 @@ class VirtualKITTIFilelistCreator(FilelistCreator):
                 if i == 0:
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append(file)
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:
-                    positions.append((main_files.index(file), j - lower_limit[index], upper_limit[index] - j, j))
+                    positions.append((main_indices[file], j - lower_limit[index], upper_limit[index] - j, j))
             position_list.append(positions)
             numerical_list.append(None)
             print('name: ', name, 'num_items: ', len(files))
@@ -514,6 +520,7 @@ class CityscapesFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             # cityscapes_extra dataset
@@ -532,7 +539,7 @@ class CityscapesFilelistCreator(FilelistCreator):
             upper_limit = []
             old_frame_number = None
             new_frame_number = None
-            for file in files:
+            for j, file in enumerate(files):
                 old_frame_number = new_frame_number
                 img_filename = os.path.splitext(os.path.split(file)[1])[0]
                 new_frame_number = int(img_filename.split('_')[2])
@@ -541,11 +548,11 @@ class CityscapesFilelistCreator(FilelistCreator):
                     # Skip the ignored file while checking whether the images belong to the same sequence
                     if old_frame_number not in [new_frame_number - 2, new_frame_number - 3] \
                             and old_frame_number is not None:
-                        upper_limit.append(files.index(file) - 1)
-                        lower_limit.append(files.index(file))
+                        upper_limit.append(j - 1)
+                        lower_limit.append(j)
                 elif old_frame_number != new_frame_number - 1 and old_frame_number is not None:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
+                    upper_limit.append(j - 1)
+                    lower_limit.append(j)
             upper_limit.append(len(files) - 1)
 
             # Create the positions entries
@@ -558,15 +565,16 @@ class CityscapesFilelistCreator(FilelistCreator):
                 if i == 0:
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append('_'.join(file.split('_')[:-1]))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:
                     if 'right' in name:
                         for key in stereo_replace.keys():
                             file = file.replace(stereo_replace[key], key)
                     if 'segmentation' in name:
-                        positions.append((main_files.index('_'.join(file.split('_')[:-2])),
+                        positions.append((main_indices['_'.join(file.split('_')[:-2])],
                                           j - lower_limit[index], upper_limit[index] - j, j))
                     else:
-                        positions.append((main_files.index('_'.join(file.split('_')[:-1])),
+                        positions.append((main_indices['_'.join(file.split('_')[:-1])],
                                           j - lower_limit[index], upper_limit[index] - j, j))
             position_list.append(positions)
             numerical_list.append(None)
@@ -827,6 +835,7 @@ class Bdd100kFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -839,8 +848,9 @@ class Bdd100kFilelistCreator(FilelistCreator):
                 if i == 0:   # color image
                     positions.append((len(positions), 0, 0, j))
                     main_files.append(self._generate_file_identifier(file))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:   # segmentation
-                    positions.append((main_files.index(self._generate_file_identifier(file)), 0, 0, j))
+                    positions.append((main_indices[self._generate_file_identifier(file)], 0, 0, j))
             folders_list.append(folders)
             file_list.append(files)
             position_list.append(positions)
@@ -874,6 +884,7 @@ class Voc2012FilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -884,8 +895,9 @@ class Voc2012FilelistCreator(FilelistCreator):
                 if i == 0: # color image
                     positions.append((len(positions), 0, 0, j))
                     main_files.append(file.split('.')[0])
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else: # segmentation
-                    positions.append((main_files.index(file.split('.')[0]), 0, 0, j))
+                    positions.append((main_indices[file.split('.')[0]], 0, 0, j))
 
             folders_list.append(folders)
             file_list.append(files)
@@ -932,6 +944,7 @@ class A2d2FilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type, ambiguous_names_to_ignore='camera_lidar_semantic')
@@ -942,8 +955,9 @@ class A2d2FilelistCreator(FilelistCreator):
                 if i == 0: # color image
                     positions.append((len(positions), 0, 0, j))
                     main_files.append(self._generate_file_identifier(file))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else: # segmentation
-                    positions.append((main_files.index(self._generate_file_identifier(file)), 0, 0, j))
+                    positions.append((main_indices[self._generate_file_identifier(file)], 0, 0, j))
 
             folders_list.append(folders)
             file_list.append(files)
@@ -978,6 +992,7 @@ class LostAndFoundFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
 
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
@@ -995,7 +1010,7 @@ class LostAndFoundFilelistCreator(FilelistCreator):
             old_seq_number = None
             new_seq_number = None
             frame_indicator_pos = {'color': -2, 'segmentation': -3}
-            for file in files:
+            for j, file in enumerate(files):
                 old_frame_number = new_frame_number
                 old_seq_number = new_seq_number
                 img_filename = os.path.splitext(os.path.split(file)[1])[0]
@@ -1006,8 +1021,8 @@ class LostAndFoundFilelistCreator(FilelistCreator):
                     new_frame_number = int(img_filename.split('_')[frame_indicator_pos['segmentation']])
                     new_seq_number = int(img_filename.split('_')[frame_indicator_pos['segmentation']-1])
                 if old_seq_number != new_seq_number and old_seq_number is not None:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
+                    upper_limit.append(j - 1)
+                    lower_limit.append(j)
             upper_limit.append(len(files) - 1)
             index = 0
             for j, file in zip(range(len(files)), files):
@@ -1018,9 +1033,10 @@ class LostAndFoundFilelistCreator(FilelistCreator):
                 if i == 0:
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append('_'.join(file.split('_')[:-1]))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:
                     if 'segmentation' in name:
-                        positions.append((main_files.index('_'.join(file.split('_')[:-2])),
+                        positions.append((main_indices['_'.join(file.split('_')[:-2])],
                                           j - lower_limit[index], upper_limit[index] - j, j))
             position_list.append(positions)
             numerical_list.append(None)
@@ -1067,6 +1083,7 @@ class CamVidFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -1076,12 +1093,12 @@ class CamVidFilelistCreator(FilelistCreator):
             frame_number = 0
             new_seq_id = None
             seq_number = 0
-            for file in files:
+            for j, file in enumerate(files):
                 old_seq_id = new_seq_id
                 new_seq_id = self._generate_file_identifier(file)[0]
                 if new_seq_id != old_seq_id:
-                    upper_limit.append(files.index(file) - 1)
-                    lower_limit.append(files.index(file))
+                    upper_limit.append(j - 1)
+                    lower_limit.append(j)
                     seq_number += 1
             upper_limit.append(len(files) - 1)
             index = 0
@@ -1093,8 +1110,9 @@ class CamVidFilelistCreator(FilelistCreator):
                 if i == 0:   # color image
                     positions.append((len(positions), j - lower_limit[index], upper_limit[index] - j, j))
                     main_files.append(self._generate_file_identifier(file))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:    # segmentation
-                    positions.append((main_files.index(self._generate_file_identifier(file)), j - lower_limit[index],
+                    positions.append((main_indices[self._generate_file_identifier(file)], j - lower_limit[index],
                                       upper_limit[index] - j, j))
 
             folders_list.append(folders)
@@ -1144,6 +1162,7 @@ class Make3dFilelistCreator(FilelistCreator):
         position_list = []
         numerical_list = []
         main_files = []
+        main_indices = {}
         for i, name, type, filter in zip(range(len(json_list['names'])), json_list['names'],
                                          json_list['types'], json_list['filters']):
             folders, files = self.create_filelist(filter, type)
@@ -1154,8 +1173,9 @@ class Make3dFilelistCreator(FilelistCreator):
                 if i == 0:  # color image
                     positions.append((len(positions), 0, 0, j))
                     main_files.append(self._generate_file_identifier(file))
+                    main_indices.setdefault(main_files[-1], len(main_files) - 1)
                 else:  # segmentation
-                    positions.append((main_files.index(self._generate_file_identifier(file)), 0, 0, j))
+                    positions.append((main_indices[self._generate_file_identifier(file)], 0, 0, j))
 
             folders_list.append(folders)
             file_list.append(files)
@@ -1170,12 +1190,18 @@ class Make3dFilelistCreator(FilelistCreator):
 class DatasetCreator:
     """Class to create the dataset file list for different datasets"""
 
-    def __init__(self, dataset, path=None, rewrite=False):
+    def __init__(self, dataset, path=None, rewrite=False, collect_metadata=False, incremental=False,
+                 binary_index=False):
         """Initializes the dataset name and path
 
         :param dataset: name of the dataset folder
         :param path: can user-define a path and not get it automatically from get_path (not recommended)
         :param rewrite: can be set to True to ensure that the dataset is rewritten
+        :param collect_metadata: if True, the image sizes, channels and dtypes are stored in the
+            basic_files_metadata.json
+        :param incremental: if True, the dataset is rewritten, but only the folders that have changed since the last
+            run are listed again. The result is the same as the one of a complete rewrite.
+        :param binary_index: if True, a binary index basic_files.idx is written next to the basic_files.json
         """
         assert dataset in SUPPORTED_DATASETS, 'Dataset not supported'
         self.data_dict = {'cityscapes': self.create_cityscapeslists,
@@ -1206,11 +1232,14 @@ class DatasetCreator:
             self.dataset_folder_path = path_getter.get_data_path()
         self.filename = 'basic_files' + '.json'
         self.rewrite = rewrite
+        self.collect_metadata = collect_metadata
+        self.incremental = incremental
+        self.binary_index = binary_index
 
     def check_state(self):
         """Checks whether the basic_files.json already exists and contains valid filenames"""
         check = False
-        if self.rewrite:
+        if self.rewrite or self.incremental:
             return check
         else:
             json_file = os.path.join(self.dataset_folder_path, self.dataset, self.filename)
@@ -1257,10 +1286,10 @@ class DatasetCreator:
                             ['disparity'],
                             ['gtFine']]
             }
-        creator = CityscapesFilelistCreator(local_path)
+        creator = CityscapesFilelistCreator(local_path, incremental=self.incremental)
         creator.preprocess_directories_list(['foggy', '_rain'])
         creator.create_json_from_list(json_list, stereo_replace={'left': 'right'})
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_kittilists(self):
         """Creates the basic_files.json for any dataset in the KITTI family"""
@@ -1286,10 +1315,10 @@ class DatasetCreator:
                                  ['Depth_completed_improved' + os.sep, 'image_02', 'data'],
                                  ['Depth_completed_improved' + os.sep, 'image_03', 'data']],
                      }
-        creator = KITTIFilelistCreator(local_path)
+        creator = KITTIFilelistCreator(local_path, incremental=self.incremental)
         creator.preprocess_directories_list(['image_00', 'image_01', 'velodyne_points'])
         creator.create_json_from_list(json_list, stereo_replace={'image_02': 'image_03'})
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_kitti2012lists(self):
         """Creates the basic_files.json for the KITTI 2012 dataset"""
@@ -1300,9 +1329,9 @@ class DatasetCreator:
                                  ['image_3'],
                                  ]
                      }
-        creator = KITTI2015FilelistCreator(local_path)
+        creator = KITTI2015FilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list, stereo_replace={})
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_kitti2015lists(self):
         """Creates the basic_files.json for the KITTI 2015 dataset"""
@@ -1318,10 +1347,10 @@ class DatasetCreator:
                                  ['flow_occ'],
                                  ['flow_noc']]
                      }
-        creator = KITTI2015FilelistCreator(local_path)
+        creator = KITTI2015FilelistCreator(local_path, incremental=self.incremental)
         creator.preprocess_directories_list(['viz_flow'])
         creator.create_json_from_list(json_list, stereo_replace={})
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_virtualkittilists(self):
         """Creates the basic_files.json for the Virtual KITTI dataset"""
@@ -1332,9 +1361,9 @@ class DatasetCreator:
                                  ['vkitti_1.3.1_depthgt'],
                                  ['vkitti_1.3.1_scenegt']]
                      }
-        creator = VirtualKITTIFilelistCreator(local_path)
+        creator = VirtualKITTIFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_mapillarylists(self):
         """Creates the basic_files.json for the Mapillary dataset"""
@@ -1344,9 +1373,9 @@ class DatasetCreator:
             'types': ['.jpg', '.png'],
             'filters': ['ColorImage', 'Segmentation']
         }
-        creator = MapillaryFilelistCreator(local_path)
+        creator = MapillaryFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_gta5lists(self):
         """Creates the basic_files.json for the GTA5 dataset"""
@@ -1356,9 +1385,9 @@ class DatasetCreator:
             'types': ['.png', '.png'],
             'filters': ['images', 'labels']
         }
-        creator = Gta5FilelistCreator(local_path)
+        creator = Gta5FilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_synthialists(self):
         """Creates the basic_files.json for the Synthia dataset"""
@@ -1368,9 +1397,9 @@ class DatasetCreator:
             'types': ['.png', '.png', '.png'],
             'filters': ['RGB', 'Depth_1_channel', ['GT_1_channel', 'LABELS']]
         }
-        creator = SynthiaFilelistCreator(local_path)
+        creator = SynthiaFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_bdd100klists(self):
         """Creates the basic_files.json for the BDD100K dataset"""
@@ -1380,9 +1409,9 @@ class DatasetCreator:
             'types': ['.jpg', '.png'],
             'filters': ['images', 'labels']
         }
-        creator = Bdd100kFilelistCreator(local_path)
+        creator = Bdd100kFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_voc2012lists(self):
         """Creates the basic_files.json for the Pascal VOC 2012 dataset"""
@@ -1392,10 +1421,10 @@ class DatasetCreator:
             'types': ['.jpg', '.png'],
             'filters': ['JPEGImages', 'SegmentationClassAug']
         }
-        creator = Voc2012FilelistCreator(local_path)
+        creator = Voc2012FilelistCreator(local_path, incremental=self.incremental)
         creator.preprocess_directories_list(['__MACOSX'])
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_a2d2lists(self):
         """Creates the basic_files.json for the a2d2 dataset"""
@@ -1405,9 +1434,9 @@ class DatasetCreator:
             'types': ['.png', '.png'],
             'filters': [['camera', 'front_center'] , ['label', 'front_center']]
         }
-        creator = A2d2FilelistCreator(local_path)
+        creator = A2d2FilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_lostandfoundlists(self):
         """Creates the basic_files.json for the LostAndFound dataset"""
@@ -1417,9 +1446,9 @@ class DatasetCreator:
             'types': ['.png', '.png'],
             'filters': ['leftImg8bit', 'gtCoarse']
         }
-        creator = LostAndFoundFilelistCreator(local_path)
+        creator = LostAndFoundFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_camvidlists(self):
         """Creates the basic_files.json for the CamVid dataset"""
@@ -1429,10 +1458,10 @@ class DatasetCreator:
             'types': ['.png', '.png'],
             'filters': ['701_StillsRaw_full' , 'LabeledApproved_full']
         }
-        creator = CamVidFilelistCreator(local_path)
+        creator = CamVidFilelistCreator(local_path, incremental=self.incremental)
         creator.preprocess_directories_list(['trainid'])
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
     def create_make3dlists(self):
         """Creates the basic_files.json for the CamVid dataset"""
@@ -1442,9 +1471,9 @@ class DatasetCreator:
             'types': ['.jpg', '.png'],
             'filters': ['ColorImage' , 'Depth_PNG']
         }
-        creator = Make3dFilelistCreator(local_path)
+        creator = Make3dFilelistCreator(local_path, incremental=self.incremental)
         creator.create_json_from_list(json_list)
-        creator.dump_to_json(self.filename)
+        creator.dump_to_json(self.filename, metadata=self.collect_metadata, binary=self.binary_index)
 
 
 if __name__ == '__main__':
@@ -1470,6 +1499,7 @@ if __name__ == '__main__':
         - voc2012
     
     Supported modes:
+        --incremental: only the folders that have changed since the last run are listed again
     
     Path can be passed optionally however you are then responsible yourself of the right format.
     Otherwise the path is taken from get_path, you may modify this file for your needs,
@@ -1482,7 +1512,8 @@ if __name__ == '__main__':
     dataset = 'bdd100k'
     if len(sys.argv) > 1:
         dataset = sys.argv[1]
-    data_creator = DatasetCreator(dataset, rewrite=True)
+    incremental = '--incremental' in sys.argv[2:]
+    data_creator = DatasetCreator(dataset, rewrite=True, incremental=incremental)
     check = data_creator.check_state()
     if not check:
         data_creator.create_dataset()
@@ -0,0 +1,168 @@
+import os
+import io
+
+import cv2
+import numpy as np
+
+# Name and file ending of every codec. The images are always encoded and decoded in the layout of cv2.imread(path, -1),
+# i.e. color images in BGR order, so a transcoded dataset is loaded exactly like the original one.
+CODEC_ENDINGS = {'png': '.png', 'webp': '.webp', 'npy': '.npy', 'zstd': '.npy.zst', 'jpeg': '.jpg'}
+LOSSLESS_CODECS = ('png', 'webp', 'npy', 'zstd')
+# Default zlib level of png, compression level of zstd and quality of jpeg
+DEFAULT_PARAMETERS = {'png': 1, 'webp': None, 'npy': None, 'zstd': 3, 'jpeg': 95}
+ZSTD_ENDING = CODEC_ENDINGS['zstd']
+NPY_ENDING = CODEC_ENDINGS['npy']
+# The quality values above 100 select the lossless mode of the webp encoder of OpenCV
+WEBP_LOSSLESS_QUALITY = 101
+
+
+def _get_zstandard():
+    """Imports the optional zstandard package, which is only needed for the codec zstd"""
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception('The codec zstd needs the package zstandard, install it with pip install zstandard')
+    return zstandard
+
+
+def parse_codec(spec):
+    """
+    Splits a codec specification into the codec and its parameter
+
+    :param spec: codec name with an optional parameter, e.g. 'webp', 'png:1' (zlib level), 'zstd:3' (compression
+        level) or 'jpeg:90' (quality)
+    :return: codec name, parameter (int or None)
+    """
+    codec, _, parameter = spec.partition(':')
+    assert codec in CODEC_ENDINGS, 'Unknown codec {}, use one of {}'.format(codec, tuple(CODEC_ENDINGS))
+    if parameter == '':
+        return codec, DEFAULT_PARAMETERS[codec]
+    assert DEFAULT_PARAMETERS[codec] is not None, 'The codec {} has no parameter'.format(codec)
+    return codec, int(parameter)
+
+
+def get_ending(path):
+    """Returns the file ending of a path, including the double ending .npy.zst"""
+    if path.lower().endswith(ZSTD_ENDING):
+        return path[-len(ZSTD_ENDING):]
+    return os.path.splitext(path)[1]
+
+
+def replace_ending(path, codec):
+    """
+    Returns the path of the file that contains the image of path encoded with codec
+
+    :param path: path of the original file, e.g. 'leftImg8bit/train/aachen/aachen_000000_000019_leftImg8bit.png'
+    :param codec: name of the codec, e.g. 'webp'
+    """
+    ending = get_ending(path)
+    return path[:len(path) - len(ending)] + CODEC_ENDINGS[codec]
+
+
+def check_image(image, codec):
+    """
+    Checks whether an image can be stored with a codec without changing its shape or dtype
+
+    :param image: image as returned by cv2.imread(path, -1)
+    :param codec: name of the codec
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    if codec == 'webp' and (image.dtype != np.uint8 or channels not in (3, 4)):
+        raise Exception('webp can only store 8 bit color images, not {} images with {} channels. Use png, npy or '
+                        'zstd instead.'.format(image.dtype, channels))
+    if codec == 'jpeg' and (image.dtype != np.uint8 or channels not in (1, 3)):
+        raise Exception('jpeg can only store 8 bit images with 1 or 3 channels, not {} images with {} channels'
+                        .format(image.dtype, channels))
+    if codec == 'png' and image.dtype not in (np.uint8, np.uint16):
+        raise Exception('png can only store 8 or 16 bit images, not {} images. Use npy or zstd instead.'
+                        .format(image.dtype))
+
+
+def encode_image(image, codec, parameter=None):
+    """
+    Encodes an image
+
+    :param image: image as returned by cv2.imread(path, -1)
+    :param codec: name of the codec
+    :param parameter: zlib level (png), compression level (zstd) or quality (jpeg). Default: DEFAULT_PARAMETERS
+    :return: the encoded file content as bytes
+    """
+    check_image(image, codec)
+    if parameter is None:
+        parameter = DEFAULT_PARAMETERS[codec]
+    if codec in ('npy', 'zstd'):
+        buffer = io.BytesIO()
+        np.save(buffer, image)
+        data = buffer.getvalue()
+        if codec == 'zstd':
+            data = _get_zstandard().ZstdCompressor(level=parameter).compress(data)
+        return data
+    if codec == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, parameter]
+    elif codec == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, WEBP_LOSSLESS_QUALITY]
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, parameter]
+    success, data = cv2.imencode(CODEC_ENDINGS[codec], image, params)
+    if not success:
+        raise Exception('The image could not be encoded as {}'.format(codec))
+    return data.tobytes()
+
+
+def decode_image(data, ending):
+    """
+    Decodes the content of an image file
+
+    :param data: file content as bytes
+    :param ending: file ending, see get_ending
+    :return: image in the layout of cv2.imread(path, -1), None if an image file cannot be decoded
+    """
+    ending = ending.lower()
+    if ending == ZSTD_ENDING:
+        zstandard = _get_zstandard()
+        try:
+            data = zstandard.ZstdDecompressor().decompress(data)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+        ending = NPY_ENDING
+    if ending == NPY_ENDING:
+        return np.load(io.BytesIO(data))
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), -1)
+
+
+def read_image(path):
+    """
+    Reads an image file of any codec. Images and npy files are read directly from the disk.
+
+    :param path: absolute path of the file
+    :return: image in the layout of cv2.imread(path, -1). Like cv2.imread, None is returned if an image file
+        cannot be decoded.
+    """
+    ending = get_ending(path).lower()
+    if ending == NPY_ENDING:
+        return np.load(path)
+    if ending == ZSTD_ENDING:
+        with open(path, 'rb') as fp:
+            return decode_image(fp.read(), ZSTD_ENDING)
+    return cv2.imread(path, -1)
+
+
+def read_zstd_header(path):
+    """
+    Reads shape and dtype of a zstd compressed npy file by decompressing only the beginning of the file
+
+    :param path: absolute path of the file
+    :return: shape, dtype
+    """
+    zstandard = _get_zstandard()
+    with open(path, 'rb') as fp:
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(fp) as reader:
+                version = np.lib.format.read_magic(reader)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(reader)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(reader)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+    return shape, dtype
@@ -0,0 +1,179 @@
+import os
+import argparse
+import json
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.image_codecs as ic
+import dataloader.file_io.progress_manifest as pm
+
+NUM_WORKERS = 4
+METADATA_FILENAME = 'basic_files_metadata.json'
+BASIC_FILES_FILENAME = 'basic_files.json'
+METADATA_KEYS = ('width', 'height', 'channels', 'dtype')
+# Number of channels and dtype of the image modes of PIL
+PIL_MODES = {'1': (1, 'bool'), 'L': (1, 'uint8'), 'P': (1, 'uint8'), 'LA': (2, 'uint8'), 'RGB': (3, 'uint8'),
+             'YCbCr': (3, 'uint8'), 'RGBA': (4, 'uint8'), 'CMYK': (4, 'uint8'), 'I': (1, 'int32'),
+             'F': (1, 'float32'), 'I;16': (1, 'uint16'), 'I;16B': (1, 'uint16'), 'I;16L': (1, 'uint16')}
+
+
+def read_header(path):
+    """
+    Reads width, height, number of channels and dtype of an image from its header without decoding the image
+
+    :param path: absolute path of the image. Numpy files (.npy) and zstd compressed numpy files (.npy.zst) are
+        supported as well.
+    :return: list [width, height, channels, dtype] or None if the file is not an image
+    """
+    if path is None:
+        return None
+    try:
+        if path.lower().endswith('.npy'):
+            array = np.load(path, mmap_mode='r')
+            channels = array.shape[2] if array.ndim == 3 else 1
+            return [int(array.shape[1]), int(array.shape[0]), int(channels), str(array.dtype)]
+        if path.lower().endswith(ic.ZSTD_ENDING):
+            shape, dtype = ic.read_zstd_header(path)
+            channels = shape[2] if len(shape) == 3 else 1
+            return [int(shape[1]), int(shape[0]), int(channels), str(dtype)]
+        with Image.open(path) as image:
+            channels, dtype = PIL_MODES.get(image.mode, (len(image.getbands()), 'uint8'))
+            return [int(image.width), int(image.height), channels, dtype]
+    except (OSError, ValueError):
+        return None
+
+
+def read_headers(paths, num_workers=NUM_WORKERS):
+    """
+    Reads the headers of several images in parallel
+
+    :param paths: list of absolute image paths
+    :param num_workers: number of processes
+    :return: list containing the result of read_header for every path
+    """
+    if num_workers <= 1:
+        return [read_header(path) for path in paths]
+    with Pool(num_workers) as pool:
+        return pool.map(read_header, paths, chunksize=256)
+
+
+def collect_metadata(dataset_path, json_dict, num_workers=NUM_WORKERS):
+    """
+    Collects the metadata of all files in a dictionary in the format of the basic_files.json
+
+    :param dataset_path: absolute path of the dataset, the files in json_dict are relative to it
+    :param json_dict: dictionary in the format of the basic_files.json
+    :param num_workers: number of processes
+    :return: dictionary {'names': [...], 'metadata': [[[width, height, channels, dtype] or None, ...], ...]} where
+        the lists in 'metadata' have the same order as the lists in json_dict['files']
+    """
+    paths = []
+    for files in json_dict['files']:
+        paths.extend(os.path.join(dataset_path, file) if isinstance(file, str) else None for file in files)
+    headers = read_headers(paths, num_workers)
+    metadata = []
+    start = 0
+    for files in json_dict['files']:
+        metadata.append(headers[start:start + len(files)])
+        start += len(files)
+    return {'names': list(json_dict['names']), 'metadata': metadata}
+
+
+def dump_metadata(dataset_path, metadata):
+    """
+    Writes the metadata next to the basic_files.json
+
+    :param dataset_path: absolute path of the dataset
+    :param metadata: dictionary as returned by collect_metadata
+    """
+    path = os.path.join(dataset_path, METADATA_FILENAME)
+    pm.write_json_atomic(path, metadata)
+
+
+class ImageMetadata(object):
+    """
+    Gives access to the metadata of all files of a dataset that have been stored in the basic_files_metadata.json.
+
+    The metadata is looked up by file path, so the basic_files.json may have been changed after the metadata has been
+    collected, e.g. by the TrainIDConverter, which adds the entries of the converted segmentation images. Names whose
+    number of files does not match the metadata any more are ignored. The headers of all files without stored
+    metadata are read when they are requested and kept for further requests.
+    """
+    def __init__(self, dataset_path, num_workers=NUM_WORKERS):
+        """
+        :param dataset_path: absolute path of the dataset
+        :param num_workers: number of processes that read the headers of files without stored metadata
+        """
+        self.dataset_path = dataset_path
+        self.num_workers = num_workers
+        with open(os.path.join(dataset_path, BASIC_FILES_FILENAME)) as fp:
+            json_data = json.load(fp)
+        with open(os.path.join(dataset_path, METADATA_FILENAME)) as fp:
+            metadata = json.load(fp)
+        stored = dict(zip(metadata['names'], metadata['metadata']))
+        self.metadata = {}
+        for name, files in zip(json_data['names'], json_data['files']):
+            headers = stored.get(name)
+            if headers is not None and len(headers) == len(files):
+                self.metadata.update((file, header) for file, header in zip(files, headers)
+                                     if isinstance(file, str))
+
+    @staticmethod
+    def exists(dataset_path):
+        """ Returns True if metadata has been stored for the dataset """
+        return os.path.isfile(os.path.join(dataset_path, METADATA_FILENAME))
+
+    def __contains__(self, file):
+        """ Returns True if the metadata of a file has been stored or read before """
+        return file in self.metadata
+
+    def _get_headers(self, files):
+        """ Returns the headers of several files and reads the ones that are not known yet """
+        unknown = list(set(file for file in files if file not in self.metadata))
+        if unknown:
+            paths = [os.path.join(self.dataset_path, file.replace('/', os.sep).replace('\\', os.sep))
+                     for file in unknown]
+            num_workers = self.num_workers if len(unknown) > 1 else 1
+            self.metadata.update(zip(unknown, read_headers(paths, num_workers)))
+        return [self.metadata[file] for file in files]
+
+    def get(self, file):
+        """
+        Returns the metadata of one file as a dictionary with the keys width, height, channels and dtype, or None if
+        the file is not an image
+
+        :param file: path of the file relative to the dataset, as stored in the json files
+        """
+        header = self._get_headers([file])[0]
+        if header is None:
+            return None
+        return dict(zip(METADATA_KEYS, header))
+
+    def sizes(self, files):
+        """
+        Returns an integer array of shape (number of files, 2) containing (height, width) of each file. Files that are
+        not images get the size (0, 0).
+
+        :param files: list of paths relative to the dataset
+        """
+        sizes = np.zeros((len(files), 2), dtype=np.int64)
+        for i, header in enumerate(self._get_headers(files)):
+            if header is not None:
+                sizes[i] = header[1], header[0]
+        return sizes
+
+
+if __name__ == '__main__':
+    # Adds the image metadata to an existing dataset index, e.g.
+    #   python image_metadata.py cityscapes
+    parser = argparse.ArgumentParser(description='Adds the image metadata to an existing dataset index')
+    parser.add_argument('dataset', help='name of the dataset')
+    options = parser.parse_args()
+    path_getter = gp.GetPath()
+    dataset_path = os.path.join(path_getter.get_data_path(), options.dataset)
+    with open(os.path.join(dataset_path, BASIC_FILES_FILENAME)) as fp:
+        json_data = json.load(fp)
+    dump_metadata(dataset_path, collect_metadata(dataset_path, json_data))
@@ -0,0 +1,161 @@
+import os
+import argparse
+import sys
+import copy
+import time
+
+import dataloader.file_io.position_index as pi
+import dataloader.file_io.trainid_converter as tc
+
+NUM_SAMPLES = (1000, 10000)
+SEQUENCE_LENGTH = 500
+# Every SPLIT_STEP-th sample is part of the split file
+SPLIT_STEP = 2
+# Every SEGMENTATION_STEP-th sample has no segmentation image
+SEGMENTATION_STEP = 5
+CAMERA_KEYS = ('camera_intrinsics', 'camera_intrinsics_right')
+SEGMENTATION_KEYS = ('segmentation', 'segmentation_right')
+
+
+def create_json_data(num_samples, sequence_length=SEQUENCE_LENGTH):
+    """
+    Creates the data of a synthetic KITTI-like basic_files.json and split file with stereo color, segmentation and
+    camera intrinsics. The segmentation images are missing for some samples, so the positions of the names differ.
+
+    :param num_samples: number of samples in the basic_files.json
+    :param sequence_length: number of frames of every drive
+    :return: basic_files data, split file data
+    """
+    names = ['color', 'color_right', 'segmentation', 'segmentation_right', 'camera_intrinsics',
+             'camera_intrinsics_right']
+    basic = {'names': names, 'types': ['.png'] * 4 + ['.txt'] * 2,
+             'filters': [['Raw_data', 'image_02'], ['Raw_data', 'image_03'], ['Segmentation', 'image_02'],
+                         ['Segmentation', 'image_03'], ['Raw_data', 'image_02'], ['Raw_data', 'image_03']],
+             'folders': [[] for _ in names], 'files': [[] for _ in names], 'positions': [[] for _ in names],
+             'numerical_values': [None] * 4 + [[], []]}
+    for i in range(num_samples):
+        drive, frame = divmod(i, sequence_length)
+        length = min(sequence_length, num_samples - drive * sequence_length)
+        for j, name in enumerate(names):
+            if name.startswith('segmentation') and i % SEGMENTATION_STEP == 0:
+                continue
+            camera = 'image_03' if name.endswith('_right') else 'image_02'
+            root = 'Segmentation' if name.startswith('segmentation') else 'Raw_data'
+            folder = '{}/drive_{:04d}/{}/data'.format(root, drive, camera)
+            if not basic['folders'][j] or basic['folders'][j][-1] != folder:
+                basic['folders'][j].append(folder)
+            basic['files'][j].append('{}/{:010d}.png'.format(folder, frame))
+            basic['positions'][j].append([i, frame, length - 1 - frame, len(basic['files'][j]) - 1])
+            if name in CAMERA_KEYS:
+                basic['numerical_values'][j].append([[721.5, 0.0, 609.6, 0.0], [0.0, 721.5, 172.9, 0.0],
+                                                     [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]])
+
+    # In split files, the numerical values are stored in the 'files' entry
+    split = {'names': names, 'types': basic['types'], 'folders': basic['folders'], 'files': [], 'positions': []}
+    for files, positions, numerics in zip(basic['files'], basic['positions'], basic['numerical_values']):
+        keep = [j for j, position in enumerate(positions) if position[0] % SPLIT_STEP == 0]
+        split['files'].append([files[j] if numerics is None else numerics[j] for j in keep])
+        split['positions'].append([positions[j] for j in keep])
+    return basic, split
+
+
+def reference_update_values(json_data, field, values):
+    """Writes values into a copy of json_data by searching the position array for every sample, as the
+    DatasetScaler did before the PositionIndex was introduced"""
+    json_data = copy.deepcopy(json_data)
+    names = json_data['names']
+    positions = json_data['positions']
+    for set_idx in values:
+        for name in values[set_idx]:
+            name_index = names.index(name)
+            index = None
+            for i, position in zip(range(len(positions[name_index])), positions[name_index]):
+                if position[0] == set_idx:
+                    index = i
+                    break
+            if index is None:
+                continue
+            json_data[field][name_index][index] = values[set_idx][name]
+    return json_data
+
+
+def reference_trainid_entry(json_data, seg_name, folder_name, suffix):
+    """Creates the entry of the converted segmentation images element by element, as the TrainIDConverter did before
+    get_trainid_entry was introduced"""
+    new_entry = {}
+    original_seg_index = json_data['names'].index(seg_name)
+    new_entry['names'] = seg_name + suffix
+    for key in ('types', 'positions', 'numerical_values', 'filters', 'files', 'folders'):
+        if key not in json_data:
+            continue
+        old_entry = json_data[key][original_seg_index]
+        if type(old_entry) == list:
+            new_entry[key] = old_entry.copy()
+        elif key == 'filters':
+            new_entry[key] = [old_entry]
+        else:
+            new_entry[key] = old_entry
+    if 'filters' in new_entry:
+        new_entry['filters'].append(folder_name)
+    for i in range(len(new_entry['files'])):
+        new_entry['files'][i] = os.path.join(folder_name, new_entry['files'][i])
+    for i in range(len(new_entry['folders'])):
+        new_entry['folders'][i] = os.path.join(folder_name, new_entry['folders'][i])
+    return new_entry
+
+
+def check(num_samples):
+    """
+    Compares the json updates of the DatasetScaler and the TrainIDConverter with the reference implementations
+
+    :param num_samples: number of samples in the synthetic basic_files.json
+    :return: time in seconds of the reference implementation and of the new implementation, True if all results are
+        equal
+    """
+    basic, split = create_json_data(num_samples)
+    # scaled camera intrinsics of every sample, with different values for every sample
+    camera_intrinsics = {i: {name: [[i / 2.0, 0.0, 304.8, 0.0], [0.0, i / 2.0, 86.45, 0.0], [0.0, 0.0, 1.0, 0.0],
+                                    [0.0, 0.0, 0.0, 1.0]] for name in CAMERA_KEYS} for i in range(num_samples)}
+    equal = True
+    reference_time = 0.0
+    new_time = 0.0
+    for json_data, field in ((basic, 'numerical_values'), (split, 'files')):
+        start = time.perf_counter()
+        reference = reference_update_values(json_data, field, camera_intrinsics)
+        reference_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = pi.PositionIndex(json_data).update_values(json_data, field, camera_intrinsics)
+        new_time += time.perf_counter() - start
+        equal = equal and result == reference
+
+    folder_name, suffix = tc.get_output_names('check')
+    for json_data in (basic, split):
+        for seg_name in SEGMENTATION_KEYS:
+            start = time.perf_counter()
+            reference = reference_trainid_entry(json_data, seg_name, folder_name, suffix)
+            reference_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = tc.get_trainid_entry(json_data, seg_name, folder_name, suffix)
+            new_time += time.perf_counter() - start
+            equal = equal and result == reference
+    return reference_time, new_time, equal
+
+
+if __name__ == '__main__':
+    # Checks that the json updates of the DatasetScaler and the TrainIDConverter give the same result as the previous
+    # implementation and measures both, e.g.
+    #   python json_update_check.py 1000 10000
+    # Exits with an error code if any result differs.
+    parser = argparse.ArgumentParser(description='Checks and measures the json updates of the DatasetScaler and the '
+                                                 'TrainIDConverter')
+    parser.add_argument('sizes', nargs='*', type=int, default=NUM_SAMPLES,
+                        help='numbers of samples in the synthetic basic_files.json')
+    options = parser.parse_args()
+    results = [(size, ) + check(size) for size in options.sizes]
+    print('{:>12} {:>16} {:>12} {:>8}'.format('samples', 'reference [s]', 'new [s]', 'equal'))
+    for size, reference_time, new_time, equal in results:
+        print('{:>12} {:>16.3f} {:>12.3f} {:>8}'.format(size, reference_time, new_time, str(equal)))
+    if not all(equal for _, _, _, equal in results):
+        sys.exit(1)
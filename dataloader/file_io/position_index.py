@@ -0,0 +1,75 @@
+def get_position_map(position_array):
+    """
+    Returns a dictionary that maps the global index of every position in a position array to its index in the array
+
+    :param position_array: An array built out of 4-tuples in the standard positions format.
+    :return: dictionary {global index: index in position_array}. If a global index appears several times, the first
+        index is used.
+    """
+    position_map = {}
+    for i, position in enumerate(position_array):
+        position_map.setdefault(position[0], i)
+    return position_map
+
+
+class PositionIndex(object):
+    """
+    Finds the entries of a json file in the standard format (basic_files.json or split file) by their global index.
+    The position map of every name is computed once and reused, so looking up all samples takes linear time instead
+    of searching the position array for every sample.
+
+    Since the positions of a dataset do not change when its images are scaled or converted, one PositionIndex can be
+    used for all json files that have been derived from the same json file, e.g. for every scaled version of a
+    dataset.
+    """
+    def __init__(self, json_data):
+        """
+        :param json_data: data of a json file in the standard format
+        """
+        self.names = list(json_data['names'])
+        self.positions = json_data['positions']
+        self.position_maps = {}
+
+    def get_map(self, name):
+        """Returns the position map of a name, see get_position_map"""
+        if name not in self.position_maps:
+            self.position_maps[name] = get_position_map(self.positions[self.names.index(name)])
+        return self.position_maps[name]
+
+    def get_index(self, name, pos_0):
+        """
+        Returns the index of the entry of a name with the global index pos_0
+
+        :param name: name of the entry, e.g. 'camera_intrinsics'
+        :param pos_0: Global position index (first entry of the 4-tuple) to search for
+        :return: index of the entry in the lists of the name. If none is found, None is returned.
+        """
+        return self.get_map(name).get(pos_0)
+
+    def update_values(self, json_data, field, values):
+        """
+        Returns a copy of json_data in which the given values have been written into the lists of the given field.
+        Only the modified lists are copied, json_data itself is not changed.
+
+        :param json_data: data of a json file with the same names and positions as the one of this index
+        :param field: 'numerical_values' for the basic_files.json or 'files' for the split files, in which the numerical
+            values are stored in the 'files' entry
+        :param values: dictionary {global index: {name: value}}, e.g. the camera intrinsics of every sample. Global
+            indices that do not appear in the json file are ignored.
+        :return: the updated copy of json_data
+        """
+        values_by_name = {}
+        for pos_0, sample_values in values.items():
+            for name, value in sample_values.items():
+                values_by_name.setdefault(name, {})[pos_0] = value
+
+        new_json_data = dict(json_data)
+        new_json_data[field] = list(json_data[field])
+        for name, name_values in values_by_name.items():
+            name_index = self.names.index(name)
+            column = list(json_data[field][name_index])
+            for pos_0, index in self.get_map(name).items():
+                if pos_0 in name_values:
+                    column[index] = name_values[pos_0]
+            new_json_data[field][name_index] = column
+        return new_json_data
@@ -0,0 +1,125 @@
+import os
+import argparse
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import dataloader.file_io.get_path as gp
+import dataloader.file_io.filelist_creator as fc
+import dataloader.file_io.split_creator as sc
+import dataloader.file_io.dataset_index as di
+
+STEPS = ('index', 'splits', 'parameters')
+
+
+def get_available_datasets():
+    """Returns the supported datasets whose folder exists in the data path"""
+    data_path = gp.GetPath().get_data_path()
+    return [dataset for dataset in fc.SUPPORTED_DATASETS if os.path.isdir(os.path.join(data_path, dataset))]
+
+
+def prepare_dataset(dataset, splits=None, rewrite=True, incremental=False, collect_metadata=False,
+                    binary_index=False):
+    """
+    Performs all preparation steps of a dataset, i.e. creates the basic_files.json, the split files and the
+    parameters.json, as described in example/cityscapes_preparation_example.py
+
+    :param dataset: name of the dataset folder
+    :param splits: list of split names for datasets with several splits (e.g. kitti), None for all splits
+    :param rewrite: if False, an existing and valid basic_files.json is kept
+    :param incremental: if True, only the folders that have changed since the last run are listed again
+    :param collect_metadata: if True, the basic_files_metadata.json is created as well
+    :param binary_index: if True, binary index files are written next to the json files
+    :return: dictionary {step: time in seconds}
+    """
+    timings = {}
+    start = time.perf_counter()
+    data_creator = fc.DatasetCreator(dataset, rewrite=rewrite, collect_metadata=collect_metadata,
+                                     incremental=incremental, binary_index=binary_index)
+    if not data_creator.check_state():
+        data_creator.create_dataset()
+    timings['index'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data_splitter = sc.DatasetSplitter(dataset, splits, binary_index=binary_index)
+    data_splitter.create_splits()
+    timings['splits'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if dataset in di.dataset_index:
+        di.create_parameter_files(dataset)
+    else:
+        print('{}: no parameters defined in the dataset_index'.format(dataset))
+    timings['parameters'] = time.perf_counter() - start
+    return timings
+
+
+def _prepare_dataset_worker(dataset, options):
+    """Runs prepare_dataset and returns the error message instead of raising it, so that one broken dataset does not
+    stop the preparation of the others"""
+    try:
+        return prepare_dataset(dataset, **options), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def prepare_datasets(datasets=None, num_workers=None, **options):
+    """
+    Prepares several datasets in parallel, one process per dataset. All json files are written atomically, so an
+    interrupted run leaves either the old or the new version of every file.
+
+    :param datasets: list of dataset names from SUPPORTED_DATASETS. Default: all supported datasets that exist in the
+        data path
+    :param num_workers: number of processes. Default: one per dataset, but at most one per CPU
+    :param options: keyword arguments of prepare_dataset, e.g. splits, incremental or binary_index
+    :return: dictionary {dataset: (timings, error)}, see prepare_dataset. error is None if the dataset has been
+        prepared successfully, timings is None otherwise.
+    """
+    if datasets is None:
+        datasets = get_available_datasets()
+    for dataset in datasets:
+        assert dataset in fc.SUPPORTED_DATASETS, '{} is not a supported dataset'.format(dataset)
+    if num_workers is None:
+        num_workers = min(len(datasets), os.cpu_count() or 1)
+    results = {}
+    if not datasets:
+        return results
+
+    # The workers must not be daemonic processes since the metadata collection starts processes of its own
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max(1, num_workers)) as executor:
+        futures = {executor.submit(_prepare_dataset_worker, dataset, options): dataset for dataset in datasets}
+        for i, future in enumerate(as_completed(futures)):
+            dataset = futures[future]
+            timings, error = future.result()
+            results[dataset] = (timings, error)
+            if error is None:
+                details = ', '.join('{} {:.1f} s'.format(step, timings[step]) for step in STEPS)
+                print('[{}/{}] {}: OK ({})'.format(i + 1, len(datasets), dataset, details), flush=True)
+            else:
+                print('[{}/{}] {}: FAILED\n{}'.format(i + 1, len(datasets), dataset, error), flush=True)
+    print('Prepared {} of {} datasets in {:.1f} s'.format(sum(error is None for _, error in results.values()),
+                                                          len(datasets), time.perf_counter() - start))
+    return results
+
+
+if __name__ == '__main__':
+    # Prepares several datasets at once, e.g.
+    #   python prepare_datasets.py cityscapes kitti --binary-index
+    # If no dataset is passed, all supported datasets that exist in the data path are prepared.
+    parser = argparse.ArgumentParser(description='Prepares the index files of several datasets')
+    parser.add_argument('datasets', nargs='*', help='names of the datasets, default: all available datasets')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only the folders that have changed since the last run are listed again')
+    parser.add_argument('--keep', action='store_true', help='existing and valid basic_files.json files are kept')
+    parser.add_argument('--metadata', action='store_true', help='the image metadata is collected as well')
+    parser.add_argument('--binary-index', action='store_true',
+                        help='binary index files are written next to the json files')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    options = parser.parse_args()
+    results = prepare_datasets(options.datasets or None, num_workers=options.workers, rewrite=not options.keep,
+                               incremental=options.incremental, collect_metadata=options.metadata,
+                               binary_index=options.binary_index)
+    if any(error is not None for _, error in results.values()):
+        sys.exit(1)
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = 'progress_manifest.jsonl'
+PROOF_MODES = ('size', 'hash')
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def get_proof(path, proof='size'):
+    """
+    Returns the proof that a file has been written completely
+
+    :param path: absolute path of the file
+    :param proof: 'size' for the file size in bytes or 'hash' for the sha1 hash of the file content
+    """
+    assert proof in PROOF_MODES, 'proof must be one of {}'.format(PROOF_MODES)
+    if proof == 'size':
+        return os.path.getsize(path)
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def get_proofs(base_path, files, proof='size'):
+    """
+    Returns the proofs of several files
+
+    :param base_path: folder to which the file paths are relative
+    :param files: list of file paths relative to base_path
+    :param proof: 'size' or 'hash', see get_proof
+    :return: dictionary {file: proof}
+    """
+    return {file: get_proof(os.path.join(base_path, file), proof) for file in files}
+
+
+def print_progress(iterator):
+    """Passes the elements of an iterator through and prints a dot for every element, 100 dots per line"""
+    for i, elem in enumerate(iterator):
+        if i % 100 == 0:
+            print('', flush=True)
+
+        print('.', end='')
+
+        yield elem
+
+
+def write_atomic(path, write_function, binary=False):
+    """
+    Writes a file through a temporary file that is moved into place once it is complete, so that an interrupted run
+    never leaves a truncated file behind
+
+    :param path: path of the file
+    :param write_function: function that writes the content into the file object it is called with
+    :param binary: if True, the file is opened in binary mode
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb' if binary else 'w') as fp:
+        write_function(fp)
+    os.replace(temp_path, path)
+
+
+def write_json_atomic(path, json_data, **kwargs):
+    """
+    Writes a json file through a temporary file, see write_atomic
+
+    :param path: path of the json file
+    :param json_data: json serializable data
+    :param kwargs: passed to json.dump, e.g. indent
+    """
+    write_atomic(path, lambda fp: json.dump(json_data, fp, **kwargs))
+
+
+class ProgressManifest(object):
+    """
+    Records which items of a long running job (e.g. the samples of a DatasetScaler run) have been completed, so that
+    the job can be resumed after it has been killed. Every completed item is appended as one json line together with
+    the size or the hash of its output files and optional data that is needed at the end of the job, e.g. scaled
+    camera intrinsics. The first line describes the job, a manifest that belongs to a different job is not resumed.
+    """
+    def __init__(self, path, task, proof='size'):
+        """
+        :param path: path of the manifest file
+        :param task: json serializable dictionary that describes the job, e.g. the dataset and the output size
+        :param proof: 'size' or 'hash', see get_proof
+        """
+        assert proof in PROOF_MODES, 'proof must be one of {}'.format(PROOF_MODES)
+        self.path = path
+        self.task = task
+        self.proof = proof
+        self.items = {}
+        if not os.path.isfile(path) or not self._load():
+            # the header is written atomically, so a manifest always starts with a complete header
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, lambda fp: fp.write(json.dumps({'task': task, 'proof': proof}) + '\n'))
+        self.fp = open(path, 'a')
+
+    def _load(self):
+        """Loads the recorded items, returns False if the manifest does not even contain a complete header"""
+        with open(self.path, 'rb') as fp:
+            content = fp.read()
+        # the last line is incomplete if the job has been killed while writing it. It is cut off, so that the next
+        # item is not appended to it.
+        complete_length = content.rfind(b'\n') + 1
+        if complete_length < len(content):
+            with open(self.path, 'r+b') as fp:
+                fp.truncate(complete_length)
+        lines = content[:complete_length].decode('utf-8').splitlines()
+        if not lines:
+            return False
+        header = json.loads(lines[0])
+        if header['task'] != json.loads(json.dumps(self.task)) or header['proof'] != self.proof:
+            raise Exception('The manifest {} belongs to a different job: {}. Delete it to start again.'
+                            .format(self.path, header))
+        for line in lines[1:]:
+            entry = json.loads(line)
+            self.items[entry['item']] = (entry['files'], entry['data'])
+        return True
+
+    def completed_items(self, base_path):
+        """
+        Returns the items whose output files still exist and have the recorded size or hash
+
+        :param base_path: folder to which the recorded file paths are relative
+        :return: dictionary {item: data}
+        """
+        completed = {}
+        for item, (files, data) in self.items.items():
+            try:
+                if all(get_proof(os.path.join(base_path, file), self.proof) == value for file, value in files.items()):
+                    completed[item] = data
+            except OSError:
+                continue
+        return completed
+
+    def add(self, item, files, data=None):
+        """
+        Records a completed item
+
+        :param item: json serializable id of the item, e.g. the global index of a sample
+        :param files: dictionary {file: proof} of the output files of the item, see get_proofs
+        :param data: json serializable data that is returned by completed_items when the job is resumed
+        """
+        self.items[item] = (files, data)
+        self.fp.write(json.dumps({'item': item, 'files': files, 'data': data}) + '\n')
+        self.fp.flush()
+
+    def remove(self):
+        """Deletes the manifest once the job has been finished"""
+        self.fp.close()
+        os.remove(self.path)
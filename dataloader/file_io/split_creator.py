@@ -1,6 +1,5 @@
 import os
 import sys
-import json
 import random
 import pandas as pd
 from PIL import Image
@@ -8,11 +7,84 @@ import scipy.io as sio
 
 import dataloader.file_io.dir_lister as dl
 import dataloader.file_io.get_path as gp
+import dataloader.file_io.image_metadata as im
+import dataloader.file_io.binary_index as bi
+import dataloader.file_io.progress_manifest as pm
 
 SUPPORTED_DATASETS = ('cityscapes', 'cityscapes_video', 'cityscapes_sequence', 'cityscapes_extra', 'cityscapes_part',
                       'kitti', 'kitti_2012', 'kitti_2015', 'virtual_kitti', 'mapillary', 'mapillary_by_ID', 'gta5',
                       'synthia', 'bdd100k', 'voc2012', 'a2d2', 'lostandfound', 'camvid', 'make3d')
 
+
+def get_first_indices(items):
+    """Returns a dictionary that maps every item of a list to the index of its first occurrence, i.e. the result of
+    items.index(item), so that the index of an item can be looked up in constant time
+
+    :param items: list of hashable items, e.g. file paths
+    """
+    first_indices = {}
+    for i, item in enumerate(items):
+        first_indices.setdefault(item, i)
+    return first_indices
+
+
+def get_substring_matches(items, substrings):
+    """Returns for every substring the indices of all items that contain it, i.e. the result of
+    [i for i, item in enumerate(items) if substring in item] for all substrings. Instead of searching every substring
+    in every item, all windows of an item that have the length of one of the substrings are looked up in a set, so the
+    time is linear in the number of items.
+
+    :param items: list of strings, e.g. file paths
+    :param substrings: list of strings, e.g. the lines of a split file
+    :return: dictionary {substring: list of item indices in ascending order}
+    """
+    lengths = sorted(set(len(substring) for substring in substrings))
+    substrings = set(substrings)
+    matches = {substring: [] for substring in substrings}
+    for i, item in enumerate(items):
+        found = set()
+        for length in lengths:
+            for start in range(len(item) - length + 1):
+                window = item[start:start + length]
+                if window in substrings:
+                    found.add(window)
+        for substring in found:
+            matches[substring].append(i)
+    return matches
+
+
+def get_folder_matches(items, folders):
+    """Returns for every folder the indices of all items that lie in it, i.e. the items that
+    DirLister.include_files_by_folder(items, folder, positions) keeps, for all folders at once. An item lies in a folder
+    if the folder name is followed by a path separator somewhere in the item or if it equals the file name. Only the
+    windows of an item that end in front of a path separator are looked up, so the time is linear in the number of
+    items.
+
+    :param items: list of file paths
+    :param folders: list of folder paths
+    :return: dictionary {folder: list of item indices in ascending order}
+    """
+    lengths = sorted(set(len(folder) for folder in folders))
+    folders = set(folders)
+    matches = {folder: [] for folder in folders}
+    for i, item in enumerate(items):
+        found = set()
+        end = item.find(os.sep)
+        while end >= 0:
+            for length in lengths:
+                if length > end:
+                    break
+                if item[end - length:end] in folders:
+                    found.add(item[end - length:end])
+            end = item.find(os.sep, end + 1)
+        file_name = os.path.split(item)[1]
+        if file_name in folders:
+            found.add(file_name)
+        for folder in found:
+            matches[folder].append(i)
+    return matches
+
+
 class SplitCreator:
     """Class to create the train, validation and test splits for the single datasets.
 
@@ -42,10 +114,10 @@ class SplitCreator:
         self.new_json_data = {}
 
     def get_all_items(self):
-        """Read the json data which is stored in the basic_files.json inside the dataset folder. """
+        """Read the json data which is stored in the basic_files.json inside the dataset folder. If there is an up to
+        date binary index basic_files.idx, it is read instead. """
         json_file = os.path.join(self.dataset_folder_path, self.filename)
-        with open(json_file) as file:
-            self.json_data = json.load(file)
+        self.json_data = bi.load_index(json_file)
 
     def set_split_path(self, split=None):
         """Define a path to the split folder where the split information is stored.
@@ -151,7 +223,8 @@ class SplitCreator:
                 # If numeric values are already added, save them, otherwise save the filename
                 if numeric is not None:
                     filter_files, new_position = dl.DirLister.include_files_by_folder(file, filter_split, position)
-                    new_item = [numeric[file.index(f)] for f in filter_files]
+                    first_indices = get_first_indices(file)
+                    new_item = [numeric[first_indices[f]] for f in filter_files]
                 else:
                     new_item, new_position = dl.DirLister.include_files_by_folder(file, filter_split, position)
 
@@ -190,6 +263,13 @@ class SplitCreator:
             elif 'val' in s:
                 splits.append('validation')
 
+        # the paths without the top folder and their indices are the same for all split subsets
+        columns = []
+        for file in files:
+            bottom = file[0].split(os.path.sep)[0]
+            file = [os.path.join(*(f.split(os.path.sep)[1:])) for f in file]
+            columns.append((bottom, file, get_first_indices(file)))
+
         for split, split_file in zip(splits, split_files):
             split_file = os.path.join(split_folder, split_file)
             files_to_keep = pd.read_csv(split_file, header=None)[0].values
@@ -205,28 +285,25 @@ class SplitCreator:
             new_items = []
             new_positions = []
 
-            for file, folder, position, numeric in zip(files, folders, positions, numerics):
-                bottom = file[0].split(os.path.sep)[0]
-                file = [os.path.join(*(f.split(os.path.sep)[1:])) for f in file]
+            for (bottom, file, first_indices), folder, position, numeric in zip(columns, folders, positions,
+                                                                                 numerics):
                 new_item = []
                 new_position = []
                 # go through all the files which are supposed to be kept
                 for f in files_to_keep:
-                    if f in file:
-                        # if numeric values are present save them, otherwise save the filename
-                        if numeric is not None:
-                            new_item.append(numeric[file.index(f)])
-                        else:
-                            new_item.append(os.path.join(bottom, f))
-                        new_position.append(position[file.index(f)])
-                    elif f.replace('image_02', 'image_03') in file:
+                    index = first_indices.get(f)
+                    if index is None:
                         # sometimes the stereo images are saved at a slightly different path not
                         # indicated by the folder
-                        if numeric is not None:
-                            new_item.append(numeric[file.index(f.replace('image_02', 'image_03'))])
-                        else:
-                            new_item.append(os.path.join(bottom, f.replace('image_02', 'image_03')))
-                        new_position.append(position[file.index(f.replace('image_02', 'image_03'))])
+                        index = first_indices.get(f.replace('image_02', 'image_03'))
+                        if index is None:
+                            continue
+                    # if numeric values are present save them, otherwise save the filename
+                    if numeric is not None:
+                        new_item.append(numeric[index])
+                    else:
+                        new_item.append(os.path.join(bottom, file[index]))
+                    new_position.append(position[index])
                 # get the new folder names for the split
                 if numeric is not None:
                     new_folder = [os.path.split(f)[0] for f in file]
@@ -327,19 +404,18 @@ class SplitCreator:
                 continue
             path = os.path.join(self.dataset_folder_path, path_to_split_info, filter + '.txt')
             with open(path) as textfile:
-                split_files = textfile.readlines()
+                split_files = [split_file[:-1] for split_file in textfile.readlines()]
             for folder, file, position, numeric in zip(folders, files, positions, numerics):
                 new_item = []
                 new_position = []
+                matches = get_substring_matches(file, split_files)
                 for split_file in split_files:
-                    split_file = split_file[:-1]
-                    matching_files = [f for f in file if split_file in f]
-                    if len(matching_files) == 0:
+                    matching_indices = matches[split_file]
+                    if len(matching_indices) == 0:
                         continue
-                    assert len(matching_files) == 1, 'The file name {0} is not unique'.format(split_file)
-                    matching_file = matching_files[0]
-                    index = file.index(matching_file)
-                    new_item.append(matching_file)
+                    assert len(matching_indices) == 1, 'The file name {0} is not unique'.format(split_file)
+                    index = matching_indices[0]
+                    new_item.append(file[index])
                     new_position.append(position[index])
                 new_items.append(new_item)
                 new_positions.append(new_position)
@@ -377,6 +453,7 @@ class SplitCreator:
         split_index = 0
         split = splits[split_index]
         num_folders = 0
+        folder_indices = get_first_indices(folders[0])
 
         # Map folders randomly to the splits
         while pop_folders != []:
@@ -386,7 +463,7 @@ class SplitCreator:
                 num_folders = 0
             pop_index = random.randint(0, len(pop_folders) - 1)
             pop_folder = pop_folders.pop(pop_index)
-            global_index = folders[0].index(pop_folder)
+            global_index = folder_indices[pop_folder]
             num_folders += 1
             for i, name in zip(range(len(names)), names):
                 if name not in split_folders[split]:
@@ -416,15 +493,14 @@ class SplitCreator:
             for name, folder, file, position, numeric in zip(names, folders, files, positions, numerics):
                 # Take only the folders and files which belong to the current split
                 new_folder = sorted(split_folders[split][name])
-                filter_files = []
-                new_position = []
-                for f in new_folder:
-                    ff, np = dl.DirLister.include_files_by_folder(file, f, position)
-                    filter_files.extend(ff)
-                    new_position.extend(np)
+                folder_matches = get_folder_matches(file, new_folder)
+                indices = [i for f in new_folder for i in folder_matches[f]]
+                filter_files = [file[i] for i in indices]
+                new_position = [position[i] for i in indices]
                 # If numerical values are already added, save them, otherwise save the filename
                 if numeric is not None:
-                    new_item = [numeric[file.index(f)] for f in filter_files]
+                    first_indices = get_first_indices(file)
+                    new_item = [numeric[first_indices[f]] for f in filter_files]
                 else:
                     new_item = filter_files
 
@@ -438,10 +514,12 @@ class SplitCreator:
             new_data.update({'positions': new_positions})
             self.new_json_data.update({split: new_data})
 
-    def dump_to_json(self):
+    def dump_to_json(self, binary=False):
         """Dumps each split to a json file.
 
          The name of the split file is set automatically as the name of the split, e.g. train.json
+
+         :param binary: if True, a binary index is written next to every json file, e.g. train.idx
          """
         if not os.path.exists(self.output_path):
             print('Output path does not exits!')
@@ -449,8 +527,10 @@ class SplitCreator:
             os.makedirs(self.output_path)
 
         for split in self.new_json_data.keys():
-            with open(os.path.join(self.output_path, split + '.json'), 'w') as fp:
-                json.dump(self.new_json_data[split], fp)
+            split_path = os.path.join(self.output_path, split + '.json')
+            pm.write_json_atomic(split_path, self.new_json_data[split])
+            if binary:
+                bi.dump_index(os.path.join(self.output_path, split + bi.BINARY_SUFFIX), self.new_json_data[split])
 
     def filter_by_resolution(self, resolution):
         """Filter files by minimal resolutions that the image files have to have
@@ -459,6 +539,10 @@ class SplitCreator:
             in the filter, set the corresponding dimension to 0.
         """
         splits = ['validation', 'test', 'train']
+        # Use the stored image sizes if the metadata has been collected with the dataset index
+        metadata = None
+        if im.ImageMetadata.exists(self.dataset_folder_path):
+            metadata = im.ImageMetadata(self.dataset_folder_path)
         for split in splits:
             print('Filtering split: {}'.format(split))
             folders = self.new_json_data[split]['folders']
@@ -476,13 +560,19 @@ class SplitCreator:
             # Load color images one-by-one and check resolution. If resolution is sufficient, add its index to
             # indices_to_keep
             indices_to_keep = []
-            for file, index in zip(files[color_folder], positions[color_folder]):
-                img = Image.open(os.path.join(self.dataset_folder_path, file))
+            if metadata is not None:
+                sizes = metadata.sizes(files[color_folder])
+            for i, (file, index) in enumerate(zip(files[color_folder], positions[color_folder])):
+                if metadata is not None:
+                    height, width = sizes[i]
+                else:
+                    img = Image.open(os.path.join(self.dataset_folder_path, file))
+                    height, width = img.height, img.width
                 if resolution[0] > 0:
-                    if resolution[0] > img.height:
+                    if resolution[0] > height:
                         continue
                 if resolution[1] > 0:
-                    if resolution[1] > img.width:
+                    if resolution[1] > width:
                         continue
                 indices_to_keep.append(index)
             indices = indices_to_keep
@@ -525,12 +615,13 @@ class SplitCreator:
 class DatasetSplitter:
     """Class to create the train, validation and test split filelists for different datasets"""
 
-    def __init__(self, dataset, splits=None):
+    def __init__(self, dataset, splits=None, binary_index=False):
         """Initializes the dataset name and split
 
         :param dataset: Name of the dataset (without any suffixes for the split name)
         :param splits: List of split names as suffixes for the dataset name. Only for dataset with different split
             options.
+        :param binary_index: if True, a binary index is written next to every split file
         """
         assert dataset in SUPPORTED_DATASETS, 'Dataset not supported'
         # This dictionary contains a mapping from the dataset name to the corresponding function that has to be
@@ -559,6 +650,7 @@ class DatasetSplitter:
                           'make3d': (self._create_make3d_splits, None),
                           }
         self.dataset = dataset
+        self.binary_index = binary_index
 
     def create_splits(self):
         """Creates the train, validation and test json-files for the dataset in all given splits"""
@@ -582,13 +674,19 @@ class DatasetSplitter:
             for split in splits:
                 assert split in SPLITS
 
+        json_data = None
         for split in splits:
             print(split)
             split_creator = SplitCreator(self.dataset)
-            split_creator.get_all_items()
+            # the basic_files.json is only read once for all splits
+            if json_data is None:
+                split_creator.get_all_items()
+                json_data = split_creator.json_data
+            else:
+                split_creator.json_data = json_data
             split_creator.set_split_path(split)
             split_creator.get_split_data(read_mode='kittifiles')
-            split_creator.dump_to_json()
+            split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_kitti2012_splits(self):
         """This method creates the split files for the KITTI 2012 dataset"""
@@ -597,7 +695,7 @@ class DatasetSplitter:
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders', val_equal_test=True, train_filter='training',
                                      test_filter='testing')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_kitti2015_splits(self):
         """This method creates the split files for the KITTI 2015 dataset"""
@@ -606,7 +704,7 @@ class DatasetSplitter:
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders', val_equal_test=True, train_filter='training',
                                      test_filter='testing')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_cityscapes_splits(self, dataset):
         """This method creates the splits for the Cityscapes dataset"""
@@ -617,7 +715,7 @@ class DatasetSplitter:
             split_creator.get_split_data(read_mode='folders', train_filter='train_extra', val_filter='val')
         else:
             split_creator.get_split_data(read_mode='folders', val_filter='val')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_virtual_kitti_splits(self):
         """This method creates all kitti split files"""
@@ -626,7 +724,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path(split)
         split_creator.get_split_data(read_mode='alltrain')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
         splits = ['clone_split']
         for split in splits:
@@ -634,7 +732,7 @@ class DatasetSplitter:
             split_creator.get_all_items()
             split_creator.set_split_path(split)
             split_creator.get_split_data(read_mode='folders', train_filter='clone')
-            split_creator.dump_to_json()
+            split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_mapillary_splits(self):
         """This method creates the splits for the Mapillary dataset"""
@@ -650,7 +748,7 @@ class DatasetSplitter:
             split_creator.get_split_data(read_mode='folders')
             if res is not None:
                 split_creator.filter_by_resolution(res)
-            split_creator.dump_to_json()
+            split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_gta5_splits(self):
         """This method creates the splits for the GTA5 dataset"""
@@ -658,14 +756,14 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='matfile')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
         # Also create a full split with all files being categorized as train
         split_creator = SplitCreator(self.dataset)
         split_creator.get_all_items()
         split_creator.set_split_path('full_split')
         split_creator.get_split_data(read_mode='alltrain')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_synthia_splits(self):
         """This method creates the splits for the Snythia dataset"""
@@ -673,7 +771,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='alltrain')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_bdd100k_splits(self):
         """This method creates the splits for the BDD100K dataset"""
@@ -682,7 +780,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders', val_filter='val')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_voc2012_splits(self):
         """This method creates the splits for the voc2012 dataset"""
@@ -691,7 +789,7 @@ class DatasetSplitter:
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='textfile', path_to_split_info=os.path.join('ImageSets', 'Segmentation'),
                                      train_filter='trainaug', val_filter='val', test_filter=None)
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_a2d2_splits(self, split_name):
         """This method creates the splits for the a2d2 dataset"""
@@ -705,7 +803,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path(split_name)
         split_creator.get_split_data(read_mode='random_folders', rand_split=sizes, rand_seed=seed)
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
         split_creator.save_split_folders(mode='same_root')
 
     def _create_lostandfound_splits(self):
@@ -714,7 +812,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_camvid_splits(self):
         """This method creates the splits for the BDD100K dataset"""
@@ -722,7 +820,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders', val_filter='val')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
     def _create_make3d_splits(self):
         """This method creates the splits for the make3d dataset"""
@@ -730,7 +828,7 @@ class DatasetSplitter:
         split_creator.get_all_items()
         split_creator.set_split_path()
         split_creator.get_split_data(read_mode='folders')
-        split_creator.dump_to_json()
+        split_creator.dump_to_json(binary=self.binary_index)
 
 
 if __name__ == '__main__':
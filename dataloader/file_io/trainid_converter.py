@@ -1,14 +1,13 @@
 import os
 import sys
 import json
+import hashlib
 import cv2
-import torchvision.transforms as transforms
-import PIL.Image as pil
 import numpy as np
 from multiprocessing import Pool
 
 import dataloader.file_io.get_path as gp
-import dataloader.pt_data_loader.mytransforms as mytransforms
+import dataloader.file_io.progress_manifest as pm
 import dataloader.definitions.labels_file as lf
 
 SEGMENTATION_KEYS = ('segmentation', 'segmentation_right')
@@ -18,7 +17,9 @@ BASIC_FILES_KEYS = ('names', 'types', 'filters', 'folders', 'files', 'positions'
 TVT_KEYS = ('names', 'types', 'folders', 'files', 'positions')
 JSON_NAMES = {'basic_files': 'basic_files.json', 'train': 'train.json', 'validation': 'validation.json',
               'test': 'test.json'}
-NUM_WORKERS = 4
+NUM_WORKERS = os.cpu_count() or 1
+# Images with an integer dtype of at most this many bytes are converted with a dense lookup table
+MAX_TABLE_BYTES = 2
 
 
 def insert_into_json_dict(json_dict, items, pos=None):
@@ -58,12 +59,150 @@ def remove_from_json_dict(json_dict, pos=None, name=None):
     return json_dict
 
 
+def get_trainid_entry(json_dict, seg_name, folder_name, suffix):
+    """
+    Returns the entry of the converted images of a segmentation entry, with the paths pointing into the folder of the
+    converted images
+
+    :param json_dict: dict that has the standard format for dataset json files (basic_files.json or split file)
+    :param seg_name: name of the segmentation entry, e.g. 'segmentation'
+    :param folder_name: folder of the converted images, see get_output_names
+    :param suffix: suffix of the new entry name, see get_output_names
+    :return: dictionary containing an item for every key in json_dict, see insert_into_json_dict
+    """
+    original_seg_index = json_dict['names'].index(seg_name)
+    new_entry = {}
+    for key in json_dict:
+        old_entry = json_dict[key][original_seg_index]
+        if key == 'names':
+            new_entry[key] = seg_name + suffix
+        elif key in ('files', 'folders'):
+            new_entry[key] = [os.path.join(folder_name, old_path) for old_path in old_entry]
+        elif key == 'filters':
+            new_entry[key] = (old_entry.copy() if type(old_entry) == list else [old_entry]) + [folder_name]
+        elif type(old_entry) == list:
+            new_entry[key] = old_entry.copy()
+        else:
+            new_entry[key] = old_entry
+    return new_entry
+
+
+def get_output_names(label_set_name=None):
+    """
+    Returns the folder name and the suffix of the json entries of the images that are converted with a label definition
+
+    :param label_set_name: name of the label definition, None if only one definition is converted
+    :return: folder name and json suffix, e.g. ('segmentation_trainid_ign', '_trainid_ign') for the name 'ign'
+    """
+    if label_set_name is None:
+        return NEW_FOLDER_NAME, '_trainid'
+    return NEW_FOLDER_NAME + '_' + label_set_name, '_trainid_' + label_set_name
+
+
+def get_unique_colors(image):
+    """
+    Returns the colors that appear in a BGR image as loaded by cv2
+
+    :param image: array of shape (H, W, 3)
+    :return: - array of shape (N, 3) with the N different RGB colors of the image
+             - array of shape (H, W) with the index of the color of every pixel
+    """
+    if (image.ndim != 3) or (image.shape[2] != 3):
+        raise ValueError('Mode "fromrgb" expects the input image to have shape (H, W, 3)')
+    codes = (image[..., 2].astype(np.int32) << 16) | (image[..., 1].astype(np.int32) << 8) | image[..., 0]
+    codes, inverse = np.unique(codes, return_inverse=True)
+    colors = np.stack(((codes >> 16) & 255, (codes >> 8) & 255, codes & 255), 1)
+    return colors, inverse.reshape(image.shape[:2])
+
+
+class TrainIDLookup(object):
+    """
+    Converts segmentation images to train_ids in the same way as mytransforms.ConvertSegmentation, i.e. every pixel gets
+    the train_id of the label with the nearest id or color. Instead of comparing every pixel with every label, the
+    train_id of every possible id is computed once and stored in a lookup table. For colors, the train_ids are only
+    computed for the colors that appear in the image, see get_unique_colors.
+    """
+    def __init__(self, labels, labels_mode):
+        """
+        :param labels: labels from the definitions file
+        :param labels_mode: 'fromid', 'fromtrainid', 'fromrgb' or 'fromid_third_channel', see ConvertSegmentation
+        """
+        if labels_mode not in ('fromid', 'fromtrainid', 'fromrgb', 'fromid_third_channel', None):
+            raise NotImplementedError('Mode is not implemented, please choose one of the following:' +
+                                      ' ("fromid", "fromtrainid", "fromrgb", "fromid_third_channel")')
+        self.mode = labels_mode
+        self.train_ids = np.array(tuple(l.trainId for l in labels))
+        self.colors = np.array(tuple(l.color for l in labels))
+        self.ids = np.array(tuple(l.id for l in labels))
+        self.table = None
+        if self.mode in ('fromid', 'fromid_third_channel'):
+            self.table = self._ids_to_train_ids(np.arange(1 << (8 * MAX_TABLE_BYTES)))
+
+    def _ids_to_train_ids(self, values):
+        """Returns the train_ids of the labels whose id is nearest to the given values"""
+        idx = np.argmin(np.abs(np.expand_dims(values, 1) - self.ids), 1)
+        return self.train_ids[idx].astype(np.uint8)
+
+    def _colors_to_train_ids(self, colors):
+        """Returns the train_ids of the labels whose color is nearest to the given RGB colors"""
+        idx = np.argmin(np.sum(np.abs(np.expand_dims(colors, 1) - self.colors), 2), 1)
+        return self.train_ids[idx].astype(np.uint8)
+
+    def __call__(self, image, unique_colors=None):
+        """
+        Converts a segmentation image
+
+        :param image: image as loaded by cv2.imread(path, -1)
+        :param unique_colors: result of get_unique_colors(image), if it has already been computed (mode 'fromrgb')
+        :return: the image of train_ids as uint8 array, or the unchanged image for the mode 'fromtrainid'
+        """
+        if (self.mode is None) or (self.mode == 'fromtrainid'):
+            return image
+
+        if self.mode == 'fromrgb':
+            colors, inverse = get_unique_colors(image) if unique_colors is None else unique_colors
+            return self._colors_to_train_ids(colors)[inverse]
+
+        if self.mode == 'fromid_third_channel':
+            image = image[..., 2]
+        if image.ndim != 2:
+            raise ValueError('Mode "fromid" expects the input image to have shape (H, W)')
+        if image.dtype.kind == 'u' and image.dtype.itemsize <= MAX_TABLE_BYTES:
+            return self.table[image]
+        values, inverse = np.unique(image, return_inverse=True)
+        return self._ids_to_train_ids(values)[inverse].reshape(image.shape)
+
+
 class TrainIDConverter(object):
-    def __init__(self, dataset, labels, labels_mode, split=None):
+    """
+    Converts the segmentation images of a dataset to train_ids and adds them to the json files. Several label
+    definitions can be converted at once, e.g. both definitions of mapillary:
+
+        TrainIDConverter('mapillary', labels={'def': lf.labels_mapillary_seg_cityscapes_def.getlabels(),
+                                              'ign': lf.labels_mapillary_seg_cityscapes_ign.getlabels()},
+                         labels_mode='fromid')
+
+    Every segmentation image is then loaded only once. The images of every definition are saved in a folder of their
+    own (segmentation_trainid_def, segmentation_trainid_ign) and added to the json files with their own name
+    (e.g. segmentation_trainid_def), see get_output_names.
+    """
+    def __init__(self, dataset, labels, labels_mode, split=None, num_workers=NUM_WORKERS):
+        """
+        :param dataset: name of the dataset
+        :param labels: labels from the definitions file, or a dictionary {name: labels} of several label definitions
+        :param labels_mode: mode by which to read the labels file, see mytransforms.ConvertSegmentation
+        :param split: name of a split folder whose split files are adapted instead of the ones in the dataset folder
+        :param num_workers: number of processes that convert the images
+        """
         self.dataset = dataset
         self.dataset_path = self._gen_dataset_path(dataset)
         self.labels = labels
         self.labels_mode = labels_mode
+        self.num_workers = num_workers
+        label_sets = labels if isinstance(labels, dict) else {None: labels}
+        # one tuple (name, folder name, json suffix, lookup) per label definition
+        self.outputs = [(name, ) + get_output_names(name) + (TrainIDLookup(label_set, labels_mode), )
+                        for name, label_set in label_sets.items()]
         if split is not None:
             self.split_path = self.dataset_path + '_' + split
         else:
@@ -109,11 +248,11 @@ class TrainIDConverter(object):
 
     def _load_sample(self, si):
         """
-        Loads the specified sample.
+        Loads the segmentation images of the specified sample.
 
-        :param si: dict of the form {global_index: {"color": path, "depth": path, ...}}
+        :param si: dict of the form {global_index: {"segmentation": path, ...}}
         :return: - the global index of the sample in the dataset
-                 - the sample in the standard dataloader format
+                 - dictionary {segmentation_key: image as loaded by cv2}
                  - a path dictionary that is built similar to the sample dictionary and contains the image path instead of
                    an image object
         """
@@ -131,15 +270,8 @@ class TrainIDConverter(object):
             filepath = filepath.replace('/', os.sep)
             filepath = filepath.replace('\\', os.sep)
             image = cv2.imread(filepath, -1)
-            new_sample[key, 0, 0] = image
-            paths[key, 0, 0] = content
-
-        # By using the transform ConvertSegmentation, the segmentation images will be converted to the train_id format
-        load_transforms = transforms.Compose([
-            mytransforms.LoadSegmentation(),
-            mytransforms.ConvertSegmentation(labels=self.labels, labels_mode=self.labels_mode)
-        ])
-        new_sample = load_transforms(new_sample)
+            new_sample[key] = image
+            paths[key] = content
 
         return set_idx, new_sample, paths
 
@@ -147,27 +279,48 @@ class TrainIDConverter(object):
         """
         Brings the image in the right format to be saved.
 
-        :param image: PIL image
+        :param image: PIL image or numpy array
         :param path: path of the destination directory
         """
 
         image = np.array(image, dtype=np.uint8)
         cv2.imwrite(path, image)
 
-    def _get_samples(self, pool):
+    def _convert_sample(self, args):
+        """
+        Loads the segmentation images of one sample in a worker process and converts and saves them with every label
+        definition
+
+        :param args: tuple (si, proof) with
+            - si: tuple (global_index, sample) as passed to _load_sample
+            - proof: 'size' or 'hash', the kind of proof that is returned for the written files
+        :return: - the global index of the sample in the dataset
+                 - list of the converted segmentation keys
+                 - list with one dictionary {path relative to the output folder: proof} of the written files per label
+                   definition, in the order of self.outputs
+        """
+        si, proof = args
+        set_idx, sample, paths = self._load_sample(si)
+        # The colors of an image are only determined once for all label definitions
+        unique_colors = {}
+        if self.labels_mode == 'fromrgb':
+            unique_colors = {key: get_unique_colors(image) for key, image in sample.items()}
+
+        files = []
+        for _, folder_name, _, lookup in self.outputs:
+            new_path = os.path.join(self.dataset_path, folder_name)
+            for key, image in sample.items():
+                new_filepath = os.path.join(new_path, paths[key])
+                os.makedirs(os.path.split(new_filepath)[0], exist_ok=True)
+                self._save_image_file(lookup(image, unique_colors.get(key)), new_filepath)
+            files.append(pm.get_proofs(new_path, paths.values(), proof))
+        return set_idx, list(sample), files
+
+    def _get_samples(self):
         json_path = os.path.join(self.dataset_path, JSON_NAMES['basic_files'])
         samples = self._parse_json_file(json_path)
 
-        return pool.imap_unordered(self._load_sample, samples.items())
-
-    def _print_progress(self, iterator):
-        for i, elem in enumerate(iterator):
-            if i % 100 == 0:
-                print('', flush=True)
-
-            print('.', end='')
-
-            yield elem
+        return samples.items()
 
     def _load_split_data(self, split_path=None):
         """
@@ -190,33 +343,25 @@ class TrainIDConverter(object):
                 print('No {} data accessible'.format(split))
         return split_data
 
-    def _get_index_from_position(self, position_array, pos_0):
-        """
-        Returns the index of the position tuple with first entry pos_0 in the pos_array
-
-        :param position_array: An array built out of 4-tuples in the standard positions format.
-        :param pos_0: Global position index (first entry of the 4-tuple) to search for
-        :return: index of the tuple in pos_array that begins with pos_0. If none is found, None is returned.
-        """
-        for i, position in zip(range(len(position_array)), position_array):
-            if position[0] == pos_0:
-                return i
-        return None
-
-    def _add_new_segmentation_to_split_file(self, split_data_dict, segmentation_keys):
+    def _add_new_segmentation_to_split_file(self, split_data_dict, segmentation_keys, outputs=None):
         """
         Duplicates every segmentation entry to a segmentation_trainid entry with the modified file paths
 
         :param split_data_dict: split dictionary as saved in the json file
         :param segmentation_keys: list of segmentation keys that will be dupilicated
+        :param outputs: list of (folder name, json suffix) of the label definitions, see get_output_names. Default are
+                        the label definitions of this converter
         :return: The split_data_dict with the additional entries
         """
+        if outputs is None:
+            outputs = [(folder_name, suffix) for _, folder_name, suffix, _ in self.outputs]
         for split, split_data in split_data_dict.items():
-            # If there are already trainid entries in the basic_files.json, remove them
-            for seg_name in segmentation_keys:
-                new_seg_name = seg_name + '_trainid'
-                if new_seg_name in split_data['names']:
-                    basic_json_data = remove_from_json_dict(split_data, name=new_seg_name)
+            # If there are already trainid entries in the split file, remove them
+            for _, suffix in outputs:
+                for seg_name in segmentation_keys:
+                    new_seg_name = seg_name + suffix
+                    if new_seg_name in split_data['names']:
+                        remove_from_json_dict(split_data, name=new_seg_name)
 
             # Find the index after the last segmentation entry. This is the index where the new entries will be inserted
             first_seg_key_found = False
@@ -230,52 +375,42 @@ class TrainIDConverter(object):
             assert first_seg_key_found, "No segmentation keys have been found in the basic_files.json"
 
             # Insert the trainid entries into the json list
-            segmentation_keys.reverse()
-            for seg_name in segmentation_keys:
-                new_entry = {}
-                original_seg_index = split_data['names'].index(seg_name)
-                new_seg_name = seg_name + '_trainid'
-                new_entry['names'] = new_seg_name
-                for key in ('types', 'positions', 'files', 'folders'):
-                    old_entry = split_data[key][original_seg_index]
-                    if type(old_entry) == list:
-                        new_entry[key] = old_entry.copy()
-                    else:
-                        new_entry[key] = old_entry
-                for i in range(len(new_entry['files'])):
-                    old_path = new_entry['files'][i]
-                    new_entry['files'][i] = os.path.join(NEW_FOLDER_NAME, old_path)
-                for i in range(len(new_entry['folders'])):
-                    old_path = new_entry['folders'][i]
-                    new_entry['folders'][i] = os.path.join(NEW_FOLDER_NAME, old_path)
-                basic_json_data = insert_into_json_dict(split_data, new_entry, new_seg_index)
+            for folder_name, suffix in reversed(outputs):
+                for seg_name in reversed(segmentation_keys):
+                    new_entry = get_trainid_entry(split_data, seg_name, folder_name, suffix)
+                    insert_into_json_dict(split_data, new_entry, new_seg_index)
         return split_data_dict
 
-    def _adapt_splits(self, split_names, segmentation_keys):
+    def _adapt_splits(self, split_names, segmentation_keys, outputs=None):
         """
         Writes the new segmentation data into every given split.
 
         :param split_names: List containing all split names that are supposed to be adapted
-        :param basic_data:
-        :return:
+        :param segmentation_keys: list of segmentation keys that will be dupilicated
+        :param outputs: list of (folder name, json suffix) of the label definitions, see get_output_names
         """
         for split_name in split_names:
             split_path = self.dataset_path + '_' + split_name
             split_data_dict = self._load_split_data(split_path)
-            split_data_dict = self._add_new_segmentation_to_split_file(split_data_dict, segmentation_keys)
+            split_data_dict = self._add_new_segmentation_to_split_file(split_data_dict, segmentation_keys, outputs)
             for split, split_data in split_data_dict.items():
-                with open(os.path.join(split_path, JSON_NAMES[split]), 'w') as fd:
-                    json.dump(split_data, fd)
+                pm.write_json_atomic(os.path.join(split_path, JSON_NAMES[split]), split_data)
 
-    def _adapt_json_files(self, splits_to_adapt=None, segmentation_keys=None):
+    def _adapt_json_files(self, splits_to_adapt=None, segmentation_keys=None, outputs=None):
         """
-        Adds the new trainid segmentation images to the json files as new entries with the suffix _trainid
+        Adds the new trainid segmentation images to the json files as new entries with the suffix _trainid, or
+        _trainid_<name> for every named label definition
 
         :param splits_to_adapt: Splits in seperate folders that will have the segmentation_trainid entry copied into
                                 their json files
         :param segmentation_keys: Segmentation names which will be copied to a new trainid entry. Default are all
                                   segmentation names in the basic_files
+        :param outputs: list of (folder name, json suffix) of the label definitions, see get_output_names. Default are
+                        the label definitions of this converter
         """
+        if outputs is None:
+            outputs = [(folder_name, suffix) for _, folder_name, suffix, _ in self.outputs]
+
         # Load the basic files json data
         with open(os.path.join(self.dataset_path, JSON_NAMES['basic_files'])) as fd:
             basic_json_data = json.load(fd)
@@ -283,15 +418,15 @@ class TrainIDConverter(object):
         if segmentation_keys == None:
             segmentation_keys = []
             for name in names:
-                if 'segmentation' in name:
+                if 'segmentation' in name and '_trainid' not in name:
                     segmentation_keys.append(name)
 
         # If there are already trainid entries in the basic_files.json, remove them
-        for seg_name in segmentation_keys:
-            new_seg_name = seg_name + '_trainid'
-            if new_seg_name in basic_json_data['names']:
-                basic_json_data = remove_from_json_dict(basic_json_data, name=new_seg_name)
-                segmentation_keys.remove(new_seg_name)
+        for _, suffix in outputs:
+            for seg_name in segmentation_keys:
+                new_seg_name = seg_name + suffix
+                if new_seg_name in basic_json_data['names']:
+                    basic_json_data = remove_from_json_dict(basic_json_data, name=new_seg_name)
 
         # Find the index where the trainid entries will be inserted
         first_seg_key_found = False
@@ -305,99 +440,92 @@ class TrainIDConverter(object):
         assert first_seg_key_found, "No segmentation keys have been found in the basic_files.json"
 
         # Insert the trainid entries into the json list
-        segmentation_keys.reverse()
-        for seg_name in segmentation_keys:
-            new_entry = {}
-            original_seg_index = basic_json_data['names'].index(seg_name)
-            new_seg_name = seg_name + '_trainid'
-            new_entry['names'] = new_seg_name
-            for key in ('types', 'positions', 'numerical_values', 'filters', 'files', 'folders'):
-                old_entry = basic_json_data[key][original_seg_index]
-                if type(old_entry) == list:
-                    new_entry[key] = old_entry.copy()
-                elif key == 'filters':
-                    new_entry[key] = [old_entry]
-                else:
-                    new_entry[key] = old_entry
-
-            new_entry['filters'].append(NEW_FOLDER_NAME)
-            for i in range(len(new_entry['files'])):
-                old_path = new_entry['files'][i]
-                new_entry['files'][i] = os.path.join(NEW_FOLDER_NAME, old_path)
-            for i in range(len(new_entry['folders'])):
-                old_path = new_entry['folders'][i]
-                new_entry['folders'][i] = os.path.join(NEW_FOLDER_NAME, old_path)
-            basic_json_data = insert_into_json_dict(basic_json_data, new_entry, new_seg_index)
-
-        with open(os.path.join(self.dataset_path, JSON_NAMES['basic_files']), 'w') as fd:
-            json.dump(basic_json_data, fd)
+        for folder_name, suffix in reversed(outputs):
+            for seg_name in reversed(segmentation_keys):
+                new_entry = get_trainid_entry(basic_json_data, seg_name, folder_name, suffix)
+                basic_json_data = insert_into_json_dict(basic_json_data, new_entry, new_seg_index)
+
+        pm.write_json_atomic(os.path.join(self.dataset_path, JSON_NAMES['basic_files']), basic_json_data)
 
         # Modify the train, val, test.json, if present
         split_data_dict = self._load_split_data()
-        split_data_dict = self._add_new_segmentation_to_split_file(split_data_dict, segmentation_keys)
+        split_data_dict = self._add_new_segmentation_to_split_file(split_data_dict, segmentation_keys, outputs)
         for split, split_data in split_data_dict.items():
-            with open(os.path.join(self.dataset_path, JSON_NAMES[split]), 'w') as fd:
-                json.dump(split_data, fd)
+            pm.write_json_atomic(os.path.join(self.dataset_path, JSON_NAMES[split]), split_data)
 
         # If there are any separate split folders given, adapt them too.
         if splits_to_adapt is not None:
-            self._adapt_splits(splits_to_adapt, segmentation_keys)
+            self._adapt_splits(splits_to_adapt, segmentation_keys, outputs)
 
     def adapt_json_files(self, splits_to_adapt=None):
         """
         This function is meant for the case that the scaled segmentation files have already been created but the json
         files have been altered by the filelist creator, which does remove the segmentation_trainid entries. Using this
-        function, the segmentation_trainid entries will be restored. If there is no segmentation_trainid Folder, this
-        function will have no effect
+        function, the segmentation_trainid entries will be restored. Label definitions without a segmentation_trainid
+        folder are skipped.
 
         :param splits_to_adapt: Splits in seperate folders that will have the segmentation_trainid entry copied into
                                 their json files
         """
-        if not os.path.isdir(os.path.join(self.dataset_path, NEW_FOLDER_NAME)):
+        outputs = [(folder_name, suffix) for _, folder_name, suffix, _ in self.outputs
+                   if os.path.isdir(os.path.join(self.dataset_path, folder_name))]
+        if not outputs:
             print('No segmentation_trainid folder found in the dataset directory')
             return
-        self._adapt_json_files(splits_to_adapt)
+        self._adapt_json_files(splits_to_adapt, outputs=outputs)
 
-    def process(self, splits_to_adapt=None):
+    def process(self, splits_to_adapt=None, proof='size'):
         """
         Converts all segmentation images in the dataset to train_ids and saves them into a new folder in the dataset
         root directory. The new segmentation images will be added to the json_files as a new entry
-        "segmentation_trainid"
+        "segmentation_trainid". If several label definitions are given, every image is loaded once and converted with
+        all definitions, which get a folder and an entry of their own, see get_output_names.
+
+        Every converted sample is recorded in a progress manifest in every new folder. If a run is interrupted, calling
+        process again with the same labels only converts the samples that have not been completed. The json files are
+        adapted once all samples are done, then the manifests are removed.
 
         :param splits_to_adapt: Splits in seperate folders that will have the segmentation_trainid entry copied into
                                 their json files
+        :param proof: 'size' or 'hash'. A sample of an interrupted run counts as completed if its files still have the
+            recorded size or sha1 hash.
         """
-
-        new_path = os.path.join(self.dataset_path, NEW_FOLDER_NAME)
-
         if type(splits_to_adapt) == str:
             splits_to_adapt = (splits_to_adapt,)
 
-        camera_intrinsics = {}
-        pending_writes = []
-        segmentation_keys = []
-
-        # Save the images
-        with Pool(processes=NUM_WORKERS) as pool_rd, Pool(processes=NUM_WORKERS) as pool_wr:
-            for set_idx, sample, paths in self._print_progress(self._get_samples(pool_rd)):
-                for key in sample:
-                    if key[0] not in segmentation_keys:
-                        segmentation_keys.append(key[0])
-                    image = sample[key]
-                    new_filepath = os.path.join(new_path, paths[key])
-                    os.makedirs(os.path.split(new_filepath)[0], exist_ok=True)
-                    args = (image, new_filepath)
-                    job = pool_wr.apply_async(self._save_image_file, args)
-                    pending_writes.append(job)
-                # Limit the number of pending write operations
-                # by waiting for old ones to complete
-                while len(pending_writes) > NUM_WORKERS:
-                    pending_writes.pop(0).get()
-
-            while pending_writes:
-                pending_writes.pop(0).get()
+        label_sets = self.labels if isinstance(self.labels, dict) else {None: self.labels}
+        manifests = []
+        completed = None
+        segmentation_keys = set()
+        for name, folder_name, _, _ in self.outputs:
+            new_path = os.path.join(self.dataset_path, folder_name)
+            labels_hash = hashlib.sha1(json.dumps(label_sets[name]).encode('utf-8')).hexdigest()
+            task = {'tool': 'TrainIDConverter', 'dataset': self.dataset, 'labels': labels_hash,
+                    'labels_mode': self.labels_mode}
+            manifest = pm.ProgressManifest(os.path.join(new_path, pm.MANIFEST_FILENAME), task, proof)
+            folder_completed = manifest.completed_items(new_path)
+            if folder_completed:
+                print('Resuming: {} samples have already been converted for {}'.format(len(folder_completed),
+                                                                                       folder_name))
+            manifests.append(manifest)
+            completed = set(folder_completed) if completed is None else completed.intersection(folder_completed)
+            segmentation_keys.update(key for keys in folder_completed.values() for key in keys)
+
+        # Every worker loads whole samples and converts and saves them with all label definitions
+        args = [(si, proof) for si in self._get_samples() if si[0] not in completed]
+        with Pool(processes=max(1, self.num_workers)) as pool:
+            results = pool.imap_unordered(self._convert_sample, args, chunksize=4)
+            for set_idx, keys, files in pm.print_progress(results):
+                segmentation_keys.update(keys)
+                for manifest, folder_files in zip(manifests, files):
+                    manifest.add(set_idx, folder_files, keys)
+        segmentation_keys = sorted(segmentation_keys, key=SEGMENTATION_KEYS.index)
         self._adapt_json_files(splits_to_adapt, segmentation_keys)
 
+        # The conversion is complete
+        for manifest in manifests:
+            manifest.remove()
+
 
 if __name__ == '__main__':
     pass
@@ -408,6 +536,14 @@ if __name__ == '__main__':
     #
     # If you have already created the train_id images but have to update the json files, use
     # converter.adapt_json_files()
+    #
+    # Several label definitions are converted in one run by passing a dictionary of named definitions, e.g.
+    # converter = TrainIDConverter('mapillary', labels={'def': lf.labels_mapillary_seg_cityscapes_def.getlabels(),
+    #                                                   'ign': lf.labels_mapillary_seg_cityscapes_ign.getlabels()},
+    #                              labels_mode='fromid')
+    # converter.process()
+    # This creates the folders segmentation_trainid_def and segmentation_trainid_ign and the json entries
+    # segmentation_trainid_def and segmentation_trainid_ign.
 
     # converter = TrainIDConverter('cityscapes', labels=lf.labels_cityscape_seg.getlabels(), labels_mode='fromid')
     # converter.process()
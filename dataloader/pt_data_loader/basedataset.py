@@ -1,15 +1,19 @@
+import torch
 from torch.utils.data import Dataset
+from torch.utils.data.dataloader import default_collate
 from torchvision import transforms
 import os
 
-import json
-import cv2
+import warnings
 import numpy as np
 
 import dataloader.pt_data_loader.mytransforms as mytransforms
 import dataloader.pt_data_loader.dataset_parameterset as dps
 import dataloader.file_io.get_path as gp
 import dataloader.file_io.dir_lister as dl
+import dataloader.file_io.image_metadata as im
+import dataloader.file_io.binary_index as bi
+import dataloader.file_io.image_codecs as ic
 
 
 class BaseDataset(Dataset):
@@ -36,7 +40,13 @@ class BaseDataset(Dataset):
                  files_to_load=None,
                  n_files=None,
                  output_filenames=False,
-                 flow_validation_mode=True
+                 flow_validation_mode=True,
+                 dtype='float32',
+                 reorder_transforms=False,
+                 multi_crop_transforms=None,
+                 num_crops=1,
+                 multi_crop_mode='stack',
+                 class_index=None
                  ):
         """Initialises the dataset by loading the desired data from the json file
 
@@ -65,8 +75,23 @@ class BaseDataset(Dataset):
             Default: None -> all files are loaded from dataset
         :param n_files: How many files shall be loaded. Files are selected randomly if there are more files than n_files
             Seeded by numpy.random.seed()
-        :param flow_validation_mode: If true, the flow images will be loaded as a numpy array and not be converted to a
-            PIL image. As a result, it will remain unaffected by any resizing/cropping/rotating transform etc.
+        :param flow_validation_mode: If true, the flow will remain unaffected by any resizing/cropping/flipping
+            transform etc. Otherwise, these transforms alter the flow vectors accordingly.
+        :param dtype: float dtype of the depth, flow and numeric data, can be 'float32' or 'float16'. With 'float16',
+            all transforms work in float32 and only the tensors created by ToTensor are half precision.
+        :param reorder_transforms: If True, pixel-wise transforms (ConvertDepth, ConvertSegmentation, CreateColoraug,
+            ColorJitter) that are placed in front of a crop are moved behind it, so that they only process the pixels
+            that are kept. Otherwise, a warning is issued for such an ordering.
+        :param multi_crop_transforms: list of transforms (e.g. RandomCrop, CreateColoraug, ColorJitter, ToTensor) that
+            is executed num_crops times on every sample after the data_transforms. That way, several independently
+            augmented crops are created from one decoded sample.
+        :param num_crops: number of crops that are created from every sample if multi_crop_transforms are given
+        :param multi_crop_mode: can be 'stack' or 'list'. With 'stack', the crops are stacked along a new first
+            dimension of every tensor. With 'list', a list of num_crops samples is returned that is turned into
+            num_crops batch items by BaseDataset.collate_crops. If SparseDepth is part of the multi_crop_transforms,
+            'list' has to be used.
+        :param class_index: ClassIndex (see dataloader/file_io/class_indexer.py) of the loaded split. If given, every
+            sample contains its row in the index, which is used by the ClassAwareRandomCrop and the ClassAwareSampler.
         """
         super(BaseDataset, self).__init__()
         assert isinstance(dataset, str)
@@ -75,6 +100,9 @@ class BaseDataset(Dataset):
         assert video_mode in ('mono', 'video'), 'video_mode must be mono or video'
         assert stereo_mode in ('mono', 'stereo'), 'stereo_mode must be mono or stereo'
         assert isinstance(simple_mode, bool)
+        assert dtype in ('float32', 'float16'), 'dtype must be float32 or float16'
+        assert isinstance(num_crops, int) and num_crops > 0, 'num_crops must be a positive integer'
+        assert multi_crop_mode in ('stack', 'list'), 'multi_crop_mode must be stack or list'
         if data_transforms is None:
             data_transforms = [mytransforms.CreateScaledImage(),
                                mytransforms.CreateColoraug(),
@@ -96,6 +124,7 @@ class BaseDataset(Dataset):
         self.scales = scales
         self.disable_const_items = disable_const_items
         self.output_filenames = output_filenames
+        self.dtype = dtype
         self.parameters = dps.DatasetParameterset(dataset)
         if labels is not None:
             self.parameters.labels = labels
@@ -117,40 +146,62 @@ class BaseDataset(Dataset):
         else:
             self.data = self.read_from_folder(datasetpath, keys_to_load, video_mode, video_frames)
 
+        self.image_metadata = None
+        self.image_sizes = {}
+        self.class_index = class_index
+        if class_index is not None:
+            assert ('segmentation', 0, -1) in self.data, 'The segmentation has to be loaded to use a class index'
+            self.class_index_rows = class_index.rows_for_files(self.data[('segmentation', 0, -1)])
+
         self.load_transforms = transforms.Compose(
             [mytransforms.LoadRGB(),
              mytransforms.LoadSegmentation(),
              mytransforms.LoadDepth(),
-             mytransforms.LoadFlow(validation_mode=flow_validation_mode),
-             mytransforms.LoadNumerics()
+             mytransforms.LoadFlow(validation_mode=flow_validation_mode, flow_mode=self.parameters.flow_mode),
+             mytransforms.LoadNumerics(dtype=self.dtype)
              ])
 
         # IMPORTANT to create a new list if the same list is passed to multiple datasets. Otherwise, due to the
         # mutability of lists, ConvertSegmentation will only be added once. Hence, the labels may be wrong for the 2nd,
         # 3rd, ... dataset!
         self.data_transforms = list(data_transforms)
+        if multi_crop_transforms is not None:
+            self.multi_crop_transforms = list(multi_crop_transforms)
+        else:
+            self.multi_crop_transforms = []
+        self.num_crops = num_crops
+        self.multi_crop_mode = multi_crop_mode
+        all_transforms = self.data_transforms + self.multi_crop_transforms
 
         # Error if CreateColorAug and CreateScaledImage not in transforms.
-        if mytransforms.CreateScaledImage not in data_transforms:
+        if mytransforms.CreateScaledImage not in all_transforms:
             raise Exception('The transform CreateScaledImage() has to be part of the data_transforms list')
-        if mytransforms.CreateColoraug not in data_transforms:
+        if mytransforms.CreateColoraug not in all_transforms:
             raise Exception('The transform CreateColoraug() has to be part of the data_transforms list')
+        if multi_crop_transforms is not None and multi_crop_mode == 'stack' and \
+                mytransforms.ToTensor not in self.multi_crop_transforms:
+            raise Exception('The transform ToTensor() has to be part of the multi_crop_transforms list to stack the '
+                            'crops')
+        if multi_crop_mode == 'stack' and \
+                any(isinstance(transform, mytransforms.SparseDepth) for transform in self.multi_crop_transforms):
+            raise Exception('The sparse depth entries of the crops have different lengths and cannot be stacked. Use '
+                            "multi_crop_mode='list' together with collate_fn=BaseDataset.collate_crops instead")
 
         # Error if depth, segmentation or flow keys are given but not the corresponding Convert-Transform
         if any([key.startswith('segmentation') for key in keys_to_load]) and \
-                mytransforms.ConvertSegmentation not in self.data_transforms:
+                mytransforms.ConvertSegmentation not in all_transforms:
             raise Exception('When loading segmentation images, please add mytransforms.ConvertSegmentation() to '
                             'the data_transforms')
         if any([key.startswith('depth') for key in keys_to_load]) and \
-                mytransforms.ConvertDepth not in self.data_transforms:
+                mytransforms.ConvertDepth not in all_transforms:
             raise Exception('When loading depth images, please add mytransforms.ConvertDepth() to the data_transforms')
         if any([key.startswith('flow') for key in keys_to_load]) and \
-                mytransforms.ConvertFlow not in self.data_transforms:
+                mytransforms.ConvertFlow not in all_transforms:
             raise Exception('When loading flow images, please add mytransforms.ConvertFlow() to the data_transforms')
 
         # Set the correct parameters to the ConvertDepth and ConvertSegmentation transforms and the flow_validation_mode
-        # for all transforms that need it
-        for transform in self.data_transforms:
+        # and the float dtype for all transforms that need it
+        for transform in all_transforms:
             if isinstance(transform, mytransforms.ConvertDepth):
                 transform.set_mode(self.parameters.depth_mode)
             elif isinstance(transform, mytransforms.ConvertSegmentation):
@@ -160,8 +211,65 @@ class BaseDataset(Dataset):
             set_flow_method = getattr(transform, "set_flow_mode", None)
             if callable(set_flow_method):
                 transform.set_flow_mode(flow_validation_mode)
+            set_dtype_method = getattr(transform, "set_dtype", None)
+            if callable(set_dtype_method):
+                transform.set_dtype(self.dtype)
 
+        self.data_transforms = self.plan_transform_order(self.data_transforms, reorder_transforms)
         self.data_transforms = transforms.Compose(self.data_transforms)
+        if multi_crop_transforms is not None:
+            self.multi_crop_transforms = self.plan_transform_order(self.multi_crop_transforms, reorder_transforms)
+            self.multi_crop_transforms = transforms.Compose(self.multi_crop_transforms)
+        else:
+            self.multi_crop_transforms = None
+
+    def plan_transform_order(self, data_transforms, reorder):
+        """ Finds pixel-wise transforms that are executed in front of a crop and therefore process pixels that are
+        cropped away afterwards. Such a transform can be moved behind the crop if it commutes with the crop and with
+        all flips and crops in between. The relative order of the moved transforms is kept.
+
+        :param data_transforms: list of data transforms
+        :param reorder: if True, the transforms are moved behind the crops. Otherwise, a warning is issued.
+        :return: the (reordered) list of data transforms
+        """
+        planned_transforms = list(data_transforms)
+        camera_matrix = not self.disable_const_items
+        crops = [transform for transform in data_transforms if isinstance(transform, mytransforms.CROP_TRANSFORMS)]
+
+        # Going backwards, all transforms of a block of pixel-wise transforms in front of a crop are moved
+        for i in reversed(range(len(planned_transforms))):
+            transform = planned_transforms[i]
+            target = None
+            for j in range(i + 1, len(planned_transforms)):
+                other = planned_transforms[j]
+                if isinstance(other, mytransforms.FLIP_TRANSFORMS) and mytransforms.commutes_with_flip(transform):
+                    continue
+                if isinstance(other, mytransforms.CROP_TRANSFORMS) and \
+                        mytransforms.commutes_with_crop(transform, other, camera_matrix):
+                    target = j
+                    continue
+                break
+            if target is None:
+                continue
+            if not reorder:
+                warnings.warn('{} is executed in front of {} and processes pixels that are cropped away. Move it '
+                              'behind the crop or pass reorder_transforms=True to the dataset.'
+                              .format(type(transform).__name__, type(planned_transforms[target]).__name__))
+            planned_transforms.insert(target, planned_transforms.pop(i))
+        if reorder:
+            data_transforms = planned_transforms
+
+        # Converting the native segmentation is only needed if the native images are kept
+        removes_originals = mytransforms.RemoveOriginals in data_transforms or \
+            any(isinstance(transform, mytransforms.CreateScaledImage) and not transform.keep_originals
+                for transform in data_transforms)
+        for transform in data_transforms:
+            if isinstance(transform, mytransforms.ConvertSegmentation) and transform.original and crops and \
+                    removes_originals:
+                warnings.warn('ConvertSegmentation(original=True) converts the native segmentation images although '
+                              'they are removed and only crops of the scaled images are used. Use '
+                              'ConvertSegmentation() behind {} instead.'.format(type(crops[-1]).__name__))
+        return data_transforms
 
     def __len__(self):
         """Return the number of elements inside the dataset"""
@@ -179,25 +287,111 @@ class BaseDataset(Dataset):
             sample.update({item: element})
         if not self.disable_const_items:
             sample = self.add_const_dataset_items(sample)
+        if self.class_index is not None:
+            sample[mytransforms.CLASS_INDEX_KEY] = np.array(self.class_index_rows[number])
         sample = self.load_transforms(sample)
         sample = self.data_transforms(sample)
+        if self.multi_crop_transforms is not None:
+            crops = [self.multi_crop_transforms(self.copy_sample(sample)) for _ in range(self.num_crops)]
+            if self.multi_crop_mode == 'stack':
+                sample = {key: torch.stack([crop[key] for crop in crops]) for key in crops[0].keys()}
+            else:
+                sample = crops
         if self.output_filenames:
-            sample['filename'] = {}
+            filenames = {}
             for item in list(self.data.keys()):
                 if isinstance(self.data[item][number], str):
-                    sample['filename'][item] = (self.data[item][number])
+                    filenames[item] = (self.data[item][number])
+            if isinstance(sample, list):
+                for crop in sample:
+                    crop['filename'] = filenames.copy()
+            else:
+                sample['filename'] = filenames
         return sample
 
+    @staticmethod
+    def copy_sample(sample):
+        """ Returns a copy of the sample that can be transformed independently of the original one. Images are
+        replaced by every transform and can be shared, numpy arrays (e.g. camera matrices) are altered in place. """
+        return {key: value.copy() if isinstance(value, np.ndarray) else value for key, value in sample.items()}
+
+    @staticmethod
+    def collate_crops(batch):
+        """ collate_fn for a DataLoader over a dataset with multi_crop_mode='list'. Every crop becomes an element of the
+        batch, i.e. the batch size is batch_size * num_crops. """
+        return BaseDataset.collate_sparse([crop for crops in batch for crop in crops])
+
+    @staticmethod
+    def collate_sparse(batch):
+        """ collate_fn for a DataLoader over a dataset with the SparseDepth transform. The sparse indices and values are
+        padded to the largest number of valid pixels in the batch. Padded indices point behind the image, so that
+        mytransforms.densify_depth ignores them. Samples without sparse entries are collated as usual. """
+        batch = [dict(sample) for sample in batch]
+        for index_key in batch[0].keys():
+            if not (isinstance(index_key, tuple) and len(index_key) == 3 and
+                    index_key[0].endswith(mytransforms.SPARSE_INDEX_SUFFIX)):
+                continue
+            name = index_key[0][:-len(mytransforms.SPARSE_INDEX_SUFFIX)]
+            value_key = (name + mytransforms.SPARSE_VALUE_SUFFIX,) + index_key[1:]
+            shape_key = (name + mytransforms.SPARSE_SHAPE_SUFFIX,) + index_key[1:]
+            padding_index = int(batch[0][shape_key][0] * batch[0][shape_key][1])
+            length = max(len(sample[index_key]) for sample in batch)
+            for sample in batch:
+                num_padded = length - len(sample[index_key])
+                sample[index_key] = torch.cat((sample[index_key],
+                                               sample[index_key].new_full((num_padded,), padding_index)))
+                sample[value_key] = torch.cat((sample[value_key], sample[value_key].new_zeros(num_padded)))
+        return default_collate(batch)
+
+    def _load_image_metadata(self):
+        """Loads the image metadata of the dataset index if it has been collected"""
+        if self.image_metadata is None and im.ImageMetadata.exists(self.datasetpath):
+            self.image_metadata = im.ImageMetadata(self.datasetpath)
+        return self.image_metadata
+
+    def get_image_metadata(self, number, key=('color', 0, -1)):
+        """Returns width, height, number of channels and dtype of an image of the dataset element with index number
+        as a dictionary. The values are taken from the dataset index if the metadata has been collected by the
+        DatasetCreator, otherwise the header of the image is read.
+
+        :param number: index of the dataset element
+        :param key: key of the image, e.g. ('color', 0, -1)
+        """
+        file = self.data[key][number]
+        metadata = self._load_image_metadata()
+        if metadata is not None:
+            return metadata.get(file)
+        header = im.read_header(os.path.join(self.datasetpath, file))
+        return None if header is None else dict(zip(im.METADATA_KEYS, header))
+
+    def get_image_sizes(self, key=('color', 0, -1)):
+        """Returns an integer array of shape (len(self), 2) containing (height, width) of the images of one key. The
+        sizes are taken from the dataset index if the metadata has been collected by the DatasetCreator, otherwise the
+        image headers are read in parallel once and the result is cached.
+
+        :param key: key of the images, e.g. ('color', 0, -1)
+        """
+        files = self.data[key]
+        metadata = self._load_image_metadata()
+        if metadata is not None:
+            return metadata.sizes(files)
+        if key not in self.image_sizes:
+            headers = im.read_headers([os.path.join(self.datasetpath, file) for file in files])
+            self.image_sizes[key] = np.array([(header[1], header[0]) if header is not None else (0, 0)
+                                              for header in headers], dtype=np.int64).reshape(-1, 2)
+        return self.image_sizes[key]
+
     def add_const_dataset_items(self, sample):
         """Add dataset specific constants or items"""
         raise NotImplementedError
 
     def read_image_file(self, filepath):
-        """Returns an image as a numpy array"""
+        """Returns an image as a numpy array. Besides images, npy files and zstd compressed npy files of a transcoded
+        dataset are read, see dataloader/file_io/image_codecs.py"""
         filepath = os.path.join(self.datasetpath, filepath)
         filepath = filepath.replace('/', os.sep)
         filepath = filepath.replace('\\', os.sep)
-        image = cv2.imread(filepath, -1)
+        image = ic.read_image(filepath)
         return image
 
     def read_json_file(self, datasetpath, splitpath, trainvaltest_split, keys_to_load,
@@ -214,20 +408,18 @@ class BaseDataset(Dataset):
         splitpath = os.path.join(splitpath, trainvaltest_split + '.json')
 
         datasetpath = os.path.join(datasetpath, 'basic_files' + '.json')
-        assert os.path.isfile(datasetpath), 'Path to basic files is not valid'
-        assert os.path.isfile(splitpath), 'Path to the split is not valid. Please use another argument for split.'
+        assert bi.index_exists(datasetpath), 'Path to basic files is not valid'
+        assert bi.index_exists(splitpath), 'Path to the split is not valid. Please use another argument for split.'
 
-        # Load the basic filenames file to get the video data
+        # Load the basic filenames file to get the video data, an up to date binary index is preferred over the json
         if self.video_mode == 'video':
-            with open(datasetpath) as file:
-                basic_json_data = json.load(file)
+            basic_json_data = bi.load_index(datasetpath)
             basic_names = basic_json_data['names']
             basic_files = basic_json_data['files']
             basic_numerics = basic_json_data['numerical_values']
 
         # Load the split file
-        with open(splitpath) as file:
-            split_json_data = json.load(file)
+        split_json_data = bi.load_index(splitpath)
         split_names = split_json_data['names']
         split_types = split_json_data['types']
         split_folders = split_json_data['folders']
@@ -444,7 +636,8 @@ class BaseDataset(Dataset):
 
         assert keys_to_load is not None, 'in simple mode, the keys must be specified'
         root_stringlength = len(path) + 1
-        folders = dl.DirLister.get_directories(path)
+        tree = dl.DirLister.walk(path)
+        folders = dl.DirLister.get_directories(path, tree)
         folders = sorted(folders, key=str.lower)
         keys_to_load = sorted(keys_to_load, key=str.lower)
         data_files = {}
@@ -457,7 +650,7 @@ class BaseDataset(Dataset):
                 # include all folders containing the key
                 key_folders = dl.DirLister.include_dirs_by_name(folders, key)
                 for folder in key_folders:
-                    new_files = dl.DirLister.list_files_in_directory(folder)
+                    new_files = list(tree[folder][1])
                     # remove root path from file
                     for i in range(len(new_files)):
                         new_files[i] = new_files[i][root_stringlength:]
@@ -479,7 +672,7 @@ class BaseDataset(Dataset):
                 all_files = {}
                 # Create a dictionary that contains all file names for every folder
                 for folder in key_folders:
-                    new_files = dl.DirLister.list_files_in_directory(folder)
+                    new_files = list(tree[folder][1])
                     # remove root path from file
                     for i in range(len(new_files)):
                         new_files[i] = new_files[i][root_stringlength:]
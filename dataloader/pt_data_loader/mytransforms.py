@@ -16,50 +16,202 @@ import torchvision.transforms.functional as transforms_fun
 from torchvision.transforms.functional import InterpolationMode
 
 IMAGENAMES = ['color', 'segmentation', 'depth', 'flow']
+# Image types that are PIL images during the data transforms. Flow is a float32 numpy array with the channels
+# (u, v, valid) and is altered by the geometric transforms with the flow-aware functions below.
+PIL_IMAGENAMES = ['color', 'segmentation', 'depth']
+# Image types that are resampled using nearest-neighbor-interpolation
+NEAREST_IMAGENAMES = ['segmentation', 'depth']
 NUMERICNAMES = ['camera_intrinsics', 'poses', 'velocity', 'timestamp']
+# Numerics that can not be represented in single precision (e.g. absolute times) and are always kept in float64
+HIGH_PRECISION_NUMERICNAMES = ['timestamp']
+# Name suffixes of the entries created by SparseDepth
+SPARSE_INDEX_SUFFIX = '_sparse_index'
+SPARSE_VALUE_SUFFIX = '_sparse_value'
+SPARSE_SHAPE_SUFFIX = '_sparse_shape'
+SPARSE_SUFFIXES = (SPARSE_INDEX_SUFFIX, SPARSE_VALUE_SUFFIX, SPARSE_SHAPE_SUFFIX)
+# Entry that the BaseDataset adds to every sample if a class index is given. It holds the row of the sample in the index
+CLASS_INDEX_KEY = 'class_index_row'
 
 
-class LoadRGB(object):
+def _image_keys(keys, names):
+    """ Returns all (name, frame, scale) keys whose name contains at least one of the given strings """
+    return tuple(key for key in keys
+                 if isinstance(key, tuple) and len(key) == 3 and any(item in key[0] for item in names))
+
+
+def decode_kitti_flow(image):
+    """ Decodes a KITTI flow png as read by cv2 (uint16 with the channels valid, v, u) in one vectorized float32 pass
+
+    :param image: uint16 array of shape (H, W, 3)
+    :return: float32 array of shape (H, W, 3) with the channels u, v and valid. The flow of invalid pixels is 0.
+    """
+    flow = np.empty(image.shape, dtype=np.float32)
+    np.subtract(image[:, :, 2:0:-1], 2 ** 15, out=flow[:, :, :2], dtype=np.float32)
+    flow[:, :, 2] = image[:, :, 0] > 0
+    flow[:, :, :2] *= flow[:, :, 2:3] / 64.
+    return flow
+
+
+def flip_flow(flow, horizontal=True):
+    """ Flips a (u, v, valid) flow array horizontally or vertically and inverts the corresponding vector component """
+    if horizontal:
+        flow = flow[:, ::-1].copy()
+        flow[:, :, 0] *= -1
+    else:
+        flow = flow[::-1].copy()
+        flow[:, :, 1] *= -1
+    return flow
+
+
+def resize_flow(flow, size):
+    """ Resizes a (u, v, valid) flow array and scales the flow vectors accordingly.
+
+    Every pixel of the resized flow takes the value of its nearest neighbor if the latter is valid. Otherwise, it takes
+    the value of a valid pixel that falls into it. That way, no measurements of sparse flow maps are lost by
+    downscaling and valid and invalid pixels are never mixed.
+
+    :param flow: float array of shape (H, W, 3)
+    :param size: (height, width) of the resized flow
+    """
+    height, width = flow.shape[:2]
+    new_height, new_width = int(size[0]), int(size[1])
+    scale_y, scale_x = new_height / height, new_width / width
+    resized = np.zeros((new_height, new_width, flow.shape[2]), dtype=flow.dtype)
+
+    # Write every valid pixel to the pixel of the resized flow its center falls into
+    ys, xs = np.nonzero(flow[:, :, 2] > 0)
+    new_ys = np.minimum(((ys + 0.5) * scale_y).astype(np.int64), new_height - 1)
+    new_xs = np.minimum(((xs + 0.5) * scale_x).astype(np.int64), new_width - 1)
+    resized[new_ys, new_xs] = flow[ys, xs]
+
+    # Nearest-neighbor interpolation wherever the nearest neighbor is valid
+    source_ys = np.minimum(((np.arange(new_height) + 0.5) / scale_y).astype(np.int64), height - 1)
+    source_xs = np.minimum(((np.arange(new_width) + 0.5) / scale_x).astype(np.int64), width - 1)
+    nearest = flow[source_ys[:, np.newaxis], source_xs[np.newaxis, :]]
+    valid = nearest[:, :, 2] > 0
+    resized[valid] = nearest[valid]
+
+    resized[:, :, 0] *= scale_x
+    resized[:, :, 1] *= scale_y
+    return resized
+
+
+def crop_flow(flow, top, left, height, width):
+    """ Crops a (u, v, valid) flow array like transforms_fun.crop. Areas outside of the flow are invalid. """
+    cropped = np.zeros((height, width, flow.shape[2]), dtype=flow.dtype)
+    source_top, source_left = max(top, 0), max(left, 0)
+    source_bottom, source_right = min(top + height, flow.shape[0]), min(left + width, flow.shape[1])
+    if source_bottom > source_top and source_right > source_left:
+        cropped[source_top - top:source_bottom - top, source_left - left:source_right - left] = \
+            flow[source_top:source_bottom, source_left:source_right]
+    return cropped
+
+
+def resized_size(width, height, output_size):
+    """ Returns the (height, width) that transforms.Resize(output_size) creates from an image of the given size """
+    if isinstance(output_size, int):
+        if width <= height:
+            return int(output_size * height / width), output_size
+        return output_size, int(output_size * width / height)
+    return int(output_size[0]), int(output_size[1])
+
+
+def bucket_indices(sizes, bucket_shapes):
+    """ Returns for every image size the index of the bucket shape with the closest aspect ratio
+
+    :param sizes: array of shape (N, 2) containing (height, width) of the images
+    :param bucket_shapes: list of (height, width) of the buckets
+    :return: array of bucket indices, -1 for sizes with a zero height or width (images whose header could not be read)
+    """
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    bucket_shapes = np.asarray(bucket_shapes, dtype=np.float64).reshape(-1, 2)
+    valid = np.all(sizes > 0, axis=1)
+    sizes = np.where(valid[:, None], sizes, 1)
+    ratios = np.log(sizes[:, 1] / sizes[:, 0])
+    bucket_ratios = np.log(bucket_shapes[:, 1] / bucket_shapes[:, 0])
+    indices = np.argmin(np.abs(ratios[:, None] - bucket_ratios[None, :]), axis=1)
+    return np.where(valid, indices, -1)
+
+
+class PlannedTransform(object):
+    """ Base class of all transforms that select the sample entries to work on by the names of the sample keys.
+
+    Which keys a transform touches, and e.g. with which interpolation mode, only depends on the keys of the sample.
+    Therefore, the string comparisons are done once per distinct key set in _plan() and the result is cached. For every
+    sample, the transform only dispatches to the precomputed targets.
+    """
+
+    def _plan(self, keys):
+        """ Returns the targets of the transform for a sample with the given keys """
+        raise NotImplementedError
+
+    def get_plan(self, sample):
+        keys = tuple(sample.keys())
+        plans = self.__dict__.setdefault('_plans', {})
+        plan = plans.get(keys)
+        if plan is None:
+            plan = self._plan(keys)
+            plans[keys] = plan
+        return plan
+
+    def reset_plan(self):
+        """ Has to be called whenever an attribute changes that the plan depends on """
+        self.__dict__.pop('_plans', None)
+
+
+class PrecisionTransform(object):
+    """ All transforms that create floating point depth, flow or numeric data inherit from this class. The dataset
+    sets the float dtype of these transforms so that no float64 intermediates are created. Since PIL images and
+    numpy.linalg do not support half precision, all transforms work in float32 if float16 is chosen and the final cast
+    to float16 is done in ToTensor. """
+
+    def __init__(self, dtype='float32'):
+        self.set_dtype(dtype)
+
+    def set_dtype(self, dtype):
+        dtype = np.dtype(dtype)
+        assert dtype.kind == 'f', 'dtype has to be a floating point type'
+        self.dtype = dtype
+        self.work_dtype = np.promote_types(dtype, np.float32)
+
+
+class LoadRGB(PlannedTransform):
     """ Loads the RGB image by converting the array to a PIL image """
 
     def __init__(self):
         pass
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('color',))
+
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
+        for key in self.get_plan(sample):
+            if sample[key].dtype == 'uint16':
+                sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB).astype(np.float32) / 256.
+                sample[key] = sample[key].astype(np.uint8)
+            elif sample[key].dtype == 'uint8':
+                sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB)
             else:
-                continue
-            if 'color' in name:
-                if sample[key].dtype == 'uint16':
-                    sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB).astype(np.float32) / 256.
-                    sample[key] = sample[key].astype(np.uint8)
-                elif sample[key].dtype == 'uint8':
-                    sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB)
-                else:
-                    sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB)
-                sample[key] = pil.fromarray(sample[key])
+                sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB)
+            sample[key] = pil.fromarray(sample[key])
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class LoadSegmentation(object):
+class LoadSegmentation(PlannedTransform):
     """ Creates PIL Image from the dataset segmentation (numpy array) """
 
     def __init__(self):
         pass
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('segmentation',))
+
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'segmentation' in name:
-                sample[key] = pil.fromarray(sample[key])
+        for key in self.get_plan(sample):
+            sample[key] = pil.fromarray(sample[key])
         return sample
 
     def __eq__(self, other):
@@ -79,7 +231,7 @@ class LoadSegmentation(object):
         return sample
 
 
-class ConvertSegmentation(object):
+class ConvertSegmentation(PlannedTransform):
     """ Convert the labels to their train IDs """
 
     def __init__(self, labels=None, labels_mode=None, original=False):
@@ -110,8 +262,8 @@ class ConvertSegmentation(object):
     def set_mode(self, labels, labels_mode):
         self._set_mode(labels=labels, labels_mode=labels_mode)
 
-    def _filter_keys(self, sample):
-        for key in tuple(sample):
+    def _filter_keys(self, keys):
+        for key in keys:
             if not isinstance(key, tuple):
                 continue
 
@@ -131,6 +283,9 @@ class ConvertSegmentation(object):
 
             yield key
 
+    def _plan(self, keys):
+        return tuple(self._filter_keys(keys))
+
     def _from_rgb(self, img):
         if (img.ndim != 3) or (img.shape[2] != 3):
             raise ValueError('Mode "fromrgb" expects the input image to have shape (H, W, 3)')
@@ -167,7 +322,7 @@ class ConvertSegmentation(object):
         if (self.mode is None) or (self.mode == 'fromtrainid'):
             return sample
 
-        for key in self._filter_keys(sample):
+        for key in self.get_plan(sample):
             img = sample.pop(key)
             img = np.array(img)
 
@@ -195,20 +350,18 @@ class ConvertSegmentation(object):
         return type(self).__name__ == other.__name__
 
 
-class LoadDepth(object):
+class LoadDepth(PlannedTransform):
     """ Creates PIL Image from the dataset depth (numpy array) """
 
     def __init__(self):
         pass
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('depth',))
+
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'depth' in name:
-                sample[key] = pil.fromarray(sample[key])
+        for key in self.get_plan(sample):
+            sample[key] = pil.fromarray(sample[key])
         return sample
 
     def __eq__(self, other):
@@ -228,36 +381,34 @@ class LoadDepth(object):
         return sample
 
 
-class ConvertDepth(object):
+class ConvertDepth(PlannedTransform, PrecisionTransform):
     """ Converts the depth image to depth in meters """
 
-    def __init__(self, depth_mode=None):
+    def __init__(self, depth_mode=None, dtype='float32'):
+        super().__init__(dtype)
         self.depth_mode = depth_mode
 
     def set_mode(self, depth_mode):
         self.depth_mode = depth_mode
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('depth',))
+
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
+        for key in self.get_plan(sample):
+            depth = np.array(sample[key], dtype=self.work_dtype)
+            if self.depth_mode == 'uint_16':
+                depth /= 256.
+            elif self.depth_mode == 'uint_16_subtract_one':   # This mode is specifically tailored to fit Cityscapes
+                valid = depth > 1.0
+                depth[valid] = 0.209313 * 2262.52 / ((depth[valid] - 1.0) / 256.)
+            elif self.depth_mode == 'normalized_100':
+                depth /= 100.
+            elif self.depth_mode == '3_channel_normalized_100':
+                depth = depth[:, :, 0] / 100.
             else:
-                continue
-            if 'depth' in name:
-                sample[key] = np.array(sample[key]).astype(np.float)
-                if self.depth_mode == 'uint_16':
-                    sample[key] = sample[key] / 256.
-                elif self.depth_mode == 'uint_16_subtract_one':   # This mode is specifically tailored to fit Cityscapes
-                    sample[key][sample[key] > 1.0] = 0.209313 * 2262.52/(
-                            (np.array(sample[key][sample[key] > 1.0]).astype(np.float) - 1.0) / 256.)
-                elif self.depth_mode == 'normalized_100':
-                    sample[key] = sample[key] / 100.
-                elif self.depth_mode == '3_channel_normalized_100':
-                    sample[key] = sample[key] / 100.
-                    sample[key] = sample[key][:, :, 0].reshape(sample[key].shape[0], sample[key].shape[1])
-                else:
-                    raise Exception('Unknown Depth Mode')
-                sample[key] = pil.fromarray(sample[key])
+                raise Exception('Unknown Depth Mode')
+            sample[key] = pil.fromarray(depth)
         return sample
 
     def __eq__(self, other):
@@ -273,52 +424,46 @@ class ConvertDepth(object):
                 continue
             if 'depth' in name:
                 if self.depth_mode == 'uint_16':
-                    sample[key] = np.array(sample[key]).astype(np.float) * 256.
+                    sample[key] = np.array(sample[key], dtype=self.work_dtype) * 256.
                 elif self.depth_mode == 'uint_16_subtract_one':
                     raise NotImplementedError
                 elif self.depth_mode == 'normalized_100':
-                    sample[key] = np.array(sample[key]).astype(np.float) * 100.
+                    sample[key] = np.array(sample[key], dtype=self.work_dtype) * 100.
                 elif self.depth_mode == '3_channel_normalized_100':
-                    mono_image = sample[key]
-                    sample[key] = np.zeros((mono_image.shape[0], mono_image.shape[1], 3))
-                    for i in range(3):
-                        sample[key][:, :, i] = mono_image
-                    sample[key] = np.array(sample[key]).astype(np.float) * 100.
+                    mono_image = np.array(sample[key], dtype=self.work_dtype)
+                    sample[key] = np.repeat(mono_image[:, :, np.newaxis], 3, axis=2) * 100.
         return sample
 
 
-class LoadFlow(object):
-    """ Creates PIL Image from the dataset optical flow image (numpy array) """
+class LoadFlow(PlannedTransform):
+    """ Decodes the dataset optical flow image (numpy array) into a float32 numpy array with the channels u, v and
+    valid. In flow_validation_mode, the geometric transforms leave the flow unchanged. Otherwise, they alter the flow
+    vectors accordingly. """
 
-    def __init__(self, validation_mode):
+    def __init__(self, validation_mode=None, flow_mode='kitti'):
         self.validation_mode = validation_mode
+        self.flow_mode = flow_mode
+
+    def _plan(self, keys):
+        return _image_keys(keys, ('flow',))
 
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
+        for key in self.get_plan(sample):
+            if self.flow_mode == 'kitti':
+                sample[key] = decode_kitti_flow(sample[key])
             else:
-                continue
-            # In validation mode, keep the data type as a numpy array. Otherwise, convert to uint8 PIL image.
-            if 'flow' in name:
-                sample[key] = cv2.cvtColor(sample[key], cv2.COLOR_BGR2RGB)
-                if not self.validation_mode:
-                    sample[key][:, :, 0:2] = sample[key][:, :, 0:2].astype(np.float32) / 256.
-                    sample[key] = pil.fromarray(sample[key].astype(np.uint8))
+                raise Exception('Unknown Flow Mode')
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class ConvertFlow(object):
-    """ Converts the flow image.
+class ConvertFlow(PlannedTransform, PrecisionTransform):
+    """ Converts the flow, which has already been decoded by LoadFlow, to the dtype of the dataset """
 
-    This transform must be executed after all image-altering transforms, e.g. rotating, scaling and cropping since
-    the converted flow data will not be a pillow image anymore.
-    """
-
-    def __init__(self, flow_mode=None, validation_mode=None):
+    def __init__(self, flow_mode=None, validation_mode=None, dtype='float32'):
+        super().__init__(dtype)
         self.flow_mode = flow_mode
         self.validation_mode = validation_mode
 
@@ -329,52 +474,45 @@ class ConvertFlow(object):
         if validation_mode is not None:
             self.validation_mode = validation_mode
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('flow',))
+
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'flow' in name:
-                # Convert the flow to a range -512 ... 512 (1st and 2nd channel)
-                sample[key] = np.array(sample[key]).astype(np.float)
-                if not self.validation_mode:
-                    sample[key][:, :, 0:2] = sample[key][:, :, 0:2] * 256
-                if self.flow_mode == 'kitti':
-                    print(sample[key].shape)
-                    sample[key][:, :, 0:2] = (sample[key][:, :, 0:2] - 2**15) / 64
-                else:
-                    raise Exception('Unknown Flow Mode')
-                # Set flow values for invalid pixels to 0 (e.g. for padded pixels at the corners)
-                sample[key][:, :, 0] = sample[key][:, :, 2] * sample[key][:, :, 0]
-                sample[key][:, :, 1] = sample[key][:, :, 2] * sample[key][:, :, 1]
+        for key in self.get_plan(sample):
+            flow = np.array(sample[key], dtype=self.work_dtype)
+            # Set flow values for invalid pixels to 0 (e.g. for padded pixels at the corners)
+            flow[:, :, 0:2] *= flow[:, :, 2:3]
+            sample[key] = flow
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class LoadNumerics(object):
+class LoadNumerics(PlannedTransform, PrecisionTransform):
     """ Loads the numeric values, which are not images and are not subject to image pre-processing """
 
-    def __init__(self):
-        pass
+    def __init__(self, dtype='float32'):
+        super().__init__(dtype)
+
+    def _plan(self, keys):
+        high_precision_keys = _image_keys(keys, HIGH_PRECISION_NUMERICNAMES)
+        numeric_keys = tuple(key for key in _image_keys(keys, NUMERICNAMES) if key not in high_precision_keys)
+        return high_precision_keys, numeric_keys
 
     def __call__(self, sample):
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in NUMERICNAMES):
-                sample[key] = np.array(sample[key]).astype(np.float)
+        high_precision_keys, numeric_keys = self.get_plan(sample)
+        for key in high_precision_keys:
+            sample[key] = np.array(sample[key], dtype=np.float64)
+        for key in numeric_keys:
+            sample[key] = np.array(sample[key], dtype=self.work_dtype)
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class ExchangeStereo(object):
+class ExchangeStereo(PlannedTransform):
     """ Exchanges the roles of the left and the right image """
 
     def __init__(self):
@@ -383,29 +521,25 @@ class ExchangeStereo(object):
     def _should_flip(self):
         return True
 
-    def __call__(self, sample):
-        if not self._should_flip():
-            return sample
-
-        new_sample = {}
-
-        for key in sample:
+    def _plan(self, keys):
+        key_pairs = []
+        for key in keys:
+            new_key = key
             if isinstance(key, tuple) and len(key) == 3:
                 name = key[0]
-            else:
-                new_sample[key] = sample[key]
-                continue
+                if any(item in name for item in IMAGENAMES):
+                    if 'right' in name:
+                        new_key = (key[0][:-6], key[1], key[2])
+                    else:
+                        new_key = (key[0] + '_right', key[1], key[2])
+            key_pairs.append((key, new_key))
+        return tuple(key_pairs)
 
-            if any(item in name for item in IMAGENAMES):
-                if 'right' in name:
-                    new_key = (key[0][:-6], key[1], key[2])
-                else:
-                    new_key = (key[0] + '_right', key[1], key[2])
-
-                new_sample[new_key] = sample[key]
+    def __call__(self, sample):
+        if not self._should_flip():
+            return sample
 
-            else:
-                new_sample[key] = sample[key]
+        new_sample = {new_key: sample[key] for key, new_key in self.get_plan(sample)}
 
         if 'stereo_T' in new_sample:
             new_sample['stereo_T'][0, 3] *= -1
@@ -423,17 +557,18 @@ class RandomExchangeStereo(ExchangeStereo):
         return random.uniform(0, 1) < 0.5
 
 
-class RemoveRightStereo(object):
+class RemoveRightStereo(PlannedTransform):
     """ Removes right stereo images """
 
     def __init__(self):
         pass
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('right',))
+
     def __call__(self, sample):
-        for key in list(sample.keys()):
-            if isinstance(key, tuple) and len(key) == 3:
-                if 'right' in key[0]:
-                    del sample[key]
+        for key in self.get_plan(sample):
+            del sample[key]
 
         return sample
 
@@ -441,7 +576,7 @@ class RemoveRightStereo(object):
         return type(self).__name__ == other.__name__
 
 
-class MultipleImageTransform(object):
+class MultipleImageTransform(PlannedTransform):
     """ If the flow_validation_mode is active, flow images will not be converted to PIL images. This means that
      all image-altering transforms have to ignore the flow image in this mode. All transforms that modify multiple
      image categories including flow inherit from this class. """
@@ -451,6 +586,40 @@ class MultipleImageTransform(object):
 
     def set_flow_mode(self, flow_validation_mode):
         self.flow_validation_mode = flow_validation_mode
+        self.reset_plan()
+
+    def _flow_keys(self, keys):
+        """ Returns the keys of all flow arrays at scale 0 that are altered by the transform """
+        if self.flow_validation_mode:
+            return ()
+        return tuple(key for key in _image_keys(keys, ('flow',)) if key[-1] == 0)
+
+    def _crop_plan(self, keys, size_names):
+        """ Returns the key of the image that defines the image size, the keys of all images and flow arrays that are
+        cropped and the keys of all camera intrinsics that are adapted by a crop """
+        size_key = next((key for key in _image_keys(keys, size_names) if key[-1] == 0), None)
+        crop_keys = []
+        intrinsics_keys = []
+        for key in keys:
+            if isinstance(key, tuple) and key[-1] == 0:
+                name = key[0]
+            else:
+                continue
+            if any(item in name for item in PIL_IMAGENAMES):
+                crop_keys.append(key)
+            elif 'camera_intrinsics' in name or 'K' in name:
+                intrinsics_keys.append(key)
+        return size_key, tuple(crop_keys), self._flow_keys(keys), tuple(intrinsics_keys)
+
+    def _get_cropper(self, crop_shape):
+        """ Returns a CenterCrop for the given shape that is kept between samples so that its plans are reused """
+        cropper = self.__dict__.get('_cropper')
+        if cropper is None or cropper.flow_validation_mode != self.flow_validation_mode:
+            cropper = CenterCrop(crop_shape)
+            cropper.set_flow_mode(self.flow_validation_mode)
+            self._cropper = cropper
+        cropper.output_size = crop_shape
+        return cropper
 
 
 class RandomHorizontalFlip(MultipleImageTransform):
@@ -459,18 +628,18 @@ class RandomHorizontalFlip(MultipleImageTransform):
     def __init__(self):
         super().__init__()
 
+    def _plan(self, keys):
+        flow_keys = () if self.flow_validation_mode else _image_keys(keys, ('flow',))
+        return _image_keys(keys, PIL_IMAGENAMES), flow_keys
+
     def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
         is_flip = random.uniform(0, 1) < 0.5
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames) and is_flip:
+        if is_flip:
+            image_keys, flow_keys = self.get_plan(sample)
+            for key in image_keys:
                 sample[key] = transforms_fun.hflip(sample[key])
+            for key in flow_keys:
+                sample[key] = flip_flow(sample[key], horizontal=True)
         if is_flip and 'stereo_T' in list(sample.keys()):
             sample['stereo_T'][0, 3] *= -1
         return sample
@@ -485,50 +654,49 @@ class RandomVerticalFlip(MultipleImageTransform):
     def __init__(self):
         super().__init__()
 
+    def _plan(self, keys):
+        flow_keys = () if self.flow_validation_mode else _image_keys(keys, ('flow',))
+        return _image_keys(keys, PIL_IMAGENAMES), flow_keys
+
     def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
         is_flip = random.uniform(0, 1) < 0.5
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames) and is_flip:
+        if is_flip:
+            image_keys, flow_keys = self.get_plan(sample)
+            for key in image_keys:
                 sample[key] = transforms_fun.vflip(sample[key])
+            for key in flow_keys:
+                sample[key] = flip_flow(sample[key], horizontal=False)
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class CreateScaledImage(object):
+class CreateScaledImage(PlannedTransform):
     """ Creates the scaled image objects inside the dictionary, no parameters """
 
     def __init__(self, keep_originals=True):
         self.keep_originals = keep_originals
 
+    def _plan(self, keys):
+        key_pairs = []
+        for key in keys:
+            if isinstance(key, tuple) and len(key) == 3:
+                key_pairs.append((key, (key[0], key[1], 0)))
+            elif isinstance(key, tuple) and len(key) == 2:
+                key_pairs.append((key, (key[0], 0)))
+            else:
+                key_pairs.append((key, key))
+        return tuple(key_pairs)
+
     def __call__(self, sample):
         new_sample = dict()
 
         if self.keep_originals:
             new_sample.update(sample)
 
-        for key in sample:
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-                frame = key[1]
-
-                new_sample[(name, frame, 0)] = sample[key]
-
-            elif isinstance(key, tuple) and len(key) == 2:
-                name = key[0]
-
-                new_sample[(name, 0)] = sample[key]
-
-            else:
-                new_sample[key] = sample[key]
+        for key, new_key in self.get_plan(sample):
+            new_sample[new_key] = sample[key]
 
         return new_sample
 
@@ -560,32 +728,37 @@ class RandomRotate(MultipleImageTransform):
             self.rotation = rotation
         self.fraction = fraction
 
-    def __call__(self, sample):
-        # List of image types that will be resampled using nearest-neighbor-interpolation
-        resample_nearest_list = ['segmentation', 'depth']
-        if not self.flow_validation_mode:
-            resample_nearest_list.append('flow')
+    def _plan(self, keys):
+        bilinear_keys = []
+        nearest_keys = []
+        for key in _image_keys(keys, IMAGENAMES):
+            name = key[0]
+            if key[-1] != 0:
+                continue
+            if 'color' in name or ('depth' in name and 'processed' in name):
+                bilinear_keys.append(key)
+            elif any(keyword in name for keyword in NEAREST_IMAGENAMES):
+                nearest_keys.append(key)
+        if self._flow_keys(keys):
+            raise NotImplementedError('RandomRotate does not support optical flow, please use the '
+                                      'flow_validation_mode')
+        return tuple(bilinear_keys), tuple(nearest_keys)
 
+    def __call__(self, sample):
         is_rotate = random.uniform(0, 1) < self.fraction
         run_rotation = random.uniform(self.rotation[0], self.rotation[1])
         max_rotation = max(abs(self.rotation[0]), abs(self.rotation[1]))
         im_shape = sample[('color', 0, 0)].size
         crop_shape = self._getCropSize(im_shape[0], im_shape[1], max_rotation)
-        cropper = CenterCrop(crop_shape)
-        cropper.set_flow_mode(self.flow_validation_mode)
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3 and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in IMAGENAMES) and is_rotate:
-                if 'color' in name or ('depth' in name and 'processed' in name):
-                    sample[key] = transforms_fun.affine(sample[key], angle=run_rotation, translate=(0, 0),
-                                                        scale=1.0, shear=0, resample=InterpolationMode.BILINEAR)
-                elif any(keyword in name for keyword in resample_nearest_list):
-                    sample[key] = transforms_fun.affine(sample[key], angle=run_rotation, translate=(0, 0),
-                                                        scale=1.0, shear=0, resample=InterpolationMode.NEAREST)
+        cropper = self._get_cropper(crop_shape)
         if is_rotate:
+            bilinear_keys, nearest_keys = self.get_plan(sample)
+            for key in bilinear_keys:
+                sample[key] = transforms_fun.affine(sample[key], angle=run_rotation, translate=(0, 0),
+                                                    scale=1.0, shear=0, resample=InterpolationMode.BILINEAR)
+            for key in nearest_keys:
+                sample[key] = transforms_fun.affine(sample[key], angle=run_rotation, translate=(0, 0),
+                                                    scale=1.0, shear=0, resample=InterpolationMode.NEAREST)
             sample = cropper(sample)
         return sample
 
@@ -645,26 +818,23 @@ class RandomTranslate(MultipleImageTransform):
             self.translation = translation
         self.fraction = fraction
 
-    def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
+    def _plan(self, keys):
+        return tuple(key for key in _image_keys(keys, PIL_IMAGENAMES) if key[-1] == 0), self._flow_keys(keys)
 
+    def __call__(self, sample):
         is_trans = random.uniform(0, 1) < self.fraction
         run_translate = (random.randint(-self.translation[0], self.translation[0]),
                          random.randint(-self.translation[1], self.translation[1]))
         im_shape = sample[('color', 0, 0)].size
         crop_shape = (im_shape[1] - 2*self.translation[1], im_shape[0] - 2*self.translation[0])
-        cropper = CenterCrop(crop_shape)
-        cropper.set_flow_mode(self.flow_validation_mode)
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3 and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames) and is_trans:
-                sample[key] = transforms_fun.affine(sample[key], angle=0, translate=run_translate, scale=1.0, shear=0)
+        cropper = self._get_cropper(crop_shape)
         if is_trans:
+            image_keys, flow_keys = self.get_plan(sample)
+            for key in image_keys:
+                sample[key] = transforms_fun.affine(sample[key], angle=0, translate=run_translate, scale=1.0, shear=0)
+            for key in flow_keys:
+                height, width = sample[key].shape[:2]
+                sample[key] = crop_flow(sample[key], -run_translate[1], -run_translate[0], height, width)
             sample = cropper(sample)
         return sample
 
@@ -691,12 +861,30 @@ class RandomRescale(MultipleImageTransform):
             self.scale = scale
         self.fraction = fraction
 
-    def __call__(self, sample):
-        # List of image types that will be resized using nearest-neighbor-interpolation
-        resize_nearest_list = ['segmentation', 'depth']
-        if not self.flow_validation_mode:
-            resize_nearest_list.append('flow')
+    def _plan(self, keys):
+        interp_keys = []
+        nearest_keys = []
+        depth_keys = []
+        intrinsics_keys = []
+        for key in keys:
+            if isinstance(key, tuple) and key[-1] == 0:
+                name = key[0]
+            else:
+                continue
+            if any(item in name for item in IMAGENAMES):
+                if 'color' in name or ('depth' in name and 'processed' in name):
+                    interp_keys.append(key)
+                elif any(keyword in name for keyword in NEAREST_IMAGENAMES):
+                    nearest_keys.append(key)
 
+            if 'depth' in name:
+                depth_keys.append(key)
+            elif 'camera_intrinsics' in name or 'K' in name:
+                intrinsics_keys.append(key)
+        return tuple(interp_keys), tuple(nearest_keys), self._flow_keys(keys), tuple(depth_keys), \
+            tuple(intrinsics_keys)
+
+    def __call__(self, sample):
         is_rescale = random.uniform(0, 1) < self.fraction
         if len(self.scale) == 2:
             run_scale = random.uniform(self.scale[0], self.scale[1])
@@ -707,24 +895,21 @@ class RandomRescale(MultipleImageTransform):
         output_size = (int(native_im_shape[1] // run_scale), int(native_im_shape[0] // run_scale))
         resize_interp = transforms.Resize(output_size, interpolation=InterpolationMode.BILINEAR)
         resize_nearest = transforms.Resize(output_size, interpolation=InterpolationMode.NEAREST)
-        for key in sample.keys():
-            if isinstance(key, tuple) and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in IMAGENAMES) and is_rescale:
-                if 'color' in name or ('depth' in name and 'processed' in name):
-                    sample[key] = resize_interp(sample[key])
-                elif any(keyword in name for keyword in resize_nearest_list):
-                    sample[key] = resize_nearest(sample[key])
-
-            if 'depth' in name:
-                sample[key] = pil.fromarray(np.asarray(sample[key])/run_scale)
-            elif 'camera_intrinsics' in name or 'K' in name:
-                K = sample[key]
-                K[0, :] = K[0, :] / run_scale
-                K[1, :] = K[1, :] / run_scale
-                sample[key] = K
+        interp_keys, nearest_keys, flow_keys, depth_keys, intrinsics_keys = self.get_plan(sample)
+        if is_rescale:
+            for key in interp_keys:
+                sample[key] = resize_interp(sample[key])
+            for key in nearest_keys:
+                sample[key] = resize_nearest(sample[key])
+            for key in flow_keys:
+                sample[key] = resize_flow(sample[key], output_size)
+        for key in depth_keys:
+            sample[key] = pil.fromarray(np.asarray(sample[key], dtype=np.float32) / run_scale)
+        for key in intrinsics_keys:
+            K = sample[key]
+            K[0, :] = K[0, :] / run_scale
+            K[1, :] = K[1, :] / run_scale
+            sample[key] = K
         return sample
 
     def __eq__(self, other):
@@ -734,11 +919,12 @@ class RandomRescale(MultipleImageTransform):
 class Resize(MultipleImageTransform):
     """ Rescales the image in a sample to a given size """
 
-    def __init__(self, output_size, image_types=None, exceptions=None, aspect_ratio=False, multiple_of=1):
+    def __init__(self, output_size=None, image_types=None, exceptions=None, aspect_ratio=False, multiple_of=1,
+                 bucketing=False, bucket_shapes=None):
         """ Creates a Resize object.
 
         :param output_size: output size of the image, it is resized always from native resolution. Can be an integer to
-            specify the new scale in y direction or a tuple for x and y direction
+            specify the new scale in y direction or a tuple for x and y direction. Is not used if bucketing is True.
         :param image_types: image types which are supposed to be resized
         :param exceptions: image types which are not to be resized
         :param aspect_ratio: preserve the aspect ratio when resizing (only if output_size is of type tuple). The bigger
@@ -747,13 +933,19 @@ class Resize(MultipleImageTransform):
         :param multiple_of: if aspect_ratio is True, the dimension having the smaller scale factor will be additionally
             shrunk to being a multiple of multiple_of, e. g. multiple_of = 16, then the y-dimension of the aspect_ratio
             example will be a multiple of 16 and maximally 0.8 * native_y.
+        :param bucketing: if True, every image is resized to the bucket shape with the closest aspect ratio, so that
+            all images of a batch from the AspectRatioBatchSampler have the same size
+        :param bucket_shapes: list of (height, width) of the buckets. If None, the shapes are set by the
+            AspectRatioBatchSampler.
         """
-        assert isinstance(output_size, (int, tuple))
         super().__init__()
-        if isinstance(output_size, int):
-            assert output_size > 0, 'output_size must be > 0'
-        else:
-            assert output_size[0] > 0 and output_size[1] > 0, 'output_size must be > 0'
+        assert isinstance(bucketing, bool), "bucketing must be of type bool"
+        if not bucketing:
+            assert isinstance(output_size, (int, tuple))
+            if isinstance(output_size, int):
+                assert output_size > 0, 'output_size must be > 0'
+            else:
+                assert output_size[0] > 0 and output_size[1] > 0, 'output_size must be > 0'
         assert isinstance(aspect_ratio, bool), "aspect ratio must be of type bool"
         assert isinstance(multiple_of, int) and multiple_of > 0, "multiple_of must be type int and > 0"
         self.output_size = output_size
@@ -761,25 +953,21 @@ class Resize(MultipleImageTransform):
         self.exceptions = exceptions
         self.aspect_ratio = aspect_ratio
         self.mof = multiple_of
-
-    def __call__(self, sample):
-        # List of image types that will be resized using nearest-neighbor-interpolation
-        resize_nearest_list = ['segmentation', 'depth']
-        if not self.flow_validation_mode:
-            resize_nearest_list.append('flow')
-
-        native_im_shape = sample[('color', 0, 0)].size
-        output_size = self.output_size
-
-        if self.aspect_ratio and isinstance(self.output_size, tuple):
-            scale_0 = self.output_size[0] / native_im_shape[1]
-            scale_1 = self.output_size[1] / native_im_shape[0]
-            output_size = self.get_new_dim(native_im_shape, max(scale_0, scale_1))
-
-        resize_interp = transforms.Resize(output_size, interpolation=InterpolationMode.BILINEAR)
-        resize_nearest = transforms.Resize(output_size, interpolation=InterpolationMode.NEAREST)
-
-        for key in list(sample.keys()):
+        self.bucketing = bucketing
+        self.bucket_shapes = None
+        if bucket_shapes is not None:
+            self.set_bucket_shapes(bucket_shapes)
+
+    def set_bucket_shapes(self, bucket_shapes):
+        """ Sets the (height, width) of the buckets if bucketing is used """
+        self.bucket_shapes = [tuple(int(dim) for dim in shape) for shape in bucket_shapes]
+
+    def _plan(self, keys):
+        interp_keys = []
+        nearest_keys = []
+        flow_keys = []
+        intrinsics_keys = []
+        for key in keys:
             if isinstance(key, tuple) and key[-1] == 0:
                 name = key[0]
             else:
@@ -791,14 +979,45 @@ class Resize(MultipleImageTransform):
                 continue
 
             if 'color' in name or ('depth' in name and 'processed' in name):
-                sample[key] = resize_interp(sample[key])
-            elif any(keyword in name for keyword in resize_nearest_list):
-                sample[key] = resize_nearest(sample[key])
+                interp_keys.append(key)
+            elif any(keyword in name for keyword in NEAREST_IMAGENAMES):
+                nearest_keys.append(key)
+            elif 'flow' in name:
+                if not self.flow_validation_mode:
+                    flow_keys.append(key)
             elif 'camera_intrinsics' in name or 'K' in name:
-                K = sample[key].copy()
-                K[0, :] *= self.output_size[1] / native_im_shape[0]
-                K[1, :] *= self.output_size[0] / native_im_shape[1]
-                sample[key] = K
+                intrinsics_keys.append(key)
+        return tuple(interp_keys), tuple(nearest_keys), tuple(flow_keys), tuple(intrinsics_keys)
+
+    def __call__(self, sample):
+        native_im_shape = sample[('color', 0, 0)].size
+        output_size = self.output_size
+
+        if self.bucketing:
+            assert self.bucket_shapes is not None, 'The bucket shapes have to be set to use bucketing'
+            bucket = bucket_indices((native_im_shape[1], native_im_shape[0]), self.bucket_shapes)[0]
+            output_size = self.bucket_shapes[bucket]
+        elif self.aspect_ratio and isinstance(self.output_size, tuple):
+            scale_0 = self.output_size[0] / native_im_shape[1]
+            scale_1 = self.output_size[1] / native_im_shape[0]
+            output_size = self.get_new_dim(native_im_shape, max(scale_0, scale_1))
+
+        resize_interp = transforms.Resize(output_size, interpolation=InterpolationMode.BILINEAR)
+        resize_nearest = transforms.Resize(output_size, interpolation=InterpolationMode.NEAREST)
+
+        interp_keys, nearest_keys, flow_keys, intrinsics_keys = self.get_plan(sample)
+        for key in interp_keys:
+            sample[key] = resize_interp(sample[key])
+        for key in nearest_keys:
+            sample[key] = resize_nearest(sample[key])
+        new_h, new_w = resized_size(*native_im_shape, output_size)
+        for key in flow_keys:
+            sample[key] = resize_flow(sample[key], (new_h, new_w))
+        for key in intrinsics_keys:
+            K = sample[key].copy()
+            K[0, :] *= new_w / native_im_shape[0]
+            K[1, :] *= new_h / native_im_shape[1]
+            sample[key] = K
         return sample
 
     def __eq__(self, other):
@@ -825,15 +1044,11 @@ class MultiResize(MultipleImageTransform):
         self.image_types = image_types
         self.exceptions = exceptions
 
-    def __call__(self, sample):
-        # List of image types that will be resized using nearest-neighbor-interpolation
-        resize_nearest_list = ['segmentation', 'depth']
-        if not self.flow_validation_mode:
-            resize_nearest_list.append('flow')
-
-        native_im_shape = np.array(sample[('color', 0, 0)].size)
-        native_im_shape = np.roll(native_im_shape, 1)
-        for key in list(sample.keys()):
+    def _plan(self, keys):
+        """ Returns (key, kind, new keys) for every entry that is resized, where kind is the interpolation mode, 'flow'
+        or None for the camera intrinsics """
+        targets = []
+        for key in keys:
             if isinstance(key, tuple) and key[-1] == 0:
                 name = key[0]
             else:
@@ -844,24 +1059,38 @@ class MultiResize(MultipleImageTransform):
             if self.exceptions is not None and any(item in name for item in self.exceptions):
                 continue
 
-            for scale in self.scales:
+            if 'color' in name or ('depth' in name and 'processed' in name):
+                kind = InterpolationMode.BILINEAR
+            elif any(keyword in name for keyword in NEAREST_IMAGENAMES):
+                kind = InterpolationMode.NEAREST
+            elif 'flow' in name:
+                if self.flow_validation_mode:
+                    continue
+                kind = 'flow'
+            elif 'camera_intrinsics' in name or 'K' in name:
+                kind = None
+            else:
+                continue
+            new_keys = tuple((scale, key[:-1] + (scale,)) for scale in self.scales)
+            targets.append((key, kind, new_keys))
+        return tuple(targets)
+
+    def __call__(self, sample):
+        native_im_shape = np.array(sample[('color', 0, 0)].size)
+        native_im_shape = np.roll(native_im_shape, 1)
+        for key, kind, new_keys in self.get_plan(sample):
+            image = sample[key]
+            for scale, new_key in new_keys:
                 scale_factor = 2 ** scale
-                if 'color' in name or ('depth' in name and 'processed' in name):
-                    new_image = transforms_fun.resize(sample[key], native_im_shape//scale_factor,
-                                                      interpolation=InterpolationMode.BILINEAR)
-                elif any(keyword in name for keyword in resize_nearest_list):
-                    new_image = transforms_fun.resize(sample[key], native_im_shape//scale_factor,
-                                                      interpolation=InterpolationMode.NEAREST)
-                elif 'camera_intrinsics' in name or 'K' in name:
-                    K = sample[key].copy()
-                    K[0, :] = K[0, :] / scale_factor
-                    K[1, :] = K[1, :] / scale_factor
-                    new_image = K
-
-                new_key = list(key)
-                new_key[-1] = scale
-                new_key = tuple(new_key)
-                sample.update({new_key: new_image})
+                if kind == 'flow':
+                    new_image = resize_flow(image, native_im_shape//scale_factor)
+                elif kind is not None:
+                    new_image = transforms_fun.resize(image, native_im_shape//scale_factor, interpolation=kind)
+                else:
+                    new_image = image.copy()
+                    new_image[0, :] = new_image[0, :] / scale_factor
+                    new_image[1, :] = new_image[1, :] / scale_factor
+                sample[new_key] = new_image
         return sample
 
     def __eq__(self, other):
@@ -889,19 +1118,26 @@ class RandomCrop(MultipleImageTransform):
             self.output_size = output_size
         self.pad_if_needed = pad_if_needed
 
-    def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
+    def _plan(self, keys):
+        return self._crop_plan(keys, PIL_IMAGENAMES)
 
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in IMAGENAMES) and key[-1] == 0:
-                w, h = sample[key].size[:2]
-                break
+    def _get_position(self, sample, h, w, new_h, new_w, padding):
+        """ Returns the upper left corner (top, left) of the crop window
+
+        :param sample: the sample that is cropped
+        :param h: height of the (padded) images
+        :param w: width of the (padded) images
+        :param new_h: height of the crop
+        :param new_w: width of the crop
+        :param padding: (width, height) of the padding on each side of the images
+        """
+        top = np.random.randint(0, h - new_h + 1)
+        left = np.random.randint(0, w - new_w + 1)
+        return top, left
+
+    def __call__(self, sample):
+        size_key, crop_keys, flow_keys, intrinsics_keys = self.get_plan(sample)
+        w, h = sample[size_key].size[:2]
         new_h, new_w = self.output_size
         side_padding = False
         if self.pad_if_needed:
@@ -912,23 +1148,22 @@ class RandomCrop(MultipleImageTransform):
             side_padding_size = (side_padding_size_w, side_padding_size_h)
             if side_padding_size != (0,0):
                 side_padding = True
-        top = np.random.randint(0, h - new_h + 1)
-        left = np.random.randint(0, w - new_w + 1)
-
-        for key in sample.keys():
-            if isinstance(key, tuple) and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames):
-                if side_padding:
-                    sample[key] = transforms_fun.pad(sample[key], padding=side_padding_size, fill=0)
-                sample[key] = transforms_fun.crop(sample[key], top, left, new_h, new_w)
-            elif 'camera_intrinsics' in name or 'K' in name:
-                K = sample[key]
-                K[0, 2] = new_w / 2.0
-                K[1, 2] = new_h / 2.0
-                sample[key] = K
+        padding = side_padding_size if side_padding else (0, 0)
+        top, left = self._get_position(sample, h, w, new_h, new_w, padding)
+
+        for key in crop_keys:
+            if side_padding:
+                sample[key] = transforms_fun.pad(sample[key], padding=side_padding_size, fill=0)
+            sample[key] = transforms_fun.crop(sample[key], top, left, new_h, new_w)
+        for key in flow_keys:
+            # The flow is cropped from the unpadded array, areas outside of it are invalid
+            padding_w, padding_h = padding
+            sample[key] = crop_flow(sample[key], top - padding_h, left - padding_w, new_h, new_w)
+        for key in intrinsics_keys:
+            K = sample[key]
+            K[0, 2] = new_w / 2.0
+            K[1, 2] = new_h / 2.0
+            sample[key] = K
 
         return sample
 
@@ -936,6 +1171,54 @@ class RandomCrop(MultipleImageTransform):
         return type(self).__name__ == other.__name__
 
 
+class ClassAwareRandomCrop(RandomCrop):
+    """ RandomCrop that places the crop window preferably around rare classes. The classes and their coarse positions
+    are taken from a class index (see dataloader/file_io/class_indexer.py), so no segmentation mask is decoded. The
+    dataset has to be created with the same class index, so that every sample contains its row in the index. The
+    transform has to be placed in front of any flip, since the positions in the index refer to the unflipped images.
+    """
+
+    def __init__(self, output_size, class_index, threshold=0.1, probability=0.5, pad_if_needed=False):
+        """ Creates a ClassAwareRandomCrop object
+
+        :param output_size: Desired output size. If int, square crop is made.
+        :type output_size: tuple or int
+        :param class_index: ClassIndex of the split that is loaded
+        :param threshold: image frequency below which a class counts as rare (see ClassIndex.class_repeat_factors)
+        :param probability: probability to center the crop on a rare class. Otherwise, a normal random crop is made.
+        :param pad_if_needed: If true, the image is padded at the sides to match the desired output size
+        :type pad_if_needed: boolean
+        """
+        super().__init__(output_size, pad_if_needed)
+        self.class_index = class_index
+        self.probability = probability
+        self.class_factors = class_index.class_repeat_factors(threshold)
+        self.presence = class_index.presence()
+
+    def _get_position(self, sample, h, w, new_h, new_w, padding):
+        if CLASS_INDEX_KEY not in sample or np.random.rand() >= self.probability:
+            return super()._get_position(sample, h, w, new_h, new_w, padding)
+        row = int(sample[CLASS_INDEX_KEY])
+        classes = np.flatnonzero(self.presence[row] & (self.class_factors > 1))
+        if len(classes) == 0:
+            return super()._get_position(sample, h, w, new_h, new_w, padding)
+
+        # Choose one of the rare classes in the image, a cell in which it occurs and a random point in that cell
+        weights = self.class_factors[classes]
+        class_id = np.random.choice(classes, p=weights / weights.sum())
+        cells = self.class_index.cells(row, class_id)
+        cell_y, cell_x = cells[np.random.randint(len(cells))]
+        grid_h, grid_w = self.class_index.grid_size
+        padding_w, padding_h = padding
+        y = padding_h + int((cell_y + np.random.rand()) * (h - 2 * padding_h) / grid_h)
+        x = padding_w + int((cell_x + np.random.rand()) * (w - 2 * padding_w) / grid_w)
+
+        # Choose the window randomly among all windows that contain the point
+        top = np.random.randint(max(0, y - new_h + 1), min(h - new_h, y) + 1)
+        left = np.random.randint(max(0, x - new_w + 1), min(w - new_w, x) + 1)
+        return top, left
+
+
 class CenterCrop(MultipleImageTransform):
     """Center crop the image in a sample. All images must have same dimension! If the size of the crops
     exceeds the image size, an automatic padding is performed at the borders for the color, depth and
@@ -956,34 +1239,27 @@ class CenterCrop(MultipleImageTransform):
             self.output_size = output_size
         self.pad_if_needed = pad_if_needed
 
-    def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
+    def _plan(self, keys):
+        return self._crop_plan(keys, PIL_IMAGENAMES)
 
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in IMAGENAMES) and key[-1] == 0:
-                w, h = sample[key].size[:2]
-                break
+    def __call__(self, sample):
+        _, crop_keys, flow_keys, intrinsics_keys = self.get_plan(sample)
         new_h, new_w = self.output_size
         centercrop = transforms.CenterCrop((new_h, new_w))
-        for key in sample.keys():
-            if isinstance(key, tuple) and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames):
-                sample[key] = centercrop(sample[key])
-            elif 'camera_intrinsics' in name or 'K' in name:
-                K = sample[key]
-
-                K[0, 2] = new_w / 2.0
-                K[1, 2] = new_h / 2.0
-                sample[key] = K
+        for key in crop_keys:
+            sample[key] = centercrop(sample[key])
+        for key in flow_keys:
+            # Same crop position as transforms.CenterCrop
+            h, w = sample[key].shape[:2]
+            top = int(round((h - new_h) / 2.0)) if h >= new_h else -((int(new_h) - h) // 2)
+            left = int(round((w - new_w) / 2.0)) if w >= new_w else -((int(new_w) - w) // 2)
+            sample[key] = crop_flow(sample[key], top, left, int(new_h), int(new_w))
+        for key in intrinsics_keys:
+            K = sample[key]
+
+            K[0, 2] = new_w / 2.0
+            K[1, 2] = new_h / 2.0
+            sample[key] = K
 
         return sample
 
@@ -1009,37 +1285,27 @@ class SidesCrop(MultipleImageTransform):
         self.height = hw[0]
         self.width = hw[1]
 
-    def __call__(self, sample):
-        imagenames = IMAGENAMES.copy()
-        if self.flow_validation_mode:
-            imagenames.remove('flow')
+    def _plan(self, keys):
+        return self._crop_plan(keys, PIL_IMAGENAMES)
 
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames) and key[-1] == 0:
-                w, h = sample[key].size[:2]
-                break
+    def __call__(self, sample):
+        size_key, crop_keys, flow_keys, intrinsics_keys = self.get_plan(sample)
+        w, h = sample[size_key].size[:2]
         new_w, new_h = self.width, self.height
-        for key in sample.keys():
-            if isinstance(key, tuple) and key[-1] == 0:
-                name = key[0]
-            else:
-                continue
-            if any(item in name for item in imagenames):
-                sample[key] = transforms_fun.crop(sample[key], 0, 0, self.height, self.width)
-            elif 'camera_intrinsics' in name or 'K' in name:
-                K = sample[key]
+        for key in crop_keys:
+            sample[key] = transforms_fun.crop(sample[key], 0, 0, self.height, self.width)
+        for key in flow_keys:
+            sample[key] = crop_flow(sample[key], 0, 0, self.height, self.width)
+        for key in intrinsics_keys:
+            K = sample[key]
 
-                K[0, 0] *= new_w / w
-                K[1, 1] *= new_h / h
+            K[0, 0] *= new_w / w
+            K[1, 1] *= new_h / h
 
-                K[0, 2] = new_w / 2.0
-                K[1, 2] = new_h / 2.0
+            K[0, 2] = new_w / 2.0
+            K[1, 2] = new_h / 2.0
 
-                sample[key] = K
+            sample[key] = K
 
         return sample
 
@@ -1047,7 +1313,7 @@ class SidesCrop(MultipleImageTransform):
         return type(self).__name__ == other.__name__
 
 
-class CreateColoraug(object):
+class CreateColoraug(PlannedTransform):
     """ Creates the color_aug object from the color images """
 
     def __init__(self, scales=[0], new_element=True):
@@ -1060,8 +1326,10 @@ class CreateColoraug(object):
         self.new_element = new_element
         self.scales = scales
 
-    def __call__(self, sample):
-        for key in list(sample.keys()):
+    def _plan(self, keys):
+        color_keys = []
+        intrinsics_keys = []
+        for key in keys:
             if isinstance(key, tuple):
                 name = key[0]
                 scale = key[-1]
@@ -1071,15 +1339,21 @@ class CreateColoraug(object):
                 continue
 
             if 'color' in name:
-                sample.update({(name + '_aug', key[1], scale): sample[key]})
-                if self.new_element is False:
-                    del sample[key]
+                color_keys.append((key, (name + '_aug', key[1], scale)))
 
             if 'K' in name:
-                K = sample[key]
-                inv_K = np.linalg.pinv(K)
+                intrinsics_keys.append((key, ('inv_K', scale)))
+        return tuple(color_keys), tuple(intrinsics_keys)
+
+    def __call__(self, sample):
+        color_keys, intrinsics_keys = self.get_plan(sample)
+        for key, aug_key in color_keys:
+            sample[aug_key] = sample[key]
+            if self.new_element is False:
+                del sample[key]
 
-                sample[('inv_K', scale)] = inv_K
+        for key, inv_key in intrinsics_keys:
+            sample[inv_key] = np.linalg.pinv(sample[key])
 
         return sample
 
@@ -1087,7 +1361,7 @@ class CreateColoraug(object):
         return type(self).__name__ == other.__name__
 
 
-class ColorJitter(object):
+class ColorJitter(PlannedTransform):
     """ Adjust the Brightness, Saturation, Contrast, Hue and gamma values of the input image. Needs a color_aug object.
     """
 
@@ -1110,6 +1384,9 @@ class ColorJitter(object):
         self.gamma = gamma
         self.fraction = fraction
 
+    def _plan(self, keys):
+        return tuple(key for key in _image_keys(keys, ('color',)) if 'aug' in key[0])
+
     def __call__(self, sample):
         run_brightness = random.uniform(max(0, 1 - self.brightness), 1 + self.brightness)
         run_contrast = random.uniform(max(0, 1 - self.contrast), 1 + self.contrast)
@@ -1119,41 +1396,36 @@ class ColorJitter(object):
 
         is_color_jitter = random.uniform(0.0, 1.0) < self.fraction
 
-        for key in list(sample.keys()):
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'color' in name and 'aug' in name:
-                image = sample[key]
-                if is_color_jitter:
-                    image = transforms_fun.adjust_brightness(image, run_brightness)
-                    image = transforms_fun.adjust_contrast(image, run_contrast)
-                    image = transforms_fun.adjust_saturation(image, run_saturation)
-                    image = transforms_fun.adjust_hue(image, run_hue)
-                    image = transforms_fun.adjust_gamma(image, run_gamma)
-
-                    # debug
-                    # np_image = np.array(image) #convert image to np array
-                    # np_image = np_image[..., ::-1]
-                    # cv2.imshow('augment', np_image)
-                    # cv2.waitKey()
-
-                sample[key] = image
+        for key in self.get_plan(sample):
+            image = sample[key]
+            if is_color_jitter:
+                image = transforms_fun.adjust_brightness(image, run_brightness)
+                image = transforms_fun.adjust_contrast(image, run_contrast)
+                image = transforms_fun.adjust_saturation(image, run_saturation)
+                image = transforms_fun.adjust_hue(image, run_hue)
+                image = transforms_fun.adjust_gamma(image, run_gamma)
 
                 # debug
-                # np_image = np.array(sample[key ])
+                # np_image = np.array(image) #convert image to np array
                 # np_image = np_image[..., ::-1]
                 # cv2.imshow('augment', np_image)
                 # cv2.waitKey()
 
+            sample[key] = image
+
+            # debug
+            # np_image = np.array(sample[key ])
+            # np_image = np_image[..., ::-1]
+            # cv2.imshow('augment', np_image)
+            # cv2.waitKey()
+
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class GaussianBlurr(object):
+class GaussianBlurr(PlannedTransform):
     """ Performs a gaussian blurr on the image. Needs a color_aug object """
 
     def __init__(self, fraction=1.0, max_rad = 1.0):
@@ -1167,37 +1439,32 @@ class GaussianBlurr(object):
         self.fraction = fraction
         self.max_rad = max_rad
 
+    def _plan(self, keys):
+        return tuple(key for key in _image_keys(keys, ('color',)) if 'aug' in key[0])
+
     def __call__(self, sample):
         blurr_radius = random.uniform(0, self.max_rad)
         is_blurr = random.uniform(0.0, 1.0) < self.fraction
-        for key in list(sample.keys()):
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'color' in name and 'aug' in name:
-                image = sample[key]
-                if is_blurr:
-                    image = image.filter(ImageFilter.GaussianBlur(radius=blurr_radius))
-                sample[key] = image
+        if is_blurr:
+            for key in self.get_plan(sample):
+                sample[key] = sample[key].filter(ImageFilter.GaussianBlur(radius=blurr_radius))
         return sample
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class RemoveOriginals(object):
+class RemoveOriginals(PlannedTransform):
     """ Remove the images at native scale to save loading time """
     def __init__(self):
         pass
 
-    def __call__(self, sample):
-        for key in list(sample.keys()):
-            if not isinstance(key, tuple):
-                continue
+    def _plan(self, keys):
+        return tuple(key for key in keys if isinstance(key, tuple) and key[-1] == -1)
 
-            if key[-1] == -1:
-                del sample[key]
+    def __call__(self, sample):
+        for key in self.get_plan(sample):
+            del sample[key]
 
         return sample
 
@@ -1205,89 +1472,222 @@ class RemoveOriginals(object):
         return type(self).__name__ == other.__name__
 
 
-class ToTensor(object):
-    """ Convert ndarrays in sample to Tensors. """
+class ToTensor(PlannedTransform, PrecisionTransform):
+    """ Convert ndarrays in sample to Tensors. Depth, flow and numerics are converted to the dtype set by the dataset.
+    """
 
-    def __init__(self):
-        pass
+    def __init__(self, dtype='float32', segmentation_dtype='float32'):
+        """ Creates a ToTensor object
 
-    def __call__(self, sample):
-        torch_dict = {}
-        transformer = transforms.ToTensor()
-        for key in sample.keys():
+        :param dtype: float dtype of the depth, flow and numeric data. Is set by the dataset.
+        :param segmentation_dtype: dtype of the segmentation tensors. With 'uint8', the workers pass compact masks that
+            can be encoded for the whole batch by BatchRelabel and BatchOneHotEncoding.
+        """
+        super().__init__(dtype)
+        self.segmentation_dtype = np.dtype(segmentation_dtype)
+
+    def _plan(self, keys):
+        """ Returns (key, kind) for all entries of the sample, where kind selects the conversion. Keys whose kind is None
+        are dropped. """
+        targets = []
+        for key in keys:
             if isinstance(key, tuple) and len(key) == 3:
                 name = key[0]
             else:
-                torch_dict.update({key: torch.from_numpy(sample[key])})
+                targets.append((key, 'array'))
                 continue
 
-            if 'segmentation' in name or 'depth' in name or 'flow' in name:
-                if len(np.array(sample[key]).shape) == 2:
-                    sample[key] = np.expand_dims(np.array(sample[key]), 2)
-                sample[key] = np.transpose(np.array(sample[key]), (2, 0, 1)).astype(np.float32)
-                torch_dict.update({key: torch.from_numpy(sample[key])})
+            if 'segmentation' in name:
+                targets.append((key, 'segmentation'))
+            elif 'depth' in name or 'flow' in name:
+                targets.append((key, 'image'))
             elif 'color' in name:
-                torch_dict.update({key: transformer(sample[key])})
+                targets.append((key, 'color'))
+            elif any(item in name for item in HIGH_PRECISION_NUMERICNAMES):
+                targets.append((key, 'array'))
             elif any(item in name for item in NUMERICNAMES):
-                torch_dict.update({key: torch.from_numpy(sample[key])})
+                targets.append((key, 'numeric'))
+        return tuple(targets)
+
+    def __call__(self, sample):
+        torch_dict = {}
+        transformer = transforms.ToTensor()
+        for key, kind in self.get_plan(sample):
+            if kind == 'array':
+                torch_dict[key] = torch.from_numpy(sample[key])
+            elif kind == 'segmentation' or kind == 'image':
+                dtype = self.segmentation_dtype if kind == 'segmentation' else self.dtype
+                image = np.array(sample[key], dtype=dtype)
+                if image.ndim == 2:
+                    image = image[np.newaxis]
+                else:
+                    image = np.ascontiguousarray(np.transpose(image, (2, 0, 1)))
+                torch_dict[key] = torch.from_numpy(image)
+            elif kind == 'color':
+                torch_dict[key] = transformer(sample[key])
             else:
-                RuntimeError
+                torch_dict[key] = torch.from_numpy(np.asarray(sample[key], dtype=self.dtype))
         return torch_dict
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
 
 
-class Relabel(object):
+class SparseDepth(PlannedTransform):
+    """ Converts the dense depth tensors created by ToTensor into a sparse representation, which reduces the amount of
+    data passed from the workers for LiDAR-based depth maps. Every ('depth', frame, scale) entry is replaced by
+    ('depth_sparse_index', frame, scale) with the flat indices of the valid (> 0) pixels as int32,
+    ('depth_sparse_value', frame, scale) with their depth values and ('depth_sparse_shape', frame, scale) with the image
+    height and width. Batches have to be collated by BaseDataset.collate_sparse and can be turned back into dense depth
+    maps by densify_depth(). Has to be executed after ToTensor.
+    """
+
+    def __init__(self):
+        pass
+
+    def _plan(self, keys):
+        targets = []
+        for key in _image_keys(keys, ('depth',)):
+            name, frame, scale = key
+            if name.endswith(SPARSE_SUFFIXES):
+                continue
+            targets.append((key, (name + SPARSE_INDEX_SUFFIX, frame, scale), (name + SPARSE_VALUE_SUFFIX, frame, scale),
+                            (name + SPARSE_SHAPE_SUFFIX, frame, scale)))
+        return tuple(targets)
+
+    def __call__(self, sample):
+        for key, index_key, value_key, shape_key in self.get_plan(sample):
+            depth = sample.pop(key)
+            assert isinstance(depth, torch.Tensor), 'SparseDepth has to be executed after ToTensor'
+            sample[shape_key] = torch.tensor(depth.shape[-2:])
+            depth = depth.reshape(-1)
+            indices = torch.nonzero(depth > 0, as_tuple=True)[0]
+            sample[index_key] = indices.to(torch.int32)
+            sample[value_key] = depth[indices]
+        return sample
+
+    def __eq__(self, other):
+        return type(self).__name__ == other.__name__
+
+
+def densify_depth(indices, values, shape):
+    """ Creates dense depth maps from the sparse representation of SparseDepth
+
+    :param indices: flat pixel indices of shape (N,) for a single sample or (B, N) for a batch collated by
+        BaseDataset.collate_sparse
+    :param values: depth values of the same shape as indices
+    :param shape: ('depth_sparse_shape', frame, scale) entry of the sample or batch
+    :return: depth maps of shape (1, H, W) or (B, 1, H, W), invalid pixels are 0
+    """
+    height, width = (int(item) for item in shape.reshape(-1, 2)[0])
+    # Padded entries of a batch point to an additional pixel behind the image, which is dropped afterwards
+    if indices.dim() == 1:
+        depth = values.new_zeros(height * width + 1)
+        depth.scatter_(0, indices.long(), values)
+        return depth[:-1].view(1, height, width)
+    depth = values.new_zeros((indices.shape[0], height * width + 1))
+    depth.scatter_(1, indices.long(), values)
+    return depth[:, :-1].view(-1, 1, height, width)
+
+
+class Relabel(PlannedTransform):
     """ Relabels the segmentation masks (throws sometimes errors, if not done!) """
 
     def __init__(self, old_label, new_label):
         self.olabel = old_label
         self.nlabel = new_label
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('segmentation',))
+
     def __call__(self, sample):
         torch_dict = sample.copy()
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                torch_dict.update({key: sample[key]})
-                continue
-
-            if 'segmentation' in name:
-                if len(np.array(sample[key]).shape) == 2:
-                    sample[key] = np.expand_dims(np.array(sample[key]), 2)
-                sample[key][sample[key] == self.olabel] = self.nlabel
-                torch_dict.update({key: sample[key]})
-            else:
-                RuntimeError
+        for key in self.get_plan(sample):
+            if len(np.array(sample[key]).shape) == 2:
+                sample[key] = np.expand_dims(np.array(sample[key]), 2)
+            sample[key][sample[key] == self.olabel] = self.nlabel
+            torch_dict.update({key: sample[key]})
         return torch_dict
 
 
-class OneHotEncoding(object):
+class OneHotEncoding(PlannedTransform):
     """ Relabels the segmentation masks (throws sometimes errors, if not done!) """
 
     def __init__(self, num_classes=20):
         self.num_classes = num_classes
 
+    def _plan(self, keys):
+        return _image_keys(keys, ('segmentation',))
+
     def __call__(self, sample):
         torch_dict = sample.copy()
-        for key in sample.keys():
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                torch_dict.update({key: sample[key]})
-                continue
-
-            if 'segmentation' in name:
-                sample[key] = torch.eye(self.num_classes)[sample[key].long()].squeeze().permute(2,0,1) # one_hot encoding
-                torch_dict.update({key: sample[key]})
-            else:
-                RuntimeError
+        for key in self.get_plan(sample):
+            sample[key] = torch.eye(self.num_classes)[sample[key].long()].squeeze().permute(2,0,1) # one_hot encoding
+            torch_dict.update({key: sample[key]})
         return torch_dict
 
 
-class NormalizeZeroMean(object):
+class BatchRelabel(PlannedTransform):
+    """ Relabels the segmentation masks of a collated batch with a lookup table. Works on integer masks (e.g. uint8
+    masks created by ToTensor(segmentation_dtype='uint8')) on any device, so the relabeling can be done after the
+    transfer of the batch instead of per sample in the workers. """
+
+    def __init__(self, old_label, new_label):
+        """ Creates a BatchRelabel object
+
+        :param old_label: label or list of labels that are replaced
+        :param new_label: new label or list of new labels with the same length as old_label
+        """
+        old_label = np.atleast_1d(old_label)
+        new_label = np.atleast_1d(new_label)
+        assert old_label.shape == new_label.shape, 'old_label and new_label must have the same length'
+        self.lut = torch.arange(256, dtype=torch.uint8)
+        self.lut[torch.as_tensor(old_label, dtype=torch.long)] = torch.as_tensor(new_label, dtype=torch.uint8)
+
+    def _plan(self, keys):
+        return _image_keys(keys, ('segmentation',))
+
+    def __call__(self, batch):
+        for key in self.get_plan(batch):
+            mask = batch[key]
+            if self.lut.device != mask.device:
+                self.lut = self.lut.to(mask.device)
+            batch[key] = self.lut[mask.long()].to(mask.dtype)
+        return batch
+
+
+class BatchOneHotEncoding(PlannedTransform):
+    """ One-hot encodes the segmentation masks of a collated batch. Masks of shape (B, 1, H, W) become tensors of shape
+    (B, num_classes, H, W) in the given dtype. Pixels with a label >= num_classes (e.g. 255) are zero in all
+    channels. """
+
+    def __init__(self, num_classes=20, dtype=torch.float32):
+        """ Creates a BatchOneHotEncoding object
+
+        :param num_classes: number of channels of the encoding
+        :param dtype: torch dtype of the encoded masks
+        """
+        self.num_classes = num_classes
+        self.dtype = dtype
+
+    def _plan(self, keys):
+        return _image_keys(keys, ('segmentation',))
+
+    def __call__(self, batch):
+        for key in self.get_plan(batch):
+            mask = batch[key]
+            assert mask.dim() == 4 and mask.shape[1] == 1, 'Masks of shape (B, 1, H, W) expected'
+            # Labels outside of the classes are scattered into an additional channel that is dropped afterwards
+            index = mask.long()
+            index.masked_fill_((index < 0) | (index > self.num_classes), self.num_classes)
+            encoded = torch.zeros((mask.shape[0], self.num_classes + 1) + tuple(mask.shape[2:]), dtype=self.dtype,
+                                  device=mask.device)
+            encoded.scatter_(1, index, 1)
+            batch[key] = encoded[:, :self.num_classes]
+        return batch
+
+
+class NormalizeZeroMean(PlannedTransform):
     """ Zero means normalization of the image to a certain range, standard values
     are for pretraining on Imagenet for torchvision models. Needs a color_aug object.
     """
@@ -1303,15 +1703,13 @@ class NormalizeZeroMean(object):
         self.mean = mean
         self.std = std
 
+    def _plan(self, keys):
+        return tuple(key for key in _image_keys(keys, ('color',)) if 'aug' in key[0])
+
     def __call__(self, sample):
         normalize = transforms.Normalize(mean=self.mean, std=self.std)
-        for key in list(sample.keys()):
-            if isinstance(key, tuple) and len(key) == 3:
-                name = key[0]
-            else:
-                continue
-            if 'color' in name and 'aug' in name:
-                sample[key] = normalize(sample[key])
+        for key in self.get_plan(sample):
+            sample[key] = normalize(sample[key])
         return sample
 
     def __eq__(self, other):
@@ -1371,3 +1769,36 @@ class AddKeyValue(object):
 
     def __eq__(self, other):
         return type(self).__name__ == other.__name__
+
+
+# Transforms that change the image geometry by cropping or flipping it
+CROP_TRANSFORMS = (RandomCrop, CenterCrop, SidesCrop)
+FLIP_TRANSFORMS = (RandomHorizontalFlip, RandomVerticalFlip)
+
+
+def commutes_with_crop(transform, crop, camera_matrix=False):
+    """ Returns True if executing the transform before or after the crop yields the same sample. This only holds for
+    transforms that alter every pixel independently of its position and its neighbours.
+
+    :param transform: transform that is executed before the crop
+    :param crop: one of the CROP_TRANSFORMS
+    :param camera_matrix: True if the samples contain a camera matrix K, whose inverse is computed by CreateColoraug
+    """
+    if isinstance(transform, ConvertDepth):
+        # Pixels padded by the crop are 0 before and after the conversion
+        return True
+    elif isinstance(transform, ConvertSegmentation):
+        # A padded 0 is a different class before and after the conversion, so only crops without padding commute
+        return not transform.original and isinstance(crop, RandomCrop) and not crop.pad_if_needed
+    elif isinstance(transform, CreateColoraug):
+        # The crop changes the principal point of K and therefore inv_K
+        return not camera_matrix
+    elif isinstance(transform, ColorJitter):
+        # The contrast adjustment depends on the mean of the whole image
+        return transform.contrast == 0
+    return False
+
+
+def commutes_with_flip(transform):
+    """ Returns True if executing the transform before or after a flip yields the same sample """
+    return isinstance(transform, (ConvertDepth, ConvertSegmentation, CreateColoraug, ColorJitter))
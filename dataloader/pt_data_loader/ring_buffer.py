@@ -0,0 +1,192 @@
+import warnings
+
+import torch
+from torch.utils.data import Dataset, DataLoader, RandomSampler, SequentialSampler, BatchSampler
+from torch.utils.data.dataloader import default_collate
+
+
+def infer_schema(batch):
+    """ Returns the schema {key: (shape, dtype)} of all tensor entries of a collated batch, where shape is the shape of
+    one sample. Entries that are not tensors (e.g. the filenames) are not part of the schema.
+
+    :param batch: batch as returned by default_collate
+    """
+    return {key: (tuple(value.shape[1:]), value.dtype) for key, value in batch.items()
+            if isinstance(value, torch.Tensor)}
+
+
+def pin_tensor(tensor):
+    """ Page-locks a tensor in shared memory in place. Memory returned by pin_memory() can not be shared between
+    processes, so the shared memory is registered with CUDA instead. Returns False and leaves the tensor unpinned if
+    the registration fails, e.g. because the limit of page-locked memory is reached.
+
+    :param tensor: CPU tensor in shared memory
+    """
+    cudart = torch.cuda.cudart()
+    result = cudart.cudaHostRegister(tensor.data_ptr(), tensor.numel() * tensor.element_size(), 0)
+    return result == cudart.cudaError.success
+
+
+def allocate_batch(schema, batch_size, pin_memory=False):
+    """ Allocates a batch buffer in shared memory that can be filled by the worker processes
+
+    :param schema: sample schema as returned by infer_schema
+    :param batch_size: number of samples per batch
+    :param pin_memory: if True and CUDA is available, the buffers are page-locked so that they can be transferred to
+        the GPU asynchronously. Buffers that cannot be page-locked stay in unpinned memory.
+    """
+    buffer = {}
+    failed = []
+    for key, (shape, dtype) in schema.items():
+        tensor = torch.empty((batch_size,) + shape, dtype=dtype).share_memory_()
+        if pin_memory and torch.cuda.is_available() and tensor.numel() > 0 and not pin_tensor(tensor):
+            failed.append(key)
+        buffer[key] = tensor
+    if failed:
+        warnings.warn('The batch buffers of {} could not be page-locked and are transferred to the GPU '
+                      'synchronously'.format(failed))
+    return buffer
+
+
+def release_batch(buffer):
+    """ Unregisters the page-locked tensors of a batch buffer from CUDA. Has to be called before the shared memory of
+    the buffer is freed.
+
+    :param buffer: batch buffer as returned by allocate_batch
+    """
+    if not torch.cuda.is_available():
+        return
+    cudart = torch.cuda.cudart()
+    for tensor in buffer.values():
+        if tensor.numel() > 0 and tensor.is_pinned():
+            cudart.cudaHostUnregister(tensor.data_ptr())
+
+
+def write_batch(buffer, samples):
+    """ Stacks the samples into the buffer without allocating new tensors. Returns the number of samples and the
+    collated entries that are not part of the buffer.
+
+    :param buffer: batch buffer as returned by allocate_batch
+    :param samples: list of samples that has at most as many elements as the buffer
+    """
+    num_samples = len(samples)
+    for key, tensor in buffer.items():
+        try:
+            torch.stack([torch.as_tensor(sample[key]) for sample in samples], out=tensor[:num_samples])
+        except (KeyError, RuntimeError) as error:
+            raise Exception('The entry {} does not match the schema of the first batch, all samples must have the same '
+                            'keys, shapes and dtypes: {}'.format(key, error))
+    extras = [{key: value for key, value in sample.items() if key not in buffer} for sample in samples]
+    if extras[0]:
+        extras = default_collate(extras)
+    else:
+        extras = {}
+    return num_samples, extras
+
+
+class _RingBufferDataset(Dataset):
+    """ Wraps the dataset for the workers. An item is a pair (slot, indices), the samples are written into the buffer
+    of the slot and only the number of samples and the non-tensor entries are sent back. """
+
+    def __init__(self, dataset, buffers):
+        self.dataset = dataset
+        self.buffers = buffers
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, item):
+        slot, indices = item
+        samples = [self.dataset[index] for index in indices]
+        num_samples, extras = write_batch(self.buffers[slot], samples)
+        return slot, num_samples, extras
+
+
+class RingBufferLoader(object):
+    """ Loads batches into a ring of preallocated batch buffers in shared memory instead of allocating new tensors for
+    every sample and batch. The keys, shapes and dtypes of the samples are inferred from the first batch, which is
+    loaded in the main process. All further batches are written by the workers directly into the buffers, and the
+    main process receives views into them.
+
+    The returned batches are only valid until the next batch is requested. Entries that are needed for longer have to
+    be copied, e.g. by moving them to the GPU. All samples must have the same keys, shapes and dtypes, i.e. variable
+    sized entries like the ones created by SparseDepth are not supported.
+    """
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, sampler=None, drop_last=False, num_workers=0,
+                 prefetch_factor=2, num_slots=None, pin_memory=False, worker_init_fn=None):
+        """
+        :param dataset: dataset that returns samples as dicts of tensors, e.g. a BaseDataset
+        :param batch_size: number of samples per batch
+        :param shuffle: if True, the samples are drawn in random order
+        :param sampler: sampler that defines the order of the samples, mutually exclusive with shuffle
+        :param drop_last: if True, the last incomplete batch is dropped
+        :param num_workers: number of worker processes
+        :param prefetch_factor: number of batches loaded in advance by every worker
+        :param num_slots: number of batch buffers. Must be larger than the number of batches that are loaded in
+            advance. Default: num_workers * prefetch_factor + 2
+        :param pin_memory: if True, the buffers are page-locked if CUDA is available
+        :param worker_init_fn: is passed to the DataLoader
+        """
+        assert not (shuffle and sampler is not None), 'shuffle and sampler are mutually exclusive'
+        if sampler is None:
+            sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+        prefetched = num_workers * prefetch_factor if num_workers > 0 else 0
+        if num_slots is None:
+            num_slots = prefetched + 2
+        assert num_slots > prefetched, 'num_slots must be larger than num_workers * prefetch_factor'
+        self.dataset = dataset
+        self.batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.num_slots = num_slots
+        self.pin_memory = pin_memory
+        self.worker_init_fn = worker_init_fn
+        self.schema = None
+        self.buffers = None
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def _create_buffers(self, first_batch):
+        self.schema = infer_schema(first_batch)
+        self.buffers = [allocate_batch(self.schema, self.batch_size, self.pin_memory) for _ in range(self.num_slots)]
+
+    def close(self):
+        """ Releases the batch buffers. Batches that have been returned before become invalid. The buffers are
+        allocated again by the next iteration. """
+        if self.buffers is None:
+            return
+        if self.pin_memory:
+            for buffer in self.buffers:
+                release_batch(buffer)
+        self.schema = None
+        self.buffers = None
+
+    def __del__(self):
+        self.close()
+
+    def __iter__(self):
+        batches = iter(self.batch_sampler)
+        if self.buffers is None:
+            indices = next(batches, None)
+            if indices is None:
+                return
+            first_batch = default_collate([self.dataset[index] for index in indices])
+            self._create_buffers(first_batch)
+            yield first_batch
+
+        items = [(i % self.num_slots, indices) for i, indices in enumerate(batches)]
+        if self.num_workers > 0:
+            loader = DataLoader(_RingBufferDataset(self.dataset, self.buffers), batch_size=None, sampler=items,
+                                num_workers=self.num_workers, prefetch_factor=self.prefetch_factor,
+                                worker_init_fn=self.worker_init_fn)
+        else:
+            ring_dataset = _RingBufferDataset(self.dataset, self.buffers)
+            loader = (ring_dataset[item] for item in items)
+
+        for slot, num_samples, extras in loader:
+            batch = {key: tensor[:num_samples] for key, tensor in self.buffers[slot].items()}
+            batch.update(extras)
+            yield batch
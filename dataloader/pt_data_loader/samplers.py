@@ -0,0 +1,136 @@
+import torch
+import numpy as np
+from torch.utils.data import Sampler
+
+import dataloader.pt_data_loader.mytransforms as mytransforms
+
+
+def create_bucket_shapes(sizes, num_buckets=4, target_pixels=None, multiple_of=32):
+    """ Creates bucket shapes for a list of image sizes. The images are divided into num_buckets groups of equal size
+    by their aspect ratio. Every bucket gets the median aspect ratio of its group and target_pixels pixels. Images with
+    the size (0, 0), i.e. images whose header could not be read, are ignored.
+
+    :param sizes: array of shape (N, 2) containing (height, width) of the images
+    :param num_buckets: maximum number of buckets
+    :param target_pixels: number of pixels of the bucket shapes. Default: median number of pixels of the images
+    :param multiple_of: height and width of the buckets are multiples of this number
+    :return: list of distinct (height, width) tuples
+    """
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    sizes = sizes[np.all(sizes > 0, axis=1)]
+    assert len(sizes) > 0, 'The bucket shapes cannot be created without any valid image size'
+    if target_pixels is None:
+        target_pixels = np.median(sizes[:, 0] * sizes[:, 1])
+    ratios = np.sort(sizes[:, 1] / sizes[:, 0])
+    bucket_shapes = []
+    for group in np.array_split(ratios, min(num_buckets, len(ratios))):
+        ratio = np.median(group)
+        height = max(1, int(round(np.sqrt(target_pixels / ratio) / multiple_of))) * multiple_of
+        width = max(1, int(round(height * ratio / multiple_of))) * multiple_of
+        if (height, width) not in bucket_shapes:
+            bucket_shapes.append((height, width))
+    return bucket_shapes
+
+
+class ClassAwareSampler(Sampler):
+    """ Oversamples the images of a dataset that contain rare classes (repeat factor sampling). Every image is drawn
+    with a probability proportional to the largest repeat factor of the classes it contains. The classes of the images
+    are taken from the class index of the dataset, so no segmentation mask is decoded while sampling.
+    """
+
+    def __init__(self, dataset, threshold=0.1, min_pixels=1, num_samples=None, replacement=True, generator=None):
+        """ Creates a ClassAwareSampler object
+
+        :param dataset: BaseDataset that has been created with a class_index
+        :param threshold: image frequency below which a class is oversampled (see ClassIndex.class_repeat_factors)
+        :param min_pixels: minimum number of pixels of a class in an image to count as present
+        :param num_samples: number of indices that are drawn per epoch. Default: length of the dataset
+        :param replacement: if False, every image is drawn at most once per epoch
+        :param generator: torch.Generator used for sampling
+        """
+        assert getattr(dataset, 'class_index', None) is not None, \
+            'The dataset has to be created with a class_index in order to use the ClassAwareSampler'
+        factors = dataset.class_index.image_repeat_factors(threshold, min_pixels)[dataset.class_index_rows]
+        self.weights = torch.as_tensor(factors, dtype=torch.double)
+        self.num_samples = len(dataset) if num_samples is None else num_samples
+        self.replacement = replacement
+        self.generator = generator
+
+    def __iter__(self):
+        indices = torch.multinomial(self.weights, self.num_samples, self.replacement, generator=self.generator)
+        return iter(indices.tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+
+class AspectRatioBatchSampler(Sampler):
+    """ Batch sampler that groups the images of a dataset into buckets of similar aspect ratio. Every batch only contains
+    images of one bucket, so together with Resize(bucketing=True) all images of a batch are resized to the shape of
+    their bucket instead of one common size. The image sizes are taken from the dataset index or read from the image
+    headers, no image is decoded.
+    """
+
+    def __init__(self, dataset, batch_size, bucket_shapes=None, num_buckets=4, target_pixels=None, multiple_of=32,
+                 shuffle=True, drop_last=False, key=('color', 0, -1), generator=None):
+        """ Creates an AspectRatioBatchSampler object. The bucket shapes are passed to all transforms of the dataset
+        that use bucketing.
+
+        :param dataset: BaseDataset
+        :param batch_size: number of images per batch
+        :param bucket_shapes: list of (height, width) of the buckets. Default: created by create_bucket_shapes
+        :param num_buckets: maximum number of buckets if bucket_shapes is None
+        :param target_pixels: number of pixels of the buckets if bucket_shapes is None
+        :param multiple_of: height and width of the buckets are multiples of this number if bucket_shapes is None
+        :param shuffle: if True, the images within the buckets and the order of the batches are shuffled every epoch
+        :param drop_last: if True, the last incomplete batch of every bucket is dropped
+        :param key: key of the images whose size determines the bucket
+        :param generator: torch.Generator used for shuffling
+        """
+        sizes = dataset.get_image_sizes(key)
+        invalid = np.flatnonzero(np.any(sizes <= 0, axis=1))
+        if len(invalid) > 0:
+            files = [dataset.data[key][i] for i in invalid[:10]]
+            raise Exception('The size of {} images of {} could not be read, e.g. of {}. Check that the files exist '
+                            'and are valid images.'.format(len(invalid), key, files))
+        if bucket_shapes is None:
+            bucket_shapes = create_bucket_shapes(sizes, num_buckets, target_pixels, multiple_of)
+        self.bucket_shapes = [tuple(shape) for shape in bucket_shapes]
+        self.buckets = mytransforms.bucket_indices(sizes, self.bucket_shapes)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+        transforms = list(dataset.data_transforms.transforms)
+        if dataset.multi_crop_transforms is not None:
+            transforms += list(dataset.multi_crop_transforms.transforms)
+        for transform in transforms:
+            if isinstance(transform, mytransforms.Resize) and transform.bucketing:
+                transform.set_bucket_shapes(self.bucket_shapes)
+
+    def _bucket_batches(self):
+        batches = []
+        for bucket in range(len(self.bucket_shapes)):
+            indices = np.flatnonzero(self.buckets == bucket)
+            if self.shuffle:
+                indices = indices[torch.randperm(len(indices), generator=self.generator).numpy()]
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size].tolist()
+                if len(batch) < self.batch_size and self.drop_last:
+                    continue
+                batches.append(batch)
+        return batches
+
+    def __iter__(self):
+        batches = self._bucket_batches()
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=self.generator).tolist()
+            batches = [batches[i] for i in order]
+        return iter(batches)
+
+    def __len__(self):
+        counts = np.bincount(self.buckets, minlength=len(self.bucket_shapes))
+        if self.drop_last:
+            return int(np.sum(counts // self.batch_size))
+        return int(np.sum((counts + self.batch_size - 1) // self.batch_size))
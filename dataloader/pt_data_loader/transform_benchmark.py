@@ -0,0 +1,118 @@
+import time
+import random
+import numpy as np
+
+import dataloader.pt_data_loader.mytransforms as mytransforms
+
+NUM_SAMPLES = 500
+VIDEO_FRAMES = [-2, -1, 0, 1, 2]
+SCALES = [0, 1, 2, 3]
+
+
+def create_sample(height=16, width=32):
+    """ Creates a synthetic sample with the same key layout as a stereo video sample of the BaseDataset. The images are
+    tiny so that the measured time is dominated by the per-sample overhead of the transforms and not by the image
+    operations.
+
+    :param height: height of the images
+    :param width: width of the images
+    """
+    sample = {}
+    for frame in VIDEO_FRAMES:
+        for side in ('', '_right'):
+            sample[('color' + side, frame, -1)] = np.zeros((height, width, 3), dtype=np.uint8)
+            sample[('depth' + side, frame, -1)] = np.zeros((height, width), dtype=np.int32)
+            sample[('segmentation' + side, frame, -1)] = np.zeros((height, width), dtype=np.uint8)
+    sample[('camera_intrinsics', 0, -1)] = np.array([[width, 0, width / 2, 0],
+                                                     [0, width, height / 2, 0],
+                                                     [0, 0, 1, 0],
+                                                     [0, 0, 0, 1]])
+    sample[('timestamp', 0, -1)] = np.array(0.0)
+    sample['stereo_T'] = np.eye(4)
+    return sample
+
+
+def create_transforms():
+    """ Creates a transform chain similar to the one used for training, including the load transforms. ColorJitter is
+    left out since its image operations take far longer than everything else in the chain. """
+    return [mytransforms.LoadRGB(),
+            mytransforms.LoadSegmentation(),
+            mytransforms.LoadDepth(),
+            mytransforms.LoadNumerics(),
+            mytransforms.ConvertDepth('uint_16'),
+            mytransforms.CreateScaledImage(),
+            mytransforms.RandomHorizontalFlip(),
+            mytransforms.RandomCrop((8, 16)),
+            mytransforms.MultiResize(SCALES[1:], image_types=['color', 'camera_intrinsics', 'K']),
+            mytransforms.CreateColoraug(scales=SCALES),
+            mytransforms.RemoveOriginals(),
+            mytransforms.ToTensor(),
+            mytransforms.NormalizeZeroMean()]
+
+
+def time_transforms(transforms, num_samples, cached_plans):
+    """ Returns the mean time in microseconds that the transform chain needs per sample
+
+    :param transforms: list of transforms
+    :param num_samples: number of samples that are transformed
+    :param cached_plans: if False, the plans of all transforms are discarded before each sample, i.e. every sample pays
+        for the key selection like it did before the plans were introduced
+    """
+    samples = [create_sample() for _ in range(num_samples)]
+    random.seed(0)
+    np.random.seed(0)
+    total = 0.0
+    for sample in samples:
+        if not cached_plans:
+            for transform in transforms:
+                if isinstance(transform, mytransforms.PlannedTransform):
+                    transform.reset_plan()
+        start = time.perf_counter()
+        for transform in transforms:
+            sample = transform(sample)
+        total += time.perf_counter() - start
+    return total / num_samples * 1e6
+
+
+def time_selection(transforms, num_samples):
+    """ Returns the mean time in microseconds that the transform chain spends on selecting the keys per sample,
+    once without and once with the cached plans
+
+    :param transforms: list of transforms
+    :param num_samples: number of repetitions
+    """
+    key_sets = []
+    sample = create_sample()
+    for transform in transforms:
+        if isinstance(transform, mytransforms.PlannedTransform):
+            key_sets.append((transform, tuple(sample.keys())))
+        sample = transform(sample)
+
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        for transform, keys in key_sets:
+            transform._plan(keys)
+    uncached = (time.perf_counter() - start) / num_samples * 1e6
+
+    samples = [dict.fromkeys(keys) for _, keys in key_sets]
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        for (transform, _), keys_only in zip(key_sets, samples):
+            transform.get_plan(keys_only)
+    cached = (time.perf_counter() - start) / num_samples * 1e6
+    return uncached, cached
+
+
+if __name__ == '__main__':
+    transforms = create_transforms()
+    print("Sample with {} keys, {} transforms".format(len(create_sample()), len(transforms)))
+
+    # Warm up
+    time_transforms(transforms, 20, cached_plans=True)
+
+    uncached, cached = time_selection(transforms, NUM_SAMPLES)
+    print("Key selection per sample: {:8.1f} us without plans, {:8.1f} us with cached plans".format(uncached, cached))
+
+    uncached = time_transforms(transforms, NUM_SAMPLES, cached_plans=False)
+    cached = time_transforms(transforms, NUM_SAMPLES, cached_plans=True)
+    print("Transform chain per sample: {:8.1f} us without plans, {:8.1f} us with cached plans".format(uncached, cached))